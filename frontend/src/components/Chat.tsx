@@ -33,6 +33,7 @@ function ChatComponent() {
     onEvent('message', handleMessage);
     onEvent('approval', handleApproval);
     onEvent('error', handleError);
+    onEvent('budget_exceeded', handleError);
     onEvent('done', handleDone);
 
     return () => {
@@ -1,6 +1,37 @@
 import { useState, useCallback, useEffect } from 'react';
 import { Message, ApprovalRequest, ChatState } from '../types/chat';
 
+const MAX_ATTEMPTS = 3;
+
+// POST with retries on network errors. The same Idempotency-Key is sent on
+// every attempt so the server runs the request at most once.
+async function postWithRetry(url: string, body: unknown, token: string | null): Promise<Response> {
+  const idempotencyKey = crypto.randomUUID();
+  for (let attempt = 1; ; attempt++) {
+    try {
+      return await fetch(url, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Idempotency-Key': idempotencyKey,
+          ...(token && { 'Authorization': `Bearer ${token}` }),
+        },
+        body: JSON.stringify(body),
+      });
+    } catch (error) {
+      if (attempt >= MAX_ATTEMPTS) throw error;
+      await new Promise((resolve) => setTimeout(resolve, 500 * attempt));
+    }
+  }
+}
+
+// Rate limiting (429) and load shedding (503) reply with Retry-After
+function busyMessage(response: Response): string | null {
+  if (response.status !== 429 && response.status !== 503) return null;
+  const retryAfter = response.headers.get('Retry-After') || 'a few';
+  return `I'm receiving too many requests right now. Please try again in ${retryAfter} seconds.`;
+}
+
 export function useChat() {
   const [state, setState] = useState<ChatState>({
     messages: [],
@@ -44,17 +75,17 @@ export function useChat() {
     setTyping(true);
 
     try {
-      const response = await fetch('/api/chat', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          ...(token && { 'Authorization': `Bearer ${token}` }),
-        },
-        body: JSON.stringify({
-          message: content,
-          session_id: sessionId || undefined,
-        }),
-      });
+      const response = await postWithRetry('/api/chat', {
+        message: content,
+        session_id: sessionId || undefined,
+      }, token);
+
+      const busy = busyMessage(response);
+      if (busy) {
+        addMessage({ role: 'assistant', content: busy });
+        setTyping(false);
+        return;
+      }
 
       if (!response.ok) {
         throw new Error('Failed to send message');
@@ -85,21 +116,21 @@ export function useChat() {
 
     try {
       console.log('Sending approval request:', { sessionId, approved, userInput });
-      const response = await fetch('/api/approval', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          ...(token && { 'Authorization': `Bearer ${token}` }),
-        },
-        body: JSON.stringify({
-          id: sessionId,
-          approved,
-          userInput,
-        }),
-      });
+      const response = await postWithRetry('/api/approval', {
+        id: sessionId,
+        approved,
+        userInput,
+      }, token);
 
       console.log('Approval response status:', response.status, response.statusText);
 
+      // Keep the approval prompt open so the user can submit it again later
+      const busy = busyMessage(response);
+      if (busy) {
+        addMessage({ role: 'assistant', content: busy });
+        return;
+      }
+
       if (!response.ok) {
         const errorText = await response.text();
         console.error('Approval request failed:', response.status, errorText);
@@ -111,7 +142,7 @@ export function useChat() {
     } catch (error) {
       console.error('Error sending approval:', error);
     }
-  }, [sessionId, state.pendingApproval, setApprovalRequest, setTyping]);
+  }, [sessionId, state.pendingApproval, addMessage, setApprovalRequest, setTyping]);
 
   const handleMessage = useCallback((data: any) => {
     console.log('Handling message event:', data);
@@ -24,8 +24,10 @@ export function useSSE(endpoint: string, sessionId: string) {
       return;
     }
 
-    const url = endpoint + '?session_id=' + sessionId;
-    console.log('[SSE] Connecting to ' + url);
+    // EventSource cannot send an Authorization header, so the token goes in the query string
+    const token = localStorage.getItem('token');
+    const url = endpoint + '?session_id=' + sessionId + (token ? '&token=' + encodeURIComponent(token) : '');
+    console.log('[SSE] Connecting to ' + endpoint + '?session_id=' + sessionId);
 
     const eventSource = new EventSource(url);
 
@@ -18,6 +18,8 @@ export type SSEEvent =
   | { type: 'message'; data: Message }
   | { type: 'approval'; data: ApprovalRequest }
   | { type: 'error'; data: { message: string } }
+  | { type: 'queued'; data: { position: number; queued: number } }
+  | { type: 'budget_exceeded'; data: { reason: string; message: string; model_calls: number; prompt_tokens: number; completion_tokens: number; elapsed_seconds: number } }
   | { type: 'done' };
 
 export interface ChatState {
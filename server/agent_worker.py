@@ -0,0 +1,306 @@
+"""
+Agent worker pool - runs agent turns for the web tier (see services/agent_pool.py).
+
+Hosts the job broker and keeps a set of worker processes running; each worker
+runs up to AGENT_WORKER_CONCURRENCY turns at a time on its own event loop:
+    python agent_worker.py                                # AGENT_WORKER_PROCESSES workers
+    python agent_worker.py --processes 8 --listen 0.0.0.0:8700
+Start the API with AGENT_WORKERS_ENABLED=true and the same AGENT_BROKER_ADDRESS
+and AGENT_BROKER_AUTHKEY. Add agent worker processes (--processes) to scale
+model calls and tools; the API itself must stay a single process (no uvicorn
+--workers), because sessions, event queues and turn locks live in its memory.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from config import (
+    AGENT_BROKER_ADDRESS,
+    AGENT_BROKER_AUTHKEY,
+    AGENT_WORKER_PROCESSES,
+    AGENT_WORKER_CONCURRENCY,
+    AGENT_WORKER_METRICS_PORT,
+    AGENT_SHUTDOWN_DRAIN_SECONDS,
+    warm_up_client,
+)
+from database import SessionLocal, apply_write_ages, track_writes, write_ages
+from services.agent import handle_approval, process_agent_message
+from services.agent_pool import REPLY_BATCH, connect_broker, parse_address, serve_broker
+from services.history import History, Message
+from services.metrics import registry
+from services.session_manager import session_manager
+
+# How often running jobs are checked against the broker's cancelled job ids
+CANCEL_POLL_SECONDS = 0.5
+# Cancellations for jobs no worker is running are dropped after this long
+CANCEL_TTL_SECONDS = 300.0
+
+
+class AgentWorker:
+    """One worker process: pulls jobs from the broker and relays their results to the web tier"""
+
+    def __init__(self, address: str, concurrency: int):
+        self.address = address
+        self.concurrency = concurrency
+        self._outbox: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._running: Dict[str, asyncio.Task] = {}
+        # The job currently running for each session (the web tier runs one turn per session at a time)
+        self._jobs_by_session: Dict[str, dict] = {}
+        self._stopping: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _connect(self):
+        while True:
+            try:
+                return connect_broker(self.address, AGENT_BROKER_AUTHKEY)
+            except Exception as e:
+                print(f"Waiting for agent broker at {self.address}: {e}")
+                time.sleep(1)
+
+    def _stop(self):
+        self._stopping.set()
+        self._slots.release()  # wake the job loop if every slot is busy
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        # Warm up the LLM client like the API process does
+        loop.run_in_executor(None, warm_up_client)
+        self._stopping = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self._stop)
+
+        self._broker = await asyncio.to_thread(self._connect)
+        jobs = self._broker.jobs()
+        self._cancellations = self._broker.cancellations()
+        # Events and state changes go back to the web tier that sent the job
+        session_manager.relay = self._relay
+        sender = threading.Thread(target=self._send_replies, name="agent-worker-replies", daemon=True)
+        sender.start()
+        watcher = asyncio.create_task(self._watch_cancellations())
+        # The blocking job poll gets its own thread instead of one of the default executor's
+        poller = ThreadPoolExecutor(max_workers=1, thread_name_prefix="agent-worker-jobs")
+        print(f"DEBUG: Agent worker {os.getpid()} ready ({self.concurrency} concurrent turns)")
+
+        while not self._stopping.is_set():
+            await self._slots.acquire()
+            job = None
+            while job is None and not self._stopping.is_set():
+                try:
+                    job = await loop.run_in_executor(poller, jobs.get, True, 1.0)
+                except queue.Empty:
+                    pass
+            if job is None:
+                break
+            task = asyncio.create_task(self._run_job(job))
+            self._running[job["id"]] = task
+            task.add_done_callback(lambda _, job_id=job["id"]: self._job_done(job_id))
+
+        if self._running:
+            print(f"DEBUG: Agent worker {os.getpid()} draining {len(self._running)} turn(s)")
+            _, pending = await asyncio.wait(list(self._running.values()), timeout=AGENT_SHUTDOWN_DRAIN_SECONDS)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        watcher.cancel()
+        poller.shutdown(wait=False)
+        self._outbox.put(None)
+        await asyncio.to_thread(sender.join, 5.0)
+
+    def _job_done(self, job_id: str):
+        self._running.pop(job_id, None)
+        self._slots.release()
+
+    async def _run_job(self, job: dict):
+        session_id = job["session_id"]
+        snapshot = job["session"]
+        params = job["params"]
+        session = {
+            "history": History(
+                [Message.from_api(message) for message in snapshot["messages"]],
+                on_append=lambda index, message: self._reply(job, "message", message.to_api()),
+            ),
+            "pending_approval": snapshot["pending_approval"],
+            "current_response": "",
+            "llm_failures": snapshot["llm_failures"],
+        }
+        if snapshot["user_id"]:
+            session["user_id"] = snapshot["user_id"]
+            session["user_name"] = snapshot["user_name"]
+            session["user_email"] = snapshot["user_email"]
+        session_manager.sessions[session_id] = session
+        self._jobs_by_session[session_id] = job
+        # Earlier turns of this session may have written on another worker
+        apply_write_ages(snapshot.get("writes"))
+        writes = track_writes()
+
+        db = SessionLocal()
+        error = None
+        try:
+            if job["kind"] == "chat":
+                await process_agent_message(params["message"], session_id, db, job["user"])
+            else:
+                await handle_approval(session_id, params["approved"], params["user_input"], db, job["user"])
+        except asyncio.CancelledError:
+            # The web tier has already given up on this job
+            print(f"DEBUG: Agent job {job['id']} ({job['kind']}) cancelled for session {session_id}")
+            return
+        except Exception as e:
+            traceback.print_exc()
+            error = str(e) or repr(e)
+        finally:
+            db.close()
+            session_manager.cleanup_session(session_id)
+            self._jobs_by_session.pop(session_id, None)
+        self._reply(job, "finished", {
+            "llm_failures": session.get("llm_failures", 0),
+            "error": error,
+            "writes": write_ages(writes),
+        })
+
+    def _relay(self, session_id: str, kind: str, payload: dict):
+        job = self._jobs_by_session.get(session_id)
+        if job is None:
+            print(f"DEBUG: No running job for session {session_id}, dropping {kind}")
+            return
+        self._reply(job, kind, payload)
+
+    def _reply(self, job: dict, kind: str, payload: dict):
+        self._outbox.put((job["reply_to"], (job["id"], kind, payload)))
+
+    def _send_replies(self):
+        """Sender thread: forward replies to each web process's reply queue in batches, in order"""
+        reply_queues = {}
+        stopping = False
+        while not stopping:
+            items = [self._outbox.get()]
+            while len(items) < REPLY_BATCH:
+                try:
+                    items.append(self._outbox.get_nowait())
+                except queue.Empty:
+                    break
+            batches: Dict[str, list] = {}
+            for item in items:
+                if item is None:
+                    stopping = True
+                    continue
+                reply_to, reply = item
+                batches.setdefault(reply_to, []).append(reply)
+            for reply_to, batch in batches.items():
+                try:
+                    if reply_to not in reply_queues:
+                        reply_queues[reply_to] = self._broker.replies(reply_to)
+                    reply_queues[reply_to].put(batch)
+                except Exception as e:
+                    print(f"ERROR: Could not send {len(batch)} replies to {reply_to}: {e}")
+
+    async def _watch_cancellations(self):
+        while True:
+            await asyncio.sleep(CANCEL_POLL_SECONDS)
+            if not self._running:
+                continue
+            try:
+                cancelled = await asyncio.to_thread(self._cancellations.copy)
+                now = time.time()
+                for job_id, cancelled_at in cancelled.items():
+                    task = self._running.get(job_id)
+                    if task is not None:
+                        task.cancel()
+                    if task is not None or now - cancelled_at > CANCEL_TTL_SECONDS:
+                        await asyncio.to_thread(self._cancellations.pop, job_id, None)
+            except Exception as e:
+                print(f"ERROR: Could not check cancelled agent jobs: {e}")
+
+
+def serve_metrics(port: int, loop: asyncio.AbstractEventLoop):
+    """Serve this worker's metrics (model calls, tools, DB) in Prometheus text format"""
+    async def render() -> str:
+        return registry.render()
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            # Render on the event loop thread, which owns the metric values
+            body = asyncio.run_coroutine_threadsafe(render(), loop).result(timeout=5).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="agent-worker-metrics", daemon=True).start()
+
+
+def worker_main(address: str, concurrency: int, metrics_port: int):
+    async def main():
+        if metrics_port:
+            serve_metrics(metrics_port, asyncio.get_running_loop())
+        await AgentWorker(address, concurrency).run()
+
+    asyncio.run(main())
+
+
+def supervise(processes: int, concurrency: int, listen: str):
+    """Host the broker and keep the worker processes running until SIGTERM/SIGINT"""
+    try:
+        serve_broker(listen, AGENT_BROKER_AUTHKEY)
+    except RuntimeError as e:
+        raise SystemExit(f"ERROR: {e}")
+    host, port = parse_address(listen)
+    address = f"{'127.0.0.1' if host in ('', '0.0.0.0') else host}:{port}"
+    print(f"Agent broker listening on {listen}, starting {processes} worker process(es)")
+
+    stopping = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stopping.set())
+
+    context = multiprocessing.get_context("spawn")
+
+    def start(index: int):
+        metrics_port = AGENT_WORKER_METRICS_PORT + index if AGENT_WORKER_METRICS_PORT else 0
+        process = context.Process(
+            target=worker_main, args=(address, concurrency, metrics_port), name=f"agent-worker-{index}"
+        )
+        process.start()
+        return process
+
+    workers = [start(index) for index in range(processes)]
+    while not stopping.wait(1.0):
+        for index, process in enumerate(workers):
+            if not process.is_alive():
+                print(f"ERROR: Agent worker {index} exited with code {process.exitcode}, restarting")
+                workers[index] = start(index)
+
+    print("Stopping agent workers")
+    for process in workers:
+        process.terminate()
+    for process in workers:
+        process.join(AGENT_SHUTDOWN_DRAIN_SECONDS + 5)
+        if process.is_alive():
+            process.kill()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the agent worker pool and its job broker")
+    parser.add_argument(
+        "--processes", type=int, default=AGENT_WORKER_PROCESSES or os.cpu_count(), help="Worker processes"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=AGENT_WORKER_CONCURRENCY, help="Concurrent turns per worker process"
+    )
+    parser.add_argument("--listen", default=AGENT_BROKER_ADDRESS, help="host:port for the job broker")
+    args = parser.parse_args()
+
+    supervise(args.processes, args.concurrency, args.listen)
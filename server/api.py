@@ -3,31 +3,59 @@ FastAPI Backend with SSE for AI Agent - Frontend Integration
 ================================================================
 Main application entry point with CORS configuration and router setup.
 """
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from config import CORS_ORIGINS
-from routers import chat, events, auth
-from database import init_db
+from config import CORS_ORIGINS, warm_up_client
+from routers import chat, events, auth, metrics, orders, debug
+from services.admission import AdmissionMiddleware
+from services.agent_pool import agent_pool
+from services.loop_monitor import loop_monitor
+from services.metrics import MetricsMiddleware
+from services.scheduler import agent_scheduler
+from services.session_manager import session_manager
+from services.transcripts import transcript_writer
 
 # Create FastAPI app
 app = FastAPI()
 
 
 # ============================================================================
-# Startup Event - Initialize Database
+# Startup Event - Warm Up Clients
 # ============================================================================
+# Schema creation is an explicit step (python migrate.py), not part of boot.
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database tables on startup"""
-    init_db()
+    """Warm up the LLM client in the background and start the background monitors"""
+    asyncio.get_running_loop().run_in_executor(None, warm_up_client)
+    loop_monitor.start()
+    transcript_writer.start()
+    # Connect to the agent worker pool (only with AGENT_WORKERS_ENABLED)
+    agent_pool.start()
+    app.state.session_eviction = asyncio.create_task(session_manager.run_eviction())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Let in-flight agent jobs finish and flush their transcripts before the process exits"""
+    await agent_scheduler.drain()
+    await agent_pool.stop()
+    app.state.session_eviction.cancel()
+    # Write out buffered transcripts after the last turns have finished
+    await transcript_writer.stop()
+    await loop_monitor.stop()
 
 
 # ============================================================================
 # CORS Configuration
 # ============================================================================
 
+# Rate limits and load shedding (innermost, so rejections still get CORS headers)
+app.add_middleware(AdmissionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=CORS_ORIGINS,
@@ -36,6 +64,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request rate and latency per route (exported at /metrics)
+app.add_middleware(MetricsMiddleware)
+
 # ============================================================================
 # Include Routers
 # ============================================================================
@@ -43,6 +74,9 @@ app.add_middleware(
 app.include_router(auth.router)
 app.include_router(chat.router)
 app.include_router(events.router)
+app.include_router(orders.router)
+app.include_router(metrics.router)
+app.include_router(debug.router)
 
 # ============================================================================
 # Main Entry Point
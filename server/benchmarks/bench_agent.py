@@ -0,0 +1,467 @@
+"""
+Offline agent replay benchmark.
+
+Starts the scripted mock LLM server, seeds a synthetic SQLite (or Postgres)
+dataset, boots the API with uvicorn pointed at both, and drives
+/api/chat + /api/events + /api/approval with N concurrent virtual users.
+Reports turns/sec, time-to-first-event percentiles, DB/LLM call counts and
+order prefetch hit/waste ratios.
+
+Usage (from the server directory):
+    python benchmarks/bench_agent.py --users 20 --turns 5 --llm-latency 0.3
+    python benchmarks/bench_agent.py --database-url postgresql://user:pw@localhost/bench
+    python benchmarks/bench_agent.py --agent-workers 4   # turns run in agent_worker.py processes
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import queue
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from benchmarks.mock_llm_server import MockLLMServer, MockLLMConfig, DEFAULT_SCRIPT
+
+BENCH_PASSWORD = "bench-password"
+RESPONSE_EVENTS = ("message", "approval", "error")
+
+
+# ============================================================================
+# HTTP helpers
+# ============================================================================
+
+def http_json(method: str, url: str, payload: Optional[dict] = None, token: Optional[str] = None, timeout: float = 60):
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    data = json.dumps(payload).encode() if payload is not None else None
+    request = urllib.request.Request(url, data=data, headers=headers, method=method)
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read() or b"null")
+
+
+def scrape_counters(base_url: str) -> Dict[str, float]:
+    """Sum Prometheus samples per metric name from /metrics (labelled samples are kept too)"""
+    with urllib.request.urlopen(f"{base_url}/metrics", timeout=10) as response:
+        text = response.read().decode()
+    totals: Dict[str, float] = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name_part, _, value = line.rpartition(" ")
+        name = re.split(r"[{ ]", name_part, maxsplit=1)[0]
+        totals[name] = totals.get(name, 0) + float(value)
+        if name_part != name:
+            totals[name_part] = float(value)
+    return totals
+
+
+def scrape_all(urls: List[str]) -> Dict[str, float]:
+    """scrape_counters summed over several processes (web tier and agent workers)"""
+    totals: Dict[str, float] = {}
+    for url in urls:
+        for name, value in scrape_counters(url).items():
+            totals[name] = totals.get(name, 0) + value
+    return totals
+
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Agent workers exited during startup")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+class SSEReader(threading.Thread):
+    """Read an SSE stream on a background thread and timestamp each event"""
+
+    def __init__(self, url: str):
+        super().__init__(daemon=True)
+        self.url = url
+        self.events: "queue.Queue[tuple]" = queue.Queue()
+        self._connection: Optional[http.client.HTTPConnection] = None
+        self._closed = threading.Event()
+
+    def run(self):
+        try:
+            parts = urllib.parse.urlsplit(self.url)
+            self._connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=120)
+            self._connection.request("GET", f"{parts.path}?{parts.query}")
+            if self._closed.is_set():
+                return
+            for raw in self._connection.getresponse():
+                line = raw.decode().strip()
+                if line.startswith("data: "):
+                    self.events.put((time.perf_counter(), json.loads(line[6:])))
+        except Exception as e:
+            if not self._closed.is_set():
+                self.events.put((time.perf_counter(), {"type": "stream_error", "data": {"message": str(e)}}))
+
+    def wait_for(self, types, timeout: float) -> List[tuple]:
+        """Collect events until one of the given types arrives"""
+        received = []
+        deadline = time.perf_counter() + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                received.append((time.perf_counter(), {"type": "timeout"}))
+                return received
+            try:
+                item = self.events.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            received.append(item)
+            if item[1].get("type") in types or item[1].get("type") == "stream_error":
+                return received
+
+    def close(self):
+        """Stop reading now (shutting the socket down unblocks the reader thread)"""
+        self._closed.set()
+        sock = self._connection.sock if self._connection else None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.join(timeout=5)
+
+
+# ============================================================================
+# Dataset
+# ============================================================================
+
+def seed_dataset(users: int, orders_per_user: int, seed: int) -> List[dict]:
+    """Create synthetic users and orders; returns [{email, order_ids}]"""
+    from sqlalchemy import insert
+    from database import SessionLocal, User, Order, OrderEvent, Conversation, ChatMessage, init_db
+    from services.auth import get_shared_password_hash
+
+    init_db()
+    rng = random.Random(seed)
+    password_hash = get_shared_password_hash(BENCH_PASSWORD)
+    db = SessionLocal()
+    try:
+        db.query(ChatMessage).delete()
+        db.query(Conversation).delete()
+        db.query(OrderEvent).delete()
+        db.query(Order).delete()
+        db.query(User).delete()
+        db.commit()
+
+        user_rows = [
+            {"name": f"Bench User {i}", "email": f"bench{i}@example.com", "password_hash": password_hash}
+            for i in range(users)
+        ]
+        db.execute(insert(User), user_rows)
+        db.commit()
+        ids = dict(db.query(User.email, User.id).all())
+
+        dataset, order_rows = [], []
+        base = datetime(2024, 1, 1)
+        for i, row in enumerate(user_rows):
+            order_ids = []
+            for j in range(orders_per_user):
+                order_id = f"ORD-B{i:05d}{j:02d}"
+                order_ids.append(order_id)
+                order_rows.append({
+                    "order_id": order_id,
+                    "user_id": ids[row["email"]],
+                    "customer_name": row["name"],
+                    "status": rng.choice(["processing", "processing", "shipped", "delivered"]),
+                    "items": [rng.choice(["Laptop", "Mouse", "Monitor", "Headphones", "Webcam"])],
+                    "total": round(rng.uniform(10, 1500), 2),
+                    "date": base + timedelta(days=rng.randrange(365)),
+                    "verification_codes": [],
+                })
+            dataset.append({"email": row["email"], "order_ids": order_ids})
+        db.execute(insert(Order), order_rows)
+        db.commit()
+        return dataset
+    finally:
+        db.close()
+
+
+def latest_verification_code(order_id: str) -> Optional[str]:
+    """Read the code the agent generated (stands in for the user's email inbox)"""
+    from database import SessionLocal, Order
+
+    db = SessionLocal()
+    try:
+        order = db.query(Order).filter(Order.order_id == order_id).first()
+        codes = order.verification_codes if order else None
+        return codes[-1] if codes else None
+    finally:
+        db.close()
+
+
+# ============================================================================
+# Virtual users
+# ============================================================================
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.first_event: List[float] = []
+        self.first_response: List[float] = []
+        self.approval: List[float] = []
+        # When each virtual user's last turn finished (before its stream is closed)
+        self.finished: List[float] = []
+        self.turns = 0
+        self.errors: Dict[str, int] = {}
+
+    def add(self, field: str, value: float):
+        with self.lock:
+            getattr(self, field).append(value)
+
+    def error(self, kind: str):
+        with self.lock:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+def virtual_user(base_url: str, user: dict, turns: int, cancel_ratio: float, timeout: float, seed: int, results: Results):
+    rng = random.Random(seed)
+    reader: Optional[SSEReader] = None
+    try:
+        token = http_json("POST", f"{base_url}/api/auth/login", {"email": user["email"], "password": BENCH_PASSWORD})["access_token"]
+        session_id = None
+
+        for _ in range(turns):
+            order_id = rng.choice(user["order_ids"])
+            cancelling = rng.random() < cancel_ratio
+            message = f"Please cancel order {order_id}" if cancelling else f"What's the status of {order_id}?"
+
+            started = time.perf_counter()
+            response = http_json("POST", f"{base_url}/api/chat", {"message": message, "session_id": session_id}, token)
+            if reader is None:
+                session_id = response["session_id"]
+                reader = SSEReader(f"{base_url}/api/events?session_id={session_id}&token={token}")
+                reader.start()
+
+            events = reader.wait_for(RESPONSE_EVENTS, timeout)
+            results.add("first_event", events[0][0] - started)
+            last_at, last = events[-1]
+            if last["type"] not in RESPONSE_EVENTS:
+                results.error(last["type"])
+                continue
+            results.add("first_response", last_at - started)
+
+            if last["type"] == "approval":
+                code = latest_verification_code(order_id)
+                approval_started = time.perf_counter()
+                http_json("POST", f"{base_url}/api/approval", {"id": session_id, "approved": True, "userInput": code}, token)
+                approval_events = reader.wait_for(("message", "error"), timeout)
+                results.add("approval", approval_events[-1][0] - approval_started)
+
+            # Wait for the turn to finish before sending the next message
+            if last["type"] == "message" or last["type"] == "approval":
+                reader.wait_for(("done", "error"), timeout)
+            with results.lock:
+                results.turns += 1
+        results.add("finished", time.perf_counter())
+    except Exception as e:
+        results.error(type(e).__name__)
+    finally:
+        if reader:
+            reader.close()
+
+
+# ============================================================================
+# Orchestration
+# ============================================================================
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(pct / 100 * len(ordered))  # nearest-rank percentile
+    return ordered[max(0, rank - 1)]
+
+
+def wait_for_health(base_url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("API server exited during startup")
+        try:
+            http_json("GET", f"{base_url}/health", timeout=2)
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError("API server did not become healthy")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline agent replay benchmark")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per virtual user")
+    parser.add_argument("--orders-per-user", type=int, default=4)
+    parser.add_argument("--cancel-ratio", type=float, default=0.2, help="Fraction of turns that cancel an order")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Mock LLM latency in seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--script", default=None, help="JSON transcript rules for the mock LLM")
+    parser.add_argument("--database-url", default=None, help="Defaults to a temporary SQLite file")
+    parser.add_argument(
+        "--background-users", type=int, default=0,
+        help="Extra synthetic users (with orders) loaded via datagen.py for production-sized tables",
+    )
+    parser.add_argument(
+        "--datagen-workers", type=int, default=1,
+        help="Parallel datagen loader processes (PostgreSQL only; SQLite loads with one)",
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--agent-workers", type=int, default=0,
+        help="Run turns in this many agent_worker.py processes (0 = in the API process)",
+    )
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-turn event timeout in seconds")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", dest="json_path", default=None, help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="agent-bench-")
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    script = DEFAULT_SCRIPT
+    if args.script:
+        with open(args.script) as f:
+            script = json.load(f)
+
+    mock = MockLLMServer(config=MockLLMConfig(
+        latency=args.llm_latency, jitter=args.llm_jitter, error_rate=args.llm_error_rate, script=script, seed=args.seed,
+    )).start()
+
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": database_url,
+        "OPENROUTER_BASE_URL": mock.base_url,
+        "OPENROUTER_API_KEY": "mock-key",
+        "PYTHONUNBUFFERED": "1",
+        # Cheap hashing so logins measure the agent path, not bcrypt
+        "PASSWORD_HASH_PROFILE": os.environ.get("PASSWORD_HASH_PROFILE", "test"),
+        # Every virtual user shares 127.0.0.1, which would trip the per-IP limits
+        "RATE_LIMIT_ENABLED": os.environ.get("RATE_LIMIT_ENABLED", "false"),
+    })
+    broker_port, metrics_port = args.port + 1, args.port + 2
+    if args.agent_workers:
+        env.update({
+            "AGENT_WORKERS_ENABLED": "true",
+            "AGENT_BROKER_ADDRESS": f"127.0.0.1:{broker_port}",
+            "AGENT_WORKER_METRICS_PORT": str(metrics_port),
+        })
+    os.environ.update(env)
+
+    print(f"Seeding {args.users} users x {args.orders_per_user} orders into {database_url}")
+    dataset = seed_dataset(args.users, args.orders_per_user, args.seed)
+    if args.background_users:
+        import datagen
+
+        print(f"Loading {args.background_users} background users with datagen")
+        datagen.generate(args.background_users, workers=args.datagen_workers, seed=args.seed)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    log_path = os.path.join(workdir, "server.log")
+    metrics_urls = [base_url] + [f"http://127.0.0.1:{metrics_port + i}" for i in range(args.agent_workers)]
+    workers = None
+    with open(log_path, "w") as log:
+        if args.agent_workers:
+            workers = subprocess.Popen(
+                [sys.executable, "agent_worker.py", "--processes", str(args.agent_workers)],
+                cwd=SERVER_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+            )
+            for port in [broker_port] + [metrics_port + i for i in range(args.agent_workers)]:
+                wait_for_port(port, workers)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"],
+            cwd=SERVER_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+    try:
+        wait_for_health(base_url, server)
+        before = scrape_all(metrics_urls)
+        mock.stats.reset()
+
+        results = Results()
+        threads = [
+            threading.Thread(
+                target=virtual_user,
+                args=(base_url, user, args.turns, args.cancel_ratio, args.timeout, args.seed + i, results),
+            )
+            for i, user in enumerate(dataset)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Teardown (closing streams, joining threads) is not part of the run
+        elapsed = (max(results.finished) if results.finished else time.perf_counter()) - started
+
+        after = scrape_all(metrics_urls)
+        llm_stats = mock.stats.snapshot()
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        if workers:
+            workers.terminate()
+            workers.wait(timeout=60)
+        mock.stop()
+
+    prefetch = {}
+    for outcome in ("hit", "miss", "waste"):
+        key = f'order_prefetch_total{{outcome="{outcome}"}}'
+        prefetch[outcome] = int(after.get(key, 0) - before.get(key, 0))
+    prefetched = prefetch["hit"] + prefetch["waste"]
+    prefetch["hit_ratio"] = round(prefetch["hit"] / (prefetch["hit"] + prefetch["miss"]), 3) if prefetch["hit"] + prefetch["miss"] else 0.0
+    prefetch["waste_ratio"] = round(prefetch["waste"] / prefetched, 3) if prefetched else 0.0
+
+    summary = {
+        "virtual_users": args.users,
+        "agent_workers": args.agent_workers,
+        "turns": results.turns,
+        "elapsed_seconds": round(elapsed, 3),
+        "turns_per_second": round(results.turns / elapsed, 3) if elapsed else 0.0,
+        "time_to_first_event_ms": {
+            f"p{p}": round(percentile(results.first_event, p) * 1000, 1) for p in (50, 95, 99)
+        },
+        "time_to_response_ms": {
+            f"p{p}": round(percentile(results.first_response, p) * 1000, 1) for p in (50, 95, 99)
+        },
+        "approval_latency_ms": {
+            f"p{p}": round(percentile(results.approval, p) * 1000, 1) for p in (50, 95, 99)
+        },
+        "db_queries": int(after.get("db_queries_total", 0) - before.get("db_queries_total", 0)),
+        "order_prefetch": prefetch,
+        "llm_calls": llm_stats.get("requests", 0),
+        "llm_calls_per_turn": round(llm_stats.get("requests", 0) / results.turns, 2) if results.turns else 0.0,
+        "errors": results.errors,
+        "server_log": log_path,
+    }
+
+    print(json.dumps(summary, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
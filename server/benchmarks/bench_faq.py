@@ -0,0 +1,89 @@
+"""
+FAQ answer benchmark.
+
+Runs a labelled set of support messages through services/faq.py and reports
+how many would be answered locally (model calls saved), wrong local answers,
+and lookup latency with a cold and a warm cache. No server or model needed.
+
+Usage (from the server directory):
+    python benchmarks/bench_faq.py --repeat 2000
+    FAQ_POLICY_FILE=policies.md python benchmarks/bench_faq.py
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from benchmarks.bench_agent import percentile
+from services.faq import _cached_match, faq_index
+
+# (message, expected topic or None when the model should answer)
+SAMPLES = [
+    ("How long does shipping take?", "Shipping"),
+    ("how fast is delivery", "Shipping"),
+    ("When will my package arrive if I use standard shipping?", "Shipping"),
+    ("What's your refund window?", "Refunds"),
+    ("What is the refund policy?", "Refunds"),
+    ("How many days do I have to get a refund?", "Refunds"),
+    ("What are your support hours?", "Support hours"),
+    ("when is support available", "Support hours"),
+    ("Is support open on weekends?", "Support hours"),
+    ("What's the status of ORD-001?", None),
+    ("Cancel ORD-002 please", None),
+    ("I want a refund", None),
+    ("Can I get a refund for my laptop?", None),
+    ("Where is my order?", None),
+    ("Do you ship internationally?", None),
+    ("hi there", None),
+    ("Why was my card charged twice?", None),
+    ("Cancel orders ORD-003 and ORD-004", None),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAQ answer benchmark")
+    parser.add_argument("--repeat", type=int, default=1000, help="Warm-cache lookups per message")
+    args = parser.parse_args()
+
+    _cached_match.cache_clear()
+    cold, warm = [], []
+    answered = wrong = missed = 0
+    for message, expected in SAMPLES:
+        start = time.perf_counter()
+        outcome, snippet = _cached_match(message)
+        cold.append(time.perf_counter() - start)
+        topic = snippet.topic if snippet else None
+        answered += snippet is not None
+        wrong += snippet is not None and topic != expected
+        missed += expected is not None and topic is None
+        if topic != expected:
+            print(f"{message!r}: expected {expected}, got {topic} ({outcome})")
+
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            _cached_match(message)
+            warm.append(time.perf_counter() - start)
+
+    faq_questions = sum(1 for _, expected in SAMPLES if expected)
+    summary = {
+        "snippets": [snippet.topic for snippet in faq_index.snippets],
+        "messages": len(SAMPLES),
+        "faq_questions": faq_questions,
+        # Each local answer replaces at least one model call
+        "answered_locally": answered,
+        "model_calls_saved_ratio": round(answered / len(SAMPLES), 3),
+        "wrong_answers": wrong,
+        "faq_questions_sent_to_model": missed,
+        "cold_lookup_us": {f"p{p}": round(percentile(cold, p) * 1e6, 1) for p in (50, 99)},
+        "cached_lookup_us": {f"p{p}": round(percentile(warm, p) * 1e6, 2) for p in (50, 99)},
+    }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
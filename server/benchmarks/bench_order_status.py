@@ -0,0 +1,149 @@
+"""
+Batch order-status API benchmark.
+
+Seeds a synthetic SQLite (or Postgres) dataset, boots the API with uvicorn and
+hammers POST /api/orders/status:batch from concurrent clients. Reports
+orders/sec, request latency percentiles and SQL statements per request.
+
+Usage (from the server directory):
+    python benchmarks/bench_order_status.py --users 50 --orders-per-user 200 --batch-size 100
+    python benchmarks/bench_order_status.py --database-url postgresql://user:pw@localhost/bench
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from typing import List
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from benchmarks.bench_agent import BENCH_PASSWORD, http_json, percentile, scrape_counters, seed_dataset, wait_for_health
+
+
+def post_batch(base_url: str, token: str, order_ids: List[str]) -> List[dict]:
+    """POST one batch and parse the NDJSON response"""
+    request = urllib.request.Request(
+        f"{base_url}/api/orders/status:batch",
+        data=json.dumps({"order_ids": order_ids}).encode(),
+        headers={"Content-Type": "application/json", "Authorization": f"Bearer {token}"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return [json.loads(line) for line in response.read().splitlines() if line]
+
+
+def client(base_url: str, user: dict, requests: int, batch_size: int, seed: int, latencies: List[float], counts: dict, lock: threading.Lock):
+    rng = random.Random(seed)
+    token = http_json("POST", f"{base_url}/api/auth/login", {"email": user["email"], "password": BENCH_PASSWORD})["access_token"]
+    for _ in range(requests):
+        order_ids = rng.sample(user["order_ids"], min(batch_size, len(user["order_ids"])))
+        started = time.perf_counter()
+        try:
+            results = post_batch(base_url, token, order_ids)
+        except Exception as e:
+            with lock:
+                counts["errors"] += 1
+            print(f"Request failed: {e}")
+            continue
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            counts["orders"] += sum(1 for result in results if result["success"])
+            counts["not_found"] += sum(1 for result in results if not result["success"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch order-status API benchmark")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent clients (one user each)")
+    parser.add_argument("--orders-per-user", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=100, help="Order IDs per request")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per client")
+    parser.add_argument("--database-url", default=None, help="Defaults to a temporary SQLite file")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", dest="json_path", default=None, help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="order-status-bench-")
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": database_url,
+        "OPENROUTER_API_KEY": "unused",
+        "PYTHONUNBUFFERED": "1",
+        "PASSWORD_HASH_PROFILE": os.environ.get("PASSWORD_HASH_PROFILE", "test"),
+        # Every virtual user shares 127.0.0.1, which would trip the per-IP limits
+        "RATE_LIMIT_ENABLED": os.environ.get("RATE_LIMIT_ENABLED", "false"),
+    })
+    os.environ.update(env)
+
+    print(f"Seeding {args.users} users x {args.orders_per_user} orders into {database_url}")
+    dataset = seed_dataset(args.users, args.orders_per_user, args.seed)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    log_path = os.path.join(workdir, "server.log")
+    with open(log_path, "w") as log:
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"],
+            cwd=SERVER_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+    try:
+        wait_for_health(base_url, server)
+        before = scrape_counters(base_url)
+
+        latencies: List[float] = []
+        counts = {"orders": 0, "not_found": 0, "errors": 0}
+        lock = threading.Lock()
+        threads = [
+            threading.Thread(
+                target=client,
+                args=(base_url, user, args.requests, args.batch_size, args.seed + i, latencies, counts, lock),
+            )
+            for i, user in enumerate(dataset)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        after = scrape_counters(base_url)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    requests = len(latencies)
+    db_queries = after.get("db_queries_total", 0) - before.get("db_queries_total", 0)
+    summary = {
+        "clients": args.users,
+        "batch_size": args.batch_size,
+        "requests": requests,
+        "orders": counts["orders"],
+        "not_found": counts["not_found"],
+        "errors": counts["errors"],
+        "elapsed_seconds": round(elapsed, 3),
+        "orders_per_second": round(counts["orders"] / elapsed, 1) if elapsed else 0.0,
+        "requests_per_second": round(requests / elapsed, 1) if elapsed else 0.0,
+        "request_latency_ms": {f"p{p}": round(percentile(latencies, p) * 1000, 1) for p in (50, 95, 99)},
+        # Includes the login and auth lookups, so expect a little over 1
+        "db_queries_per_request": round(db_queries / requests, 2) if requests else 0.0,
+        "server_log": log_path,
+    }
+
+    print(json.dumps(summary, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+JSON serialization benchmark.
+
+Encodes and decodes the payloads the server produces on its hot paths (SSE
+events, tool results, NDJSON batch lines, tool-call arguments, a model
+request's message history) with every installed backend from
+services/serialization.py and reports ns/op and the speedup over the json
+module. No server or model needed.
+
+Usage (from the server directory):
+    python benchmarks/bench_serialization.py --repeat 20000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from benchmarks.bench_agent import percentile
+from config import tools
+from services import serialization
+from services.serialization import _build_codec, _select_backend
+
+ORDER_STATUS = {
+    "success": True,
+    "order_id": "ORD-001",
+    "status": "shipped",
+    "total": 129.99,
+    "items": [{"name": "Wireless Headphones", "quantity": 1, "price": 129.99}],
+    "created_at": datetime(2026, 5, 1, 9, 30),
+    "tracking_number": "1Z999AA10123456784",
+}
+
+HISTORY = [{"role": "system", "content": "You are a helpful customer support agent. " * 40}]
+for turn in range(8):
+    HISTORY += [
+        {"role": "user", "content": f"What's the status of ORD-00{turn}? Also, can I get a refund if it's late?"},
+        {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "id": f"call_{turn}",
+                "type": "function",
+                "function": {"name": "get_order_status", "arguments": json.dumps({"order_id": f"ORD-00{turn}"})},
+            }],
+        },
+        {"role": "tool", "tool_call_id": f"call_{turn}", "content": json.dumps(ORDER_STATUS, default=str)},
+    ]
+HISTORY.append({"role": "user", "content": "Thanks, please cancel the last one."})
+
+# (name, operation, payload); operation is "encode", "sse" or "decode"
+CASES = [
+    ("sse_message", "sse", {"type": "message", "content": "Your order ORD-001 shipped on May 1 and should arrive soon."}),
+    ("sse_approval", "sse", {
+        "type": "approval_required",
+        "tool_call_id": "call_abc123",
+        "order_id": "ORD-002",
+        "order_total": 59.5,
+        "message": "Please confirm cancelling order ORD-002.",
+    }),
+    ("tool_result", "encode", ORDER_STATUS),
+    ("ndjson_line", "encode", {"order_id": "ORD-001", "success": True, "status": "shipped", "total": 129.99}),
+    ("history_24_messages", "encode", HISTORY),
+    ("tool_arguments", "decode", json.dumps({"order_id": "ORD-001", "verification_code": "482913"})),
+]
+
+
+def time_case(operation, payload, encode, decode, repeat):
+    if operation == "sse":
+        run = lambda: b"data: " + encode(payload) + b"\n\n"
+    elif operation == "encode":
+        run = lambda: encode(payload)
+    else:
+        run = lambda: decode(payload)
+    for _ in range(min(repeat, 1000)):
+        run()
+    samples = []
+    # Batches of 10 keep perf_counter overhead out of the per-op numbers
+    for _ in range(max(repeat // 10, 1)):
+        start = time.perf_counter_ns()
+        for _ in range(10):
+            run()
+        samples.append((time.perf_counter_ns() - start) / 10)
+    return samples
+
+
+def time_tool_decoder(backend, typed, repeat):
+    """ToolArgumentDecoder.decode with typed (msgspec struct) or schema-checked decoding"""
+    original = (serialization.TYPED_TOOL_ARGUMENTS, serialization._decode)
+    serialization.TYPED_TOOL_ARGUMENTS = typed
+    serialization._decode = _build_codec(backend)[2]
+    try:
+        decoder = serialization.ToolArgumentDecoder(tools)
+        raw = CASES[-1][2]
+        return time_case("decode", raw, None, lambda data: decoder.decode("cancel_order_with_verification", data), repeat)
+    finally:
+        serialization.TYPED_TOOL_ARGUMENTS, serialization._decode = original
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON serialization benchmark")
+    parser.add_argument("--repeat", type=int, default=10000, help="Operations per payload and backend")
+    args = parser.parse_args()
+
+    backends = [name for name in ("stdlib", "orjson", "msgspec") if _select_backend(name) == name]
+    results = {}
+    for name, operation, payload in CASES:
+        baseline = None
+        results[name] = {}
+        for backend in backends:
+            encode, _, decode = _build_codec(backend)
+            p50 = percentile(time_case(operation, payload, encode, decode, args.repeat), 50)
+            baseline = baseline or p50
+            results[name][backend] = {"ns_per_op": round(p50), "speedup": round(baseline / p50, 2)}
+
+    decoders = [("stdlib", False)] + [(backend, False) for backend in backends if backend != "stdlib"]
+    if "msgspec" in backends:
+        decoders.append(("msgspec", True))
+    results["tool_argument_decoder"] = {}
+    baseline = None
+    for backend, typed in decoders:
+        p50 = percentile(time_tool_decoder(backend, typed, args.repeat), 50)
+        baseline = baseline or p50
+        label = f"{backend}_typed" if typed else backend
+        results["tool_argument_decoder"][label] = {"ns_per_op": round(p50), "speedup": round(baseline / p50, 2)}
+
+    summary = {
+        "active_backend": serialization.BACKEND,
+        "typed_tool_arguments": serialization.TYPED_TOOL_ARGUMENTS,
+        "history_bytes": len(_build_codec("stdlib")[0](HISTORY)),
+        "results": results,
+    }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Session history memory benchmark.
+
+Builds N synthetic live sessions with typical order-support conversations and
+measures bytes per session (tracemalloc) for the old list-of-dicts history
+layout and for services/history.History. No server or database needed.
+
+Usage (from the server directory):
+    python benchmarks/bench_session_memory.py --sessions 5000 --turns 6
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from services.history import History, Message, ToolCall
+
+
+def conversation(session: int, turns: int, rng: random.Random):
+    """Yield (kind, payload) steps of one synthetic conversation"""
+    for turn in range(turns):
+        order_id = f"ORD-{session:05d}{turn:02d}"
+        yield "user", f"What's the status of {order_id}?"
+        call_id = f"call_{session}_{turn}_{rng.randrange(10**8)}"
+        yield "tool_call", (call_id, "get_order_status", json.dumps({"order_id": order_id}))
+        result = {
+            "success": True,
+            "order": {
+                "order_id": order_id,
+                "customer": "Bench User",
+                "status": rng.choice(["processing", "shipped", "delivered"]),
+                "items": ["Laptop"],
+                "total": round(rng.uniform(10, 1500), 2),
+                "date": "2024-03-01",
+                "user_email": f"bench{session}@example.com",
+                "user_name": "Bench User",
+            },
+        }
+        yield "tool_result", (call_id, json.dumps(result))
+        yield "assistant", f"Order {order_id} is currently {result['order']['status']}. Anything else I can help with?"
+
+
+def build_dict_history(steps) -> list:
+    """The previous layout: OpenAI-format dicts with nested tool call dicts"""
+    history = []
+    for kind, payload in steps:
+        if kind == "user":
+            history.append({"role": "user", "content": payload})
+        elif kind == "tool_call":
+            call_id, name, arguments = payload
+            history.append({
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{"id": call_id, "type": "function", "function": {"name": name, "arguments": arguments}}],
+            })
+        elif kind == "tool_result":
+            call_id, content = payload
+            history.append({"role": "tool", "tool_call_id": call_id, "content": content})
+        else:
+            history.append({"role": "assistant", "content": payload})
+    return history
+
+
+def build_compact_history(steps) -> History:
+    history = History()
+    for kind, payload in steps:
+        if kind == "user":
+            history.append(Message.user(payload))
+        elif kind == "tool_call":
+            call_id, name, arguments = payload
+            history.append(Message.assistant(None, [ToolCall(call_id, name, arguments)]))
+        elif kind == "tool_result":
+            call_id, content = payload
+            history.append(Message.tool(call_id, content))
+        else:
+            history.append(Message.assistant(payload))
+    return history
+
+
+def measure(builder, sessions: int, turns: int, seed: int) -> int:
+    """Bytes allocated (and still live) for all sessions built with builder"""
+    rng = random.Random(seed)
+    # Generate the message strings first so both layouts are charged only for their structure
+    all_steps = [list(conversation(i, turns, rng)) for i in range(sessions)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    live = [builder(steps) for steps in all_steps]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del live
+    return after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Session history memory benchmark")
+    parser.add_argument("--sessions", type=int, default=5000, help="Live sessions to build")
+    parser.add_argument("--turns", type=int, default=6, help="Turns (4 messages each) per session")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    dict_bytes = measure(build_dict_history, args.sessions, args.turns, args.seed)
+    compact_bytes = measure(build_compact_history, args.sessions, args.turns, args.seed)
+
+    summary = {
+        "sessions": args.sessions,
+        "messages_per_session": args.turns * 4,
+        # Structure overhead only; message strings are shared and not counted
+        "dict_history_bytes_per_session": round(dict_bytes / args.sessions),
+        "compact_history_bytes_per_session": round(compact_bytes / args.sessions),
+        "reduction": f"{(1 - compact_bytes / dict_bytes) * 100:.1f}%" if dict_bytes else "n/a",
+    }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Cold-start benchmark for the API entry point.
+
+Imports `api` in fresh interpreters and reports the wall time to a ready
+app object, plus the slowest modules from `python -X importtime`.
+
+Usage (from the server directory):
+    python benchmarks/bench_startup.py --runs 5 --top 15
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import List, Tuple
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TIMED_IMPORT = "import time; t = time.perf_counter(); import api; print(time.perf_counter() - t)"
+
+
+def time_import(module: str) -> float:
+    """Seconds to import the module in a fresh interpreter"""
+    code = TIMED_IMPORT.replace("import api", f"import {module}")
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=SERVER_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def import_profile(module: str) -> List[Tuple[int, int, str]]:
+    """Parse `-X importtime` output into (self_us, cumulative_us, module) rows"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SERVER_DIR, capture_output=True, text=True, check=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        rows.append((int(self_us), int(cumulative_us), name))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API cold-start import time")
+    parser.add_argument("--module", default="api", help="Module to import")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list")
+    args = parser.parse_args()
+
+    timings = [time_import(args.module) for _ in range(args.runs)]
+    print(f"import {args.module}: median {statistics.median(timings) * 1000:.1f} ms, "
+          f"min {min(timings) * 1000:.1f} ms, max {max(timings) * 1000:.1f} ms over {args.runs} runs")
+
+    rows = import_profile(args.module)
+    print(f"\nSlowest {args.top} imports by cumulative time (-X importtime):")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for self_us, cumulative_us, name in sorted(rows, key=lambda row: row[1], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+    # Modules that should stay out of the cold-start path
+    deferred = ("openai", "smtplib", "email.mime", "langchain")
+    loaded = sorted({
+        name for _, _, name in rows
+        if any(name == prefix or name.startswith(prefix + ".") for prefix in deferred)
+    })
+    print("\nDeferred modules imported at startup: " + (", ".join(loaded[:10]) if loaded else "none"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Exercise services/llm.py against the local mock LLM server.
+
+Runs a set of fault scenarios (transient errors, hard outage, slow primary
+with hedging, deadline expiry) and prints how the call layer behaved.
+
+Usage (from the server directory):
+    python benchmarks/llm_resilience_check.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_llm_server import MockLLMServer, MockLLMConfig
+
+PRIMARY = "mock/primary"
+FALLBACK = "mock/fallback"
+
+
+async def run_scenario(llm, server: MockLLMServer, name: str, calls: int = 5, deadline_seconds: float = 10.0, **faults):
+    server.config.update({
+        "latency": 0.0, "error_rate": 0.0, "hang_rate": 0.0, "empty_rate": 0.0, "model_latency": {},
+        **faults,
+    })
+    server.stats.reset()
+    llm.circuit_breaker.record_success()
+
+    outcomes = {}
+    started = time.perf_counter()
+    for _ in range(calls):
+        try:
+            response = await llm.create_completion(
+                messages=[{"role": "user", "content": "ping"}],
+                model=PRIMARY,
+                deadline=time.monotonic() + deadline_seconds,
+            )
+            key = f"ok:{response.model}"
+        except Exception as e:
+            key = type(e).__name__
+        outcomes[key] = outcomes.get(key, 0) + 1
+    elapsed = time.perf_counter() - started
+
+    print(f"\n== {name}")
+    print(f"   outcomes:      {outcomes}")
+    print(f"   server stats:  {server.stats.snapshot()}")
+    print(f"   circuit state: {llm.circuit_breaker.state}")
+    print(f"   elapsed:       {elapsed:.2f}s")
+
+
+async def main():
+    server = MockLLMServer(config=MockLLMConfig(seed=42)).start()
+    os.environ["OPENROUTER_BASE_URL"] = server.base_url
+    os.environ.setdefault("OPENROUTER_API_KEY", "mock-key")
+    os.environ["FALLBACK_MODEL"] = FALLBACK
+    os.environ.setdefault("LLM_BACKOFF_BASE_SECONDS", "0.05")
+    os.environ.setdefault("LLM_CIRCUIT_FAILURE_THRESHOLD", "5")
+
+    from services import llm
+
+    try:
+        await run_scenario(llm, server, "healthy upstream")
+        await run_scenario(llm, server, "transient 503s (40%) are retried", error_rate=0.4)
+        await run_scenario(llm, server, "429s honour Retry-After", error_rate=0.4, error_status=429)
+        await run_scenario(llm, server, "empty completions are retried", empty_rate=0.4)
+        await run_scenario(llm, server, "hard outage opens the circuit", calls=6, error_rate=1.0, error_status=500)
+
+        llm.LLM_HEDGE_AFTER_SECONDS = 0.2
+        await run_scenario(
+            llm, server, "slow primary is hedged to the fallback model",
+            model_latency={PRIMARY: 2.0, FALLBACK: 0.05},
+        )
+        llm.LLM_HEDGE_AFTER_SECONDS = 0
+
+        await run_scenario(llm, server, "turn deadline expires", calls=2, deadline_seconds=0.5, latency=2.0)
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,366 @@
+"""
+Local OpenAI-compatible fake LLM server with latency and error injection.
+
+Serves POST /v1/chat/completions so the server can be pointed at it with
+OPENROUTER_BASE_URL=http://127.0.0.1:<port>/v1. Faults are configured on the
+command line or at runtime via POST /admin/config, and GET /stats returns
+request counts.
+
+With --scripted (or --script FILE) replies follow a transcript of rules
+instead of a fixed message: each rule matches the latest user message or
+tool result with a regex and answers with a tool call or a reply template.
+Templates are formatted with the regex groups ({0}, {1}, ...) and, for tool
+results, the top-level fields of the tool's JSON payload.
+
+Usage:
+    python benchmarks/mock_llm_server.py --port 8900 --latency 0.2 --error-rate 0.1
+    python benchmarks/mock_llm_server.py --scripted --latency 0.5
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# Default transcript for the order-support agent: look up orders, start
+# cancellations, and summarise tool results
+DEFAULT_SCRIPT = [
+    {"on": "user", "match": r"cancel\D*(ORD-\w+)", "tool_call": {"name": "generate_cancellation_code", "arguments": {"order_id": "{0}"}}},
+    {"on": "user", "match": r"(ORD-\w+)", "tool_call": {"name": "get_order_status", "arguments": {"order_id": "{0}"}}},
+    {"on": "user", "match": r".*", "reply": "I can only assist with order-related queries."},
+    {"on": "tool", "match": r'"refund_amount"', "reply": "Your order has been cancelled. A refund of ${refund_amount} is on its way."},
+    {"on": "tool", "match": r'"order":', "reply": "Here are the details of your order: {order}"},
+    {"on": "tool", "match": r".*", "reply": "Sorry, that did not work: {error}"},
+]
+
+
+class MockLLMConfig:
+    """Fault injection settings (mutable at runtime)"""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        hang_rate: float = 0.0,
+        hang_seconds: float = 30.0,
+        empty_rate: float = 0.0,
+        model_latency: Optional[Dict[str, float]] = None,
+        script: Optional[List[dict]] = None,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.empty_rate = empty_rate
+        # Per-model latency override, e.g. to make the primary slow and the fallback fast
+        self.model_latency = model_latency or {}
+        # Transcript rules for scripted replies (None = fixed reply)
+        self.script = script
+        self.random = random.Random(seed)
+
+    def update(self, values: dict):
+        for key, value in values.items():
+            if key != "random" and hasattr(self, key):
+                setattr(self, key, value)
+
+    def as_dict(self) -> dict:
+        return {key: value for key, value in vars(self).items() if key != "random"}
+
+
+class MockLLMStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+
+    def inc(self, key: str):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counts)
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+
+
+def completion_response(model: str, message: dict, prompt_tokens: int = 0, completion_tokens: int = 0) -> dict:
+    """Build an OpenAI chat.completion payload around an assistant message"""
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    server_version = "MockLLM/1.0"
+
+    # Set on the server instance by MockLLMServer
+    @property
+    def config(self) -> MockLLMConfig:
+        return self.server.mock_config
+
+    @property
+    def stats(self) -> MockLLMStats:
+        return self.server.mock_stats
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._send_json(200, self.stats.snapshot())
+        elif self.path.rstrip("/") == "/admin/config":
+            self._send_json(200, self.config.as_dict())
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        if path == "/admin/config":
+            self.config.update(self._read_json())
+            self._send_json(200, self.config.as_dict())
+        elif path == "/admin/reset":
+            self.stats.reset()
+            self._send_json(200, {"status": "ok"})
+        elif path.endswith("/chat/completions"):
+            self._handle_completion(self._read_json())
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def _handle_completion(self, request: dict):
+        config = self.config
+        model = request.get("model", "mock-model")
+        self.stats.inc("requests")
+        self.stats.inc(f"model:{model}")
+
+        latency = config.model_latency.get(model, config.latency)
+        if config.jitter:
+            latency += config.random.uniform(0, config.jitter)
+
+        roll = config.random.random()
+        if roll < config.hang_rate:
+            self.stats.inc("hangs")
+            time.sleep(config.hang_seconds)
+        elif latency > 0:
+            time.sleep(latency)
+
+        if config.random.random() < config.error_rate:
+            self.stats.inc(f"errors:{config.error_status}")
+            headers = {"Retry-After": "0"} if config.error_status == 429 else None
+            self._send_json(
+                config.error_status,
+                {"error": {"message": "Injected upstream error", "code": config.error_status}},
+                headers,
+            )
+            return
+
+        if config.random.random() < config.empty_rate:
+            self.stats.inc("empty")
+            payload = completion_response(model, {"role": "assistant", "content": ""})
+            payload["choices"] = []
+            self._send_json(200, payload)
+            return
+
+        self.stats.inc("completions")
+        self._send_json(200, self.build_completion(model, request))
+
+    def build_completion(self, model: str, request: dict) -> dict:
+        """Reply from the transcript script, or a short fixed assistant message"""
+        messages = request.get("messages", [])
+        prompt_tokens = sum(len(str(m.get("content") or "")) // 4 for m in messages)
+        message = None
+        if self.config.script:
+            message = scripted_reply(self.config.script, messages)
+        if message is None:
+            message = {"role": "assistant", "content": "This is a mock response."}
+        if message.get("tool_calls"):
+            self.stats.inc(f"tool_call:{message['tool_calls'][0]['function']['name']}")
+        completion_tokens = len(json.dumps(message)) // 4
+        return completion_response(model, message, prompt_tokens, completion_tokens)
+
+
+def scripted_reply(script: List[dict], messages: List[dict]) -> Optional[dict]:
+    """Pick the first transcript rule matching the latest user message or tool result"""
+    if not messages:
+        return None
+    last = messages[-1]
+    on = "tool" if last.get("role") == "tool" else "user"
+    content = str(last.get("content") or "")
+
+    fields = {}
+    if on == "tool":
+        try:
+            payload = json.loads(content)
+            if isinstance(payload, dict):
+                fields = payload
+        except ValueError:
+            pass
+
+    for rule in script:
+        if rule.get("on", "user") != on:
+            continue
+        match = re.search(rule.get("match", ".*"), content, re.IGNORECASE | re.DOTALL)
+        if not match:
+            continue
+        groups = match.groups() or (match.group(0),)
+        values = _FormatFields(fields)
+
+        if "tool_call" in rule:
+            call = rule["tool_call"]
+            arguments = {key: str(value).format(*groups, **values) for key, value in call.get("arguments", {}).items()}
+            return {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": f"call_{uuid.uuid4().hex[:12]}",
+                        "type": "function",
+                        "function": {"name": call["name"], "arguments": json.dumps(arguments)},
+                    }
+                ],
+            }
+        return {"role": "assistant", "content": rule.get("reply", "").format(*groups, **values)}
+    return None
+
+
+class _FormatFields(dict):
+    """Format mapping that renders missing fields as empty strings"""
+
+    def __missing__(self, key):
+        return ""
+
+
+class MockLLMServer:
+    """Run the mock LLM server on a background thread"""
+
+    handler_class = MockLLMHandler
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: Optional[MockLLMConfig] = None):
+        self.httpd = ThreadingHTTPServer((host, port), self.handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.mock_config = config or MockLLMConfig()
+        self.httpd.mock_stats = MockLLMStats()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def config(self) -> MockLLMConfig:
+        return self.httpd.mock_config
+
+    @property
+    def stats(self) -> MockLLMStats:
+        return self.httpd.mock_stats
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0, help="Base response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra uniform random latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status for injected errors")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Fraction of requests that hang")
+    parser.add_argument("--hang-seconds", type=float, default=30.0)
+    parser.add_argument("--empty-rate", type=float, default=0.0, help="Fraction of completions with no choices")
+    parser.add_argument(
+        "--model-latency", action="append", default=[], metavar="MODEL=SECONDS",
+        help="Per-model latency override (repeatable)",
+    )
+    parser.add_argument("--scripted", action="store_true", help="Reply using the built-in order-support transcript")
+    parser.add_argument("--script", default=None, help="JSON file with transcript rules (implies --scripted)")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser
+
+
+def config_from_args(args) -> MockLLMConfig:
+    model_latency = {}
+    for item in args.model_latency:
+        name, _, seconds = item.rpartition("=")
+        model_latency[name] = float(seconds)
+    script = None
+    if args.script:
+        with open(args.script) as f:
+            script = json.load(f)
+    elif args.scripted:
+        script = DEFAULT_SCRIPT
+    return MockLLMConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        hang_rate=args.hang_rate,
+        hang_seconds=args.hang_seconds,
+        empty_rate=args.empty_rate,
+        model_latency=model_latency,
+        script=script,
+        seed=args.seed,
+    )
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    server = MockLLMServer(args.host, args.port, config_from_args(args))
+    print(f"Mock LLM server listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
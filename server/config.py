@@ -2,18 +2,49 @@
 Configuration and constants for application
 """
 import os
-from openai import OpenAI
+from functools import lru_cache
 from dotenv import load_dotenv
 
+from services.policies import policy_prompt_lines
+
 load_dotenv()
 
 # OpenAI/OpenRouter Configuration
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY"),
-)
+# OPENROUTER_BASE_URL can point at a local fake server for testing.
+# Retries are handled by services/llm.py, so the client's own retries are off.
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    """Construct the OpenAI/OpenRouter client on first use (keeps imports fast)"""
+    from openai import OpenAI
+
+    return OpenAI(
+        base_url=OPENROUTER_BASE_URL,
+        api_key=os.getenv("OPENROUTER_API_KEY"),
+        max_retries=0,
+    )
+
+
+def warm_up_client():
+    """Build the client once ahead of the first model call (run in a thread at startup)"""
+    try:
+        get_client()
+    except Exception as e:
+        # e.g. no OPENROUTER_API_KEY yet: the first model call reports it
+        print(f"Warning: could not warm up the LLM client ({e}), it will be built on the first model call")
+
+
+def __getattr__(name):
+    # Backwards compatible `from config import client`, constructed lazily
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 MODEL = "x-ai/grok-code-fast-1"
+# Model used for hedged requests when the primary model is slow (empty = no hedging)
+FALLBACK_MODEL = os.getenv("FALLBACK_MODEL", "")
 
 # System Prompt
 SYSTEM_PROMPT = """You are a helpful customer support agent for an e-commerce company.
@@ -23,13 +54,17 @@ CANCELLATION PROCESS:
 2. Inform the user that a verification code has been generated
 3. Wait for the user to provide the verification code
 4. Call cancel_order_with_verification(order_id, code)
+To cancel several orders at once, call generate_bulk_cancellation_code(order_ids) once
+with all of them; the user confirms the whole set with a single code.
 
 GUARDRAILS:
 - ONLY answer order-related questions
 - For non-order questions: "I can only assist with order-related queries."
 - ALWAYS use verification for cancellations
 - Be helpful and professional
-"""
+
+COMPANY POLICIES (questions about these are in scope):
+""" + policy_prompt_lines() + "\n"
 
 # Tools definition for the AI agent
 tools = [
@@ -47,6 +82,20 @@ tools = [
             },
         },
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_order_timeline",
+            "description": "Get the history of status changes for an order (when it was placed, shipped, cancelled, ...)",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "order_id": {"type": "string", "description": "Order ID (ORD-XXX)"}
+                },
+                "required": ["order_id"],
+            },
+        },
+    },
     {
         "type": "function",
         "function": {
@@ -59,6 +108,20 @@ tools = [
             },
         },
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "generate_bulk_cancellation_code",
+            "description": "Generate one verification code to cancel several orders at once",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "order_ids": {"type": "array", "items": {"type": "string"}, "description": "Order IDs (ORD-XXX)"}
+                },
+                "required": ["order_ids"],
+            },
+        },
+    },
     {
         "type": "function",
         "function": {
@@ -78,3 +141,165 @@ tools = [
 
 # CORS Configuration
 CORS_ORIGINS = ["http://localhost:3000", "http://localhost:5173"]
+
+# Agent Scheduler Configuration
+AGENT_MAX_CONCURRENT_TASKS = int(os.getenv("AGENT_MAX_CONCURRENT_TASKS", "16"))
+AGENT_MAX_TASKS_PER_USER = int(os.getenv("AGENT_MAX_TASKS_PER_USER", "2"))
+AGENT_DISCONNECT_GRACE_SECONDS = float(os.getenv("AGENT_DISCONNECT_GRACE_SECONDS", "15"))
+AGENT_SHUTDOWN_DRAIN_SECONDS = float(os.getenv("AGENT_SHUTDOWN_DRAIN_SECONDS", "30"))
+
+# Chat Turn Configuration
+# Merge user messages that arrive while a turn is running into one model call
+CHAT_COALESCE_MESSAGES = os.getenv("CHAT_COALESCE_MESSAGES", "true").lower() == "true"
+# Extra time to wait for follow-up messages before starting a turn (0 = no delay)
+CHAT_COALESCE_WINDOW_SECONDS = float(os.getenv("CHAT_COALESCE_WINDOW_SECONDS", "0"))
+
+# LLM Resilience Configuration
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))
+# Wall-clock deadline for all model calls within one agent turn
+LLM_TURN_DEADLINE_SECONDS = float(os.getenv("LLM_TURN_DEADLINE_SECONDS", "90"))
+# Start a hedged request to FALLBACK_MODEL if the primary has not answered by then (0 = off)
+LLM_HEDGE_AFTER_SECONDS = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", "0"))
+LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+LLM_CIRCUIT_RESET_SECONDS = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+# Threads for blocking model calls, apart from the default executor
+# (0 = a primary and a hedge for every concurrent turn this process can run)
+LLM_CALL_THREADS = int(os.getenv("LLM_CALL_THREADS", "0"))
+
+# Model Routing Configuration
+# Candidate models per tier with cost (USD per million tokens) and latency budgets.
+# The router in services/model_router.py picks a tier per model call. Off by
+# default: every call uses MODEL unless routing (and other vendors' models) is opted into.
+MODEL_ROUTING_ENABLED = os.getenv("MODEL_ROUTING_ENABLED", "false").lower() == "true"
+MODEL_CANDIDATES = {
+    "small": {
+        "model": os.getenv("MODEL_SMALL", "openai/gpt-4o-mini"),
+        "input_cost_per_mtok": 0.15,
+        "output_cost_per_mtok": 0.60,
+        "latency_budget_seconds": 4.0,
+    },
+    "standard": {
+        "model": os.getenv("MODEL_STANDARD", MODEL),
+        "input_cost_per_mtok": 0.20,
+        "output_cost_per_mtok": 1.50,
+        "latency_budget_seconds": 8.0,
+    },
+    "large": {
+        "model": os.getenv("MODEL_LARGE", "openai/gpt-4o"),
+        "input_cost_per_mtok": 2.50,
+        "output_cost_per_mtok": 10.00,
+        "latency_budget_seconds": 20.0,
+    },
+}
+# Conversations longer than this many messages are routed to the large model
+MODEL_ROUTING_LONG_HISTORY = int(os.getenv("MODEL_ROUTING_LONG_HISTORY", "40"))
+
+# Order Events Configuration
+# Monthly order_events partitions to keep created ahead of time (PostgreSQL)
+ORDER_EVENTS_PARTITION_MONTHS_AHEAD = int(os.getenv("ORDER_EVENTS_PARTITION_MONTHS_AHEAD", "3"))
+
+# Batch Order Status API Configuration
+# Maximum order IDs accepted by POST /api/orders/status:batch
+ORDER_STATUS_BATCH_MAX = int(os.getenv("ORDER_STATUS_BATCH_MAX", "1000"))
+
+# Bulk Cancellation Configuration
+# Maximum orders covered by one generate_bulk_cancellation_code call
+BULK_CANCEL_MAX_ORDERS = int(os.getenv("BULK_CANCEL_MAX_ORDERS", "20"))
+
+# Speculative Prefetch Configuration
+# Load orders mentioned in the user's message while the model call is in flight
+ORDER_PREFETCH_ENABLED = os.getenv("ORDER_PREFETCH_ENABLED", "true").lower() == "true"
+# Maximum order IDs prefetched per message
+ORDER_PREFETCH_MAX_ORDERS = int(os.getenv("ORDER_PREFETCH_MAX_ORDERS", "3"))
+
+# Approval Response Configuration
+# Answer well-known cancellation outcomes with local templates instead of a model call
+APPROVAL_TEMPLATE_RESPONSES = os.getenv("APPROVAL_TEMPLATE_RESPONSES", "true").lower() == "true"
+
+# Agent Turn Budget Configuration
+# Per-turn limits enforced by services/budget.py in every agent loop; the
+# wall-clock limit is LLM_TURN_DEADLINE_SECONDS
+AGENT_MAX_MODEL_CALLS = int(os.getenv("AGENT_MAX_MODEL_CALLS", "8"))
+AGENT_MAX_PROMPT_TOKENS = int(os.getenv("AGENT_MAX_PROMPT_TOKENS", "60000"))
+AGENT_MAX_COMPLETION_TOKENS = int(os.getenv("AGENT_MAX_COMPLETION_TOKENS", "4000"))
+
+# Admission Control Configuration
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# memory (per process) or redis (shared across processes, needs REDIS_URL and the redis package)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Token buckets: sustained requests per minute and burst size
+RATE_LIMIT_CHAT_PER_MINUTE = float(os.getenv("RATE_LIMIT_CHAT_PER_MINUTE", "20"))
+RATE_LIMIT_CHAT_BURST = int(os.getenv("RATE_LIMIT_CHAT_BURST", "5"))
+RATE_LIMIT_APPROVAL_PER_MINUTE = float(os.getenv("RATE_LIMIT_APPROVAL_PER_MINUTE", "10"))
+RATE_LIMIT_APPROVAL_BURST = int(os.getenv("RATE_LIMIT_APPROVAL_BURST", "3"))
+RATE_LIMIT_LOGIN_PER_MINUTE = float(os.getenv("RATE_LIMIT_LOGIN_PER_MINUTE", "10"))
+RATE_LIMIT_LOGIN_BURST = int(os.getenv("RATE_LIMIT_LOGIN_BURST", "5"))
+# Per-IP limits are looser than per-user ones (several users can share an IP)
+RATE_LIMIT_IP_MULTIPLIER = float(os.getenv("RATE_LIMIT_IP_MULTIPLIER", "4"))
+# Use the first X-Forwarded-For address as the client IP (only behind a trusted proxy)
+RATE_LIMIT_TRUST_FORWARDED_FOR = os.getenv("RATE_LIMIT_TRUST_FORWARDED_FOR", "false").lower() == "true"
+# Load shedding: reject new agent work (503) above these thresholds
+ADMISSION_MAX_LOOP_LAG_SECONDS = float(os.getenv("ADMISSION_MAX_LOOP_LAG_SECONDS", "0.5"))
+ADMISSION_MAX_AGENT_JOBS = int(os.getenv("ADMISSION_MAX_AGENT_JOBS", "64"))
+# How often the event-loop lag is sampled
+LOOP_MONITOR_INTERVAL_SECONDS = float(os.getenv("LOOP_MONITOR_INTERVAL_SECONDS", "0.1"))
+
+# Idempotency Configuration
+# How long a chat/approval result is replayed for a retried Idempotency-Key
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "300"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+
+# Debug Instrumentation Configuration
+# Loop stalls longer than this are logged with the stack of the blocking code
+LOOP_BLOCK_THRESHOLD_SECONDS = float(os.getenv("LOOP_BLOCK_THRESHOLD_SECONDS", "0.25"))
+# /debug/* endpoints are disabled unless DEBUG_TOKEN is set (send it as X-Debug-Token)
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN", "")
+DEBUG_PROFILE_MAX_SECONDS = float(os.getenv("DEBUG_PROFILE_MAX_SECONDS", "60"))
+DEBUG_PROFILE_INTERVAL_SECONDS = float(os.getenv("DEBUG_PROFILE_INTERVAL_SECONDS", "0.005"))
+
+# FAQ Answer Configuration
+# Answer clear policy questions (shipping, refunds, support hours) from a local index, no model call
+FAQ_ANSWERS_ENABLED = os.getenv("FAQ_ANSWERS_ENABLED", "true").lower() == "true"
+# Optional extra policies (markdown "## Topic" sections, see services/faq.py)
+FAQ_POLICY_FILE = os.getenv("FAQ_POLICY_FILE", "")
+# Confidence thresholds: BM25 score, share of query terms the snippet covers,
+# and how far the best snippet must lead the runner-up
+FAQ_MIN_SCORE = float(os.getenv("FAQ_MIN_SCORE", "1.0"))
+FAQ_MIN_COVERAGE = float(os.getenv("FAQ_MIN_COVERAGE", "0.6"))
+FAQ_MIN_MARGIN = float(os.getenv("FAQ_MIN_MARGIN", "1.5"))
+FAQ_MAX_QUERY_TERMS = int(os.getenv("FAQ_MAX_QUERY_TERMS", "8"))
+FAQ_CACHE_SIZE = int(os.getenv("FAQ_CACHE_SIZE", "4096"))
+
+# Transcript Persistence Configuration
+# Chat sessions are written to conversations/messages and rehydrated on first use after a restart
+TRANSCRIPTS_ENABLED = os.getenv("TRANSCRIPTS_ENABLED", "true").lower() == "true"
+# Write-behind buffer: flush at least this often, or as soon as this many writes are queued
+TRANSCRIPT_FLUSH_INTERVAL_SECONDS = float(os.getenv("TRANSCRIPT_FLUSH_INTERVAL_SECONDS", "0.5"))
+TRANSCRIPT_FLUSH_BATCH = int(os.getenv("TRANSCRIPT_FLUSH_BATCH", "200"))
+# Writes kept while the database is unavailable; newer ones are dropped beyond this
+TRANSCRIPT_MAX_BUFFER = int(os.getenv("TRANSCRIPT_MAX_BUFFER", "50000"))
+# Idle in-memory sessions are evicted after this long (they rehydrate from the database)
+SESSION_IDLE_EVICT_SECONDS = float(os.getenv("SESSION_IDLE_EVICT_SECONDS", "1800"))
+
+# Serialization Configuration
+# auto (orjson, then msgspec, then the json module), orjson, msgspec or stdlib
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto")
+
+# Agent Worker Pool Configuration
+# Run agent turns in separate worker processes (python agent_worker.py) instead of the web process
+AGENT_WORKERS_ENABLED = os.getenv("AGENT_WORKERS_ENABLED", "false").lower() == "true"
+# host:port of the job broker hosted by agent_worker.py, shared by web and worker processes
+AGENT_BROKER_ADDRESS = os.getenv("AGENT_BROKER_ADDRESS", "127.0.0.1:8700")
+# The broker unpickles what it receives: the default key is only accepted on a loopback address
+AGENT_BROKER_DEFAULT_AUTHKEY = "change-me-in-production"
+AGENT_BROKER_AUTHKEY = os.getenv("AGENT_BROKER_AUTHKEY", AGENT_BROKER_DEFAULT_AUTHKEY)
+# Worker processes (0 = one per CPU) and concurrent turns per worker process
+AGENT_WORKER_PROCESSES = int(os.getenv("AGENT_WORKER_PROCESSES", "0"))
+AGENT_WORKER_CONCURRENCY = int(os.getenv("AGENT_WORKER_CONCURRENCY", "16"))
+# A turn with no reply from its worker for this long is failed (e.g. the worker died)
+AGENT_WORKER_REPLY_TIMEOUT_SECONDS = float(os.getenv("AGENT_WORKER_REPLY_TIMEOUT_SECONDS", "120"))
+# Worker process i serves its own Prometheus metrics on this port + i (0 = off)
+AGENT_WORKER_METRICS_PORT = int(os.getenv("AGENT_WORKER_METRICS_PORT", "0"))
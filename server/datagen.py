@@ -0,0 +1,222 @@
+"""
+Synthetic data generator for load testing.
+
+Generates users and orders (plus one initial order_events row per order)
+with realistic status and date distributions and loads them with bulk COPY
+(PostgreSQL) or executemany INSERT batches (other databases). Output is
+deterministic for a given --seed: users are split into fixed-size shards,
+each generated from its own seeded RNG, so the data does not depend on how
+many --workers load it. Parallel loading is PostgreSQL-only: SQLite allows one
+writer at a time, so it always loads with a single worker.
+
+Usage:
+    python datagen.py --users 1000000 --orders-per-user 5 --workers 8 --seed 42
+"""
+
+import argparse
+import csv
+import io
+import json
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+from typing import Iterator, List, Tuple
+
+sys.path.insert(0, ".")
+
+# Shared password for generated users (hashed once, not per user)
+GENERATED_PASSWORD = "Load@1234"
+
+SHARD_SIZE = 10_000
+ORDER_WINDOW_DAYS = 730
+ITEM_CATALOG = [
+    ("Laptop", 1299.99), ("Mouse", 49.99), ("Keyboard", 89.99), ("Monitor", 499.99),
+    ("Tablet", 399.99), ("USB-C Hub", 79.99), ("Headphones", 199.99), ("Webcam", 149.99),
+    ("Phone Case", 19.99), ("Charger", 29.99), ("Desk Lamp", 39.99), ("SSD", 119.99),
+]
+FIRST_NAMES = ["Aarav", "Maya", "Liam", "Priya", "Noah", "Zara", "Ethan", "Anika", "Lucas", "Isha", "Omar", "Sofia"]
+LAST_NAMES = ["Patel", "Smith", "Garcia", "Shah", "Brown", "Khan", "Lee", "Mehta", "Wilson", "Rao", "Nguyen", "Jones"]
+
+USER_COLUMNS = ("id", "name", "email", "password_hash", "created_at")
+ORDER_COLUMNS = ("order_id", "user_id", "customer_name", "status", "items", "total", "date", "verification_codes", "created_at", "updated_at", "status_changed_at")
+EVENT_COLUMNS = ("order_id", "user_id", "to_status", "source", "occurred_at")
+
+
+def order_status(age_days: int, rng: random.Random) -> str:
+    """Pick a status that fits the order's age (recent orders are still in flight)"""
+    if rng.random() < 0.05:
+        return "cancelled"
+    if age_days < 2:
+        return "processing"
+    if age_days < 7:
+        return rng.choices(["processing", "shipped", "delivered"], weights=[30, 55, 15])[0]
+    if age_days < 14:
+        return rng.choices(["shipped", "delivered"], weights=[20, 80])[0]
+    return rng.choices(["delivered", "returned"], weights=[97, 3])[0]
+
+
+def generate_shard(shard: int, users: int, id_offset: int, orders_per_user: float, seed: int, now: datetime, password_hash: str) -> Tuple[List[tuple], List[tuple], List[tuple]]:
+    """Generate the users, orders and initial order events of one shard deterministically"""
+    rng = random.Random(f"{seed}:{shard}")
+    first_user = shard * SHARD_SIZE
+    last_user = min(first_user + SHARD_SIZE, users)
+    user_rows, order_rows, event_rows = [], [], []
+
+    for index in range(first_user, last_user):
+        user_id = id_offset + index
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        signup = now - timedelta(days=rng.randrange(ORDER_WINDOW_DAYS + 365))
+        user_rows.append((user_id, name, f"user{user_id}@example.com", password_hash, signup))
+
+        # Skewed (exponential) order counts around the requested mean
+        count = min(99, int(rng.expovariate(1 / orders_per_user))) if orders_per_user > 0 else 0
+        for n in range(count):
+            # Order recency skews towards the present (most orders are recent)
+            age_days = int(ORDER_WINDOW_DAYS * (rng.random() ** 2))
+            placed = now - timedelta(days=age_days, seconds=rng.randrange(86400))
+            items = rng.sample(ITEM_CATALOG, k=rng.choice([1, 1, 1, 2, 3]))
+            total = round(sum(price for _, price in items), 2)
+            order_id = f"ORD-{user_id:08d}{n:02d}"
+            status = order_status(age_days, rng)
+            event_rows.append((order_id, user_id, status, "datagen", placed))
+            order_rows.append((
+                order_id,
+                user_id,
+                name,
+                status,
+                json.dumps([item for item, _ in items]),
+                total,
+                placed,
+                "[]",
+                placed,
+                placed,
+                placed,
+            ))
+
+    return user_rows, order_rows, event_rows
+
+
+def _batches(rows: List[tuple], size: int) -> Iterator[List[tuple]]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _copy_rows(raw_connection, table: str, columns: Tuple[str, ...], rows: List[tuple]):
+    """Stream rows into PostgreSQL with COPY ... FROM STDIN (CSV)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(rows)
+    buffer.seek(0)
+    with raw_connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def _insert_rows(connection, table, columns: Tuple[str, ...], rows: List[tuple], batch_size: int):
+    """Load rows with one executemany INSERT per batch (the statement is compiled once)"""
+    from sqlalchemy import insert
+
+    json_columns = {"items", "verification_codes"}
+    statement = insert(table)
+    for batch in _batches(rows, batch_size):
+        values = [
+            {column: (json.loads(value) if column in json_columns else value) for column, value in zip(columns, row)}
+            for row in batch
+        ]
+        connection.execute(statement, values)
+
+
+def load_shard(task: tuple) -> Tuple[int, int]:
+    """Generate and load one shard (runs in a worker process)"""
+    shard, users, id_offset, orders_per_user, seed, now, password_hash, batch_size = task
+    from database import engine, User, Order, OrderEvent
+
+    user_rows, order_rows, event_rows = generate_shard(shard, users, id_offset, orders_per_user, seed, now, password_hash)
+
+    if engine.dialect.name == "postgresql":
+        raw = engine.raw_connection()
+        try:
+            _copy_rows(raw, "users", USER_COLUMNS, user_rows)
+            _copy_rows(raw, "orders", ORDER_COLUMNS, order_rows)
+            _copy_rows(raw, "order_events", EVENT_COLUMNS, event_rows)
+            raw.commit()
+        finally:
+            raw.close()
+    else:
+        with engine.begin() as connection:
+            _insert_rows(connection, User.__table__, USER_COLUMNS, user_rows, batch_size)
+            _insert_rows(connection, Order.__table__, ORDER_COLUMNS, order_rows, batch_size)
+            _insert_rows(connection, OrderEvent.__table__, EVENT_COLUMNS, event_rows, batch_size)
+
+    return len(user_rows), len(order_rows)
+
+
+def _init_worker():
+    # Connections inherited from the parent process must not be shared
+    from database import engine
+
+    engine.dispose(close=False)
+
+
+def generate(users: int, orders_per_user: float = 5.0, workers: int = 1, seed: int = 42, id_offset: int = 1_000_000, batch_size: int = 1000) -> Tuple[int, int]:
+    """Generate and load synthetic users and orders; returns (users, orders) created"""
+    from sqlalchemy import text
+    from database import engine, init_db
+    from services.auth import get_shared_password_hash
+
+    init_db()
+    password_hash = get_shared_password_hash(GENERATED_PASSWORD)
+    # Fixed reference time keeps output deterministic for a seed
+    now = datetime(2025, 1, 1) + timedelta(days=seed % 365)
+    shards = math.ceil(users / SHARD_SIZE)
+    tasks = [(shard, users, id_offset, orders_per_user, seed, now, password_hash, batch_size) for shard in range(shards)]
+
+    if workers > 1 and engine.dialect.name == "sqlite":
+        # Concurrent writers fail with "database is locked"
+        print(f"Warning: SQLite allows one writer at a time, loading with 1 worker instead of {workers}")
+        workers = 1
+
+    created_users = created_orders = 0
+    started = time.perf_counter()
+    if workers > 1:
+        engine.dispose()
+        with Pool(workers, initializer=_init_worker) as pool:
+            for shard_users, shard_orders in pool.imap_unordered(load_shard, tasks):
+                created_users += shard_users
+                created_orders += shard_orders
+                print(f"  loaded {created_users}/{users} users, {created_orders} orders")
+    else:
+        for task in tasks:
+            shard_users, shard_orders = load_shard(task)
+            created_users += shard_users
+            created_orders += shard_orders
+            print(f"  loaded {created_users}/{users} users, {created_orders} orders")
+
+    if engine.dialect.name == "postgresql":
+        # Explicit ids bypass the serial sequence; move it past the generated range
+        with engine.begin() as connection:
+            connection.execute(text("SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT MAX(id) FROM users))"))
+
+    elapsed = time.perf_counter() - started
+    rate = (created_users + created_orders) / elapsed if elapsed else 0
+    print(f"Generated {created_users} users and {created_orders} orders in {elapsed:.1f}s ({rate:,.0f} rows/s)")
+    return created_users, created_orders
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic users and orders for load testing")
+    parser.add_argument("--users", type=int, default=10_000, help="Number of users to generate")
+    parser.add_argument("--orders-per-user", type=float, default=5.0, help="Mean orders per user")
+    parser.add_argument("--workers", type=int, default=1, help="Parallel loader processes (PostgreSQL only; SQLite loads with one)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (output is deterministic per seed)")
+    parser.add_argument("--id-offset", type=int, default=1_000_000, help="First generated user id")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows per INSERT batch (non-PostgreSQL)")
+    args = parser.parse_args()
+
+    generate(args.users, args.orders_per_user, args.workers, args.seed, args.id_offset, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,10 +9,16 @@ from langchain_openai import ChatOpenAI
 from langchain_core.tools import tool
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
 from dotenv import load_dotenv
+import openai
 import os
-import json
 import random
 import string
+import time
+from functools import lru_cache
+
+from services.model_router import model_router, turn_context_for
+from services.budget import TurnBudget, BudgetExceeded, DEADLINE
+from services.serialization import dumps
 
 load_dotenv()
 
@@ -133,6 +139,20 @@ tools = [
 # Bind tools to LLM (this works across all LangChain versions)
 llm_with_tools = llm.bind_tools(tools)
 
+
+@lru_cache(maxsize=None)
+def llm_for_model(model: str):
+    """Get a tool-bound LLM for a routed model (cached per model)"""
+    if model == llm.model_name:
+        return llm_with_tools
+    routed_llm = ChatOpenAI(
+        model=model,
+        openai_api_key=api_key,
+        openai_api_base="https://openrouter.ai/api/v1",
+        temperature=0.7,
+    )
+    return routed_llm.bind_tools(tools)
+
 # ============================================================================
 # SYSTEM PROMPT
 # ============================================================================
@@ -167,11 +187,30 @@ def run_agent(user_input: str, chat_history: list) -> tuple[str, list]:
     # Create messages with system prompt
     messages = [SystemMessage(content=SYSTEM_PROMPT)] + chat_history
 
-    # Run loop until we get a final answer
-    max_iterations = 10
-    for iteration in range(max_iterations):
-        # Call LLM
-        response = llm_with_tools.invoke(messages)
+    # Run loop until we get a final answer or the turn budget runs out
+    budget = TurnBudget("langchain")
+    while True:
+        # Pick a model for this call, then call it
+        route = model_router.choose(turn_context_for(chat_history))
+        try:
+            budget.start_call()
+            started = time.perf_counter()
+            try:
+                # Extra invoke kwargs go to the OpenAI request, like main.py's timeout
+                response = llm_for_model(route.model).invoke(messages, timeout=budget.remaining_seconds())
+            except openai.APITimeoutError:
+                raise budget.exceeded(DEADLINE)
+        except BudgetExceeded as e:
+            print(f"[BUDGET] {e.event()}")
+            return str(e), chat_history
+        usage = getattr(response, "usage_metadata", None) or {}
+        model_router.record_call(
+            route.model,
+            time.perf_counter() - started,
+            usage.get("input_tokens", 0),
+            usage.get("output_tokens", 0),
+        )
+        budget.record_usage(usage.get("input_tokens", 0), usage.get("output_tokens", 0))
 
         # Check if tools were called
         if hasattr(response, "tool_calls") and response.tool_calls:
@@ -192,7 +231,7 @@ def run_agent(user_input: str, chat_history: list) -> tuple[str, list]:
 
                 # Add tool result
                 tool_message = ToolMessage(
-                    content=json.dumps(tool_result), tool_call_id=tool_call["id"]
+                    content=dumps(tool_result), tool_call_id=tool_call["id"]
                 )
                 chat_history.append(tool_message)
 
@@ -203,8 +242,6 @@ def run_agent(user_input: str, chat_history: list) -> tuple[str, list]:
             chat_history.append(AIMessage(content=response.content))
             return response.content, chat_history
 
-    return "Max iterations reached", chat_history
-
 
 # ============================================================================
 # INTERACTIVE SESSION
@@ -9,13 +9,19 @@ This demonstrates:
 5. INTERACTIVE MODE - Chat until you say 'bye' or 'exit'
 """
 
+import openai
 from openai import OpenAI
-import json
 from datetime import datetime
 from dotenv import load_dotenv
 import os
 import random
 import string
+import time
+
+from services.model_router import model_router, turn_context_for
+from services.budget import TurnBudget, BudgetExceeded, DEADLINE
+from services.serialization import ToolArgumentDecoder, ToolArgumentsError, dumps
+from services.policies import policy_prompt_lines
 
 load_dotenv()
 
@@ -240,6 +246,9 @@ tools = [
     },
 ]
 
+# Validates tool-call arguments against the schemas above
+tool_arguments = ToolArgumentDecoder(tools)
+
 # ============================================================================
 # PART 3: INSTRUCTIONS - The agent's system prompt
 # ============================================================================
@@ -260,9 +269,7 @@ Important guidelines:
 - Keep responses concise and clear
 
 Company policies you should know:
-- Refunds: Available within 30 days of purchase
-- Shipping: 3-5 business days for standard shipping
-- Support hours: 24/7 (you're always available!)
+""" + policy_prompt_lines() + """
 
 CANCELLATION PROCESS (CRITICAL - HUMAN-IN-THE-LOOP):
 When a customer wants to cancel an order:
@@ -338,18 +345,39 @@ def run_agent(user_message: str, conversation_history=None):
     print(f"USER: {user_message}")
     print(f"{'=' * 60}\n")
 
-    # Agent loop - keeps running until no more tools are needed
+    # Model calls, tokens and time allowed for this turn
+    budget = TurnBudget("cli")
+
+    # Agent loop - keeps running until no more tools are needed (or the budget runs out)
     while True:
+        # Pick a model for this call (cheap model for simple turns)
+        route = model_router.choose(turn_context_for(conversation_history))
+        print(f"[MODEL] {route.model} ({route.tier}: {route.reason})")
+
         # Call the model via OpenRouter
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": FULL_SYSTEM_PROMPT},
-                *conversation_history,
-            ],
-            tools=tools,
-            tool_choice="auto",
-        )
+        try:
+            budget.start_call()
+            started = time.perf_counter()
+            try:
+                response = client.chat.completions.create(
+                    model=route.model,
+                    messages=[
+                        {"role": "system", "content": FULL_SYSTEM_PROMPT},
+                        *conversation_history,
+                    ],
+                    tools=tools,
+                    tool_choice="auto",
+                    max_tokens=budget.remaining_completion_tokens(),
+                    timeout=budget.remaining_seconds(),
+                )
+            except openai.APITimeoutError:
+                raise budget.exceeded(DEADLINE)
+        except BudgetExceeded as e:
+            print(f"[BUDGET] {e.event()}")
+            print(f"AGENT: {e}\n")
+            return str(e), conversation_history
+        model_router.record_usage(route.model, time.perf_counter() - started, response.usage)
+        budget.record_openai_usage(response.usage)
 
         message = response.choices[0].message
 
@@ -367,26 +395,30 @@ def run_agent(user_message: str, conversation_history=None):
             # Execute each tool the AI requested
             for tool_call in message.tool_calls:
                 function_name = tool_call.function.name
-                function_args = json.loads(tool_call.function.arguments)
-
-                # Execute the appropriate tool
-                if function_name == "get_order_status":
-                    result = get_order_status(**function_args)
-                elif function_name == "process_refund":
-                    result = process_refund(**function_args)
-                elif function_name == "generate_cancellation_code":
-                    result = generate_cancellation_code(**function_args)
-                elif function_name == "cancel_order_with_verification":
-                    result = cancel_order_with_verification(**function_args)
+                try:
+                    function_args = tool_arguments.decode(function_name, tool_call.function.arguments)
+                except ToolArgumentsError as e:
+                    # Let the model correct the call instead of crashing the session
+                    result = {"success": False, "error": f"Invalid arguments for {function_name}: {e}"}
                 else:
-                    result = {"error": "Unknown tool"}
+                    # Execute the appropriate tool
+                    if function_name == "get_order_status":
+                        result = get_order_status(**function_args)
+                    elif function_name == "process_refund":
+                        result = process_refund(**function_args)
+                    elif function_name == "generate_cancellation_code":
+                        result = generate_cancellation_code(**function_args)
+                    elif function_name == "cancel_order_with_verification":
+                        result = cancel_order_with_verification(**function_args)
+                    else:
+                        result = {"error": "Unknown tool"}
 
                 # Add tool result to conversation
                 conversation_history.append(
                     {
                         "role": "tool",
                         "tool_call_id": tool_call.id,
-                        "content": json.dumps(result),
+                        "content": dumps(result),
                     }
                 )
         else:
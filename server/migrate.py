@@ -0,0 +1,60 @@
+"""
+Database migration step - create or update the schema.
+
+Run before starting the API server (the server no longer touches the schema
+on startup). Also creates upcoming monthly order_events partitions, so run it
+at least monthly (every deploy does):
+    python migrate.py              # apply all pending migrations
+    python migrate.py --status     # list migrations and whether they are applied
+    python migrate.py --target 2   # apply migrations up to version 2
+"""
+import argparse
+import time
+
+from sqlalchemy import text
+
+from database import engine
+import migrations
+from services.order_events import ensure_partitions
+
+
+def wait_for_database(timeout: float = 60.0):
+    """Wait until the database accepts connections (e.g. a container still booting)"""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            return
+        except Exception as e:
+            if time.time() >= deadline:
+                raise
+            print(f"Waiting for database: {e}")
+            time.sleep(1)
+
+
+def migrate(target: int = None):
+    """Apply pending schema migrations"""
+    wait_for_database()
+    ran = migrations.upgrade(engine, target=target)
+    if target is None:
+        ensure_partitions()
+    print(f"Applied {ran} migration(s), database schema is up to date")
+
+
+def print_status():
+    for version, name, applied in migrations.status(engine):
+        print(f"  {version:04d}_{name:<40} {'applied' if applied else 'pending'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply database schema migrations")
+    parser.add_argument("--status", action="store_true", help="List migrations and exit")
+    parser.add_argument("--target", type=int, default=None, help="Highest migration version to apply")
+    args = parser.parse_args()
+
+    if args.status:
+        wait_for_database()
+        print_status()
+    else:
+        migrate(args.target)
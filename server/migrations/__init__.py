@@ -0,0 +1,233 @@
+"""
+Versioned schema migrations
+
+Migrations live in migrations/versions as NNNN_description.py modules with an
+upgrade(ctx) function. Applied versions are tracked in the schema_migrations
+table. A migration that sets TRANSACTIONAL = False runs in autocommit mode,
+which is required for online operations such as CREATE INDEX CONCURRENTLY and
+lets batched backfills commit (and throttle) batch by batch instead of holding
+one long transaction on a live table.
+"""
+import importlib
+import os
+import re
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import List, Optional, Sequence
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+VERSIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "versions")
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.py$")
+# Arbitrary key for pg_advisory_lock so only one migrator runs at a time
+ADVISORY_LOCK_KEY = 7_301_998
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    module: object
+
+    @property
+    def transactional(self) -> bool:
+        return getattr(self.module, "TRANSACTIONAL", True)
+
+
+class MigrationContext:
+    """Helpers available to migrations through upgrade(ctx)"""
+
+    def __init__(self, connection: Connection):
+        self.connection = connection
+        self.dialect = connection.dialect.name
+
+    @property
+    def is_postgres(self) -> bool:
+        return self.dialect == "postgresql"
+
+    def execute(self, sql: str, **params):
+        return self.connection.execute(text(sql), params)
+
+    def has_table(self, table: str) -> bool:
+        return inspect(self.connection).has_table(table)
+
+    def has_column(self, table: str, column: str) -> bool:
+        return any(c["name"] == column for c in inspect(self.connection).get_columns(table))
+
+    def has_index(self, table: str, index: str) -> bool:
+        return any(i["name"] == index for i in inspect(self.connection).get_indexes(table))
+
+    def add_column(self, table: str, column: str, ddl_type: str):
+        """Add a nullable column (metadata-only on PostgreSQL, no table rewrite)"""
+        if not self.has_column(table, column):
+            self.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}")
+
+    def create_index(self, name: str, table: str, columns: Sequence[str], unique: bool = False, where: Optional[str] = None):
+        """
+        Create an index without blocking writes.
+
+        On PostgreSQL this uses CREATE INDEX CONCURRENTLY (the migration must set
+        TRANSACTIONAL = False) and drops a leftover INVALID index from an earlier
+        failed attempt first. Other databases get a plain CREATE INDEX.
+        """
+        unique_sql = "UNIQUE " if unique else ""
+        where_sql = f" WHERE {where}" if where else ""
+        column_sql = ", ".join(columns)
+
+        if self.is_postgres:
+            invalid = self.execute(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND NOT i.indisvalid",
+                name=name,
+            ).first()
+            if invalid:
+                print(f"  dropping invalid index {name} from a previous attempt")
+                self.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            self.execute(
+                f"CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({column_sql}){where_sql}"
+            )
+        else:
+            self.execute(f"CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON {table} ({column_sql}){where_sql}")
+
+    def create_month_partitions(self, table: str, first_month: date, months: int, key: Optional[str] = None) -> List[str]:
+        """
+        Create monthly range partitions of a partitioned PostgreSQL table.
+
+        Partitions are named <table>_yYYYYmMM; existing ones are left alone.
+        PostgreSQL refuses a new partition while the <table>_default partition
+        holds rows in its range, so with the partition key column given those
+        rows are moved into the new partition: detach the default partition,
+        create the month, move the rows, reattach. Run it in a transaction so a
+        failure leaves the default partition attached.
+        """
+        default = f"{table}_default"
+        has_default = key is not None and self.has_table(default)
+        created = []
+        year, month = first_month.year, first_month.month
+        for _ in range(months):
+            next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+            name = f"{table}_y{year:04d}m{month:02d}"
+            if not self.has_table(name):
+                start, end = f"{year:04d}-{month:02d}-01", f"{next_year:04d}-{next_month:02d}-01"
+                create_sql = f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES FROM ('{start}') TO ('{end}')"
+                in_range = f"{key} >= '{start}' AND {key} < '{end}'"
+                if has_default and self.execute(f"SELECT 1 FROM {default} WHERE {in_range} LIMIT 1").first():
+                    self.execute(f"ALTER TABLE {table} DETACH PARTITION {default}")
+                    self.execute(create_sql)
+                    moved = self.execute(f"INSERT INTO {name} SELECT * FROM {default} WHERE {in_range}").rowcount
+                    self.execute(f"DELETE FROM {default} WHERE {in_range}")
+                    self.execute(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT")
+                    print(f"  moved {moved} rows from {default} into {name}")
+                else:
+                    self.execute(create_sql)
+                created.append(name)
+            year, month = next_year, next_month
+        return created
+
+    def backfill(self, table: str, set_sql: str, where_sql: str, batch_size: int = 5000, pause_seconds: float = 0.05) -> int:
+        """
+        Update rows matching where_sql in primary-key batches.
+
+        Each batch is its own short transaction when the migration is
+        non-transactional; pause_seconds throttles the load on a live table.
+        """
+        total = 0
+        while True:
+            result = self.execute(
+                f"UPDATE {table} SET {set_sql} WHERE id IN "
+                f"(SELECT id FROM {table} WHERE {where_sql} ORDER BY id LIMIT :batch_size)",
+                batch_size=batch_size,
+            )
+            updated = result.rowcount or 0
+            total += updated
+            if updated < batch_size:
+                break
+            print(f"  backfilled {total} rows in {table}")
+            if pause_seconds:
+                time.sleep(pause_seconds)
+        return total
+
+
+def discover() -> List[Migration]:
+    """Load all migration modules ordered by version"""
+    migrations = []
+    for filename in sorted(os.listdir(VERSIONS_DIR)):
+        match = MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        module = importlib.import_module(f"migrations.versions.{filename[:-3]}")
+        migrations.append(Migration(int(match.group(1)), match.group(2), module))
+    return migrations
+
+
+def _ensure_version_table(engine: Engine):
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at TIMESTAMP NOT NULL)"
+        ))
+
+
+def applied_versions(engine: Engine) -> List[int]:
+    _ensure_version_table(engine)
+    with engine.connect() as connection:
+        return [row[0] for row in connection.execute(text("SELECT version FROM schema_migrations ORDER BY version"))]
+
+
+def _apply(engine: Engine, migration: Migration):
+    print(f"Applying migration {migration.version:04d}_{migration.name}...")
+    started = time.perf_counter()
+    record = text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)")
+    params = {"version": migration.version, "name": migration.name, "applied_at": datetime.utcnow()}
+
+    if migration.transactional:
+        with engine.begin() as connection:
+            migration.module.upgrade(MigrationContext(connection))
+            connection.execute(record, params)
+    else:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            migration.module.upgrade(MigrationContext(connection))
+            connection.execute(record, params)
+
+    print(f"  done in {time.perf_counter() - started:.2f}s")
+
+
+def upgrade(engine: Optional[Engine] = None, target: Optional[int] = None) -> int:
+    """Apply pending migrations up to target (default: latest); returns how many ran"""
+    if engine is None:
+        from database import engine
+
+    applied = set(applied_versions(engine))
+    pending = [m for m in discover() if m.version not in applied and (target is None or m.version <= target)]
+    if not pending:
+        return 0
+
+    lock = None
+    if engine.dialect.name == "postgresql":
+        # Serialize concurrent migrators (e.g. several containers starting at once)
+        lock = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        lock.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+    try:
+        # Re-read under the lock in case another migrator got there first
+        applied = set(applied_versions(engine))
+        ran = 0
+        for migration in pending:
+            if migration.version not in applied:
+                _apply(engine, migration)
+                ran += 1
+        return ran
+    finally:
+        if lock is not None:
+            lock.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+            lock.close()
+
+
+def status(engine: Optional[Engine] = None) -> List[tuple]:
+    """List (version, name, applied) for every known migration"""
+    if engine is None:
+        from database import engine
+
+    applied = set(applied_versions(engine))
+    return [(m.version, m.name, m.version in applied) for m in discover()]
@@ -0,0 +1,42 @@
+"""
+Baseline schema: users and orders as originally created by init_db.
+
+The tables are defined here rather than taken from database.py so that later
+model changes only ever arrive through later migrations. checkfirst makes this
+a no-op on databases that were created with create_all before migrations.
+"""
+from datetime import datetime
+
+from sqlalchemy import JSON, Column, DateTime, Float, ForeignKey, Integer, MetaData, String, Table
+
+metadata = MetaData()
+
+users = Table(
+    "users",
+    metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String, nullable=False),
+    Column("email", String, unique=True, nullable=False, index=True),
+    Column("password_hash", String, nullable=False),
+    Column("created_at", DateTime, default=datetime.utcnow),
+)
+
+orders = Table(
+    "orders",
+    metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("order_id", String, unique=True, nullable=False, index=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False, index=True),
+    Column("customer_name", String, nullable=False),
+    Column("status", String, nullable=False),
+    Column("items", JSON, nullable=False),
+    Column("total", Float, nullable=False),
+    Column("date", DateTime, nullable=False),
+    Column("verification_codes", JSON),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+)
+
+
+def upgrade(ctx):
+    metadata.create_all(bind=ctx.connection, checkfirst=True)
@@ -0,0 +1,11 @@
+"""
+Composite index for "orders of a user, newest first" lookups.
+
+Built with CREATE INDEX CONCURRENTLY on PostgreSQL so writes to orders are
+not blocked while the index builds.
+"""
+TRANSACTIONAL = False
+
+
+def upgrade(ctx):
+    ctx.create_index("ix_orders_user_id_date", "orders", ["user_id", "date DESC"])
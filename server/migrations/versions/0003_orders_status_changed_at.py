@@ -0,0 +1,18 @@
+"""
+Add orders.status_changed_at and backfill it from updated_at.
+
+The column is added as nullable (no table rewrite) and backfilled in small,
+throttled batches, each committed on its own, so live tool queries keep
+running while existing rows are filled in.
+"""
+TRANSACTIONAL = False
+
+
+def upgrade(ctx):
+    ctx.add_column("orders", "status_changed_at", "TIMESTAMP")
+    updated = ctx.backfill(
+        "orders",
+        set_sql="status_changed_at = COALESCE(updated_at, created_at, date)",
+        where_sql="status_changed_at IS NULL",
+    )
+    print(f"  backfilled status_changed_at on {updated} orders")
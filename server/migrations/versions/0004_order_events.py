@@ -0,0 +1,77 @@
+"""
+Append-only order_events table for order status transitions.
+
+On PostgreSQL the table is range-partitioned by month on occurred_at, with a
+default partition catching anything outside the pre-created months. Existing
+orders get one backfilled event with their current status, inserted in
+throttled id-range batches.
+"""
+from datetime import date
+
+from sqlalchemy import JSON, BigInteger, Column, DateTime, Index, Integer, MetaData, String, Table
+
+TRANSACTIONAL = False
+BATCH_SIZE = 5000
+MONTHS_AHEAD = 3
+
+metadata = MetaData()
+
+order_events = Table(
+    "order_events",
+    metadata,
+    Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True),
+    Column("order_id", String, nullable=False),
+    Column("user_id", Integer, nullable=False),
+    Column("from_status", String),
+    Column("to_status", String, nullable=False),
+    Column("source", String, nullable=False),
+    Column("details", JSON),
+    Column("occurred_at", DateTime, nullable=False),
+    Index("ix_order_events_order_id", "order_id"),
+    Index("ix_order_events_order_id_occurred_at", "order_id", "occurred_at"),
+)
+
+
+def _create_partitioned(ctx):
+    ctx.execute(
+        "CREATE TABLE IF NOT EXISTS order_events ("
+        "id BIGINT GENERATED BY DEFAULT AS IDENTITY, "
+        "order_id VARCHAR NOT NULL, "
+        "user_id INTEGER NOT NULL, "
+        "from_status VARCHAR, "
+        "to_status VARCHAR NOT NULL, "
+        "source VARCHAR NOT NULL DEFAULT 'system', "
+        "details JSON, "
+        "occurred_at TIMESTAMP NOT NULL, "
+        "PRIMARY KEY (id, occurred_at)"
+        ") PARTITION BY RANGE (occurred_at)"
+    )
+    ctx.execute("CREATE TABLE IF NOT EXISTS order_events_default PARTITION OF order_events DEFAULT")
+    ctx.execute("CREATE INDEX IF NOT EXISTS ix_order_events_order_id ON order_events (order_id)")
+    ctx.execute("CREATE INDEX IF NOT EXISTS ix_order_events_order_id_occurred_at ON order_events (order_id, occurred_at)")
+
+    # Month partitions from the oldest order through a few months ahead
+    oldest = ctx.execute("SELECT MIN(date) FROM orders").scalar()
+    today = date.today()
+    first = date(oldest.year, oldest.month, 1) if oldest else date(today.year, today.month, 1)
+    months = (today.year - first.year) * 12 + (today.month - first.month) + 1 + MONTHS_AHEAD
+    ctx.create_month_partitions("order_events", first, months, key="occurred_at")
+
+
+def upgrade(ctx):
+    if ctx.is_postgres:
+        _create_partitioned(ctx)
+    else:
+        metadata.create_all(bind=ctx.connection, checkfirst=True)
+
+    # One event per existing order recording its current status
+    last_id = ctx.execute("SELECT COALESCE(MAX(id), 0) FROM orders").scalar()
+    for low in range(0, last_id, BATCH_SIZE):
+        ctx.execute(
+            "INSERT INTO order_events (order_id, user_id, from_status, to_status, source, occurred_at) "
+            "SELECT order_id, user_id, NULL, status, 'backfill', COALESCE(status_changed_at, updated_at, date) "
+            "FROM orders WHERE id > :low AND id <= :high "
+            "AND NOT EXISTS (SELECT 1 FROM order_events e WHERE e.order_id = orders.order_id)",
+            low=low,
+            high=low + BATCH_SIZE,
+        )
@@ -0,0 +1,57 @@
+"""
+conversations and messages tables for persisted chat transcripts.
+
+Both tables are new and empty, so a plain transactional create is enough.
+"""
+from datetime import datetime
+
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    UniqueConstraint,
+)
+
+metadata = MetaData()
+
+# Referenced by the foreign key only; not created here
+users = Table("users", metadata, Column("id", Integer, primary_key=True))
+
+conversations = Table(
+    "conversations",
+    metadata,
+    Column("id", String(36), primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=True),
+    Column("pending_approval", JSON, nullable=True),
+    Column("created_at", DateTime, nullable=False, default=datetime.utcnow),
+    Column("updated_at", DateTime, nullable=False, default=datetime.utcnow),
+    Index("ix_conversations_user_id", "user_id"),
+)
+
+messages = Table(
+    "messages",
+    metadata,
+    Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True),
+    Column("conversation_id", String(36), ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False),
+    Column("seq", Integer, nullable=False),
+    Column("role", String(16), nullable=False),
+    Column("content", Text, nullable=True),
+    Column("tool_calls", JSON, nullable=True),
+    Column("tool_call_id", String, nullable=True),
+    Column("created_at", DateTime, nullable=False, default=datetime.utcnow),
+    # Also serves rehydration: WHERE conversation_id = ? ORDER BY seq
+    UniqueConstraint("conversation_id", "seq", name="uq_messages_conversation_id_seq"),
+)
+
+
+def upgrade(ctx):
+    conversations.create(bind=ctx.connection, checkfirst=True)
+    messages.create(bind=ctx.connection, checkfirst=True)
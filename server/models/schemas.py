@@ -2,7 +2,9 @@
 Pydantic models for request/response validation
 """
 from pydantic import BaseModel, Field
-from typing import Optional, Dict
+from typing import Optional, Dict, List
+
+from config import ORDER_STATUS_BATCH_MAX
 
 
 # Auth Schemas
@@ -36,3 +38,8 @@ class ApprovalRequest(BaseModel):
     approved: bool
     userInput: Optional[str] = None
     current_user: Optional[Dict[str, str]] = None
+
+
+# Order Schemas
+class OrderStatusBatchRequest(BaseModel):
+    order_ids: List[str] = Field(..., min_length=1, max_length=ORDER_STATUS_BATCH_MAX)
@@ -1,13 +1,17 @@
 """
 Reset database - drop all tables and recreate with new schema
 """
+from sqlalchemy import text
+
 from database import init_db, Base, engine, SessionLocal, User, Order
 
 def reset_database():
     """Drop all tables and recreate them"""
     print("Dropping all tables...")
     Base.metadata.drop_all(bind=engine)
-    print("Creating tables with new schema...")
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS schema_migrations"))
+    print("Applying migrations...")
     init_db()
     print("Database reset complete!")
 
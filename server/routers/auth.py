@@ -2,11 +2,12 @@
 Authentication endpoints - register and login
 """
 from fastapi import APIRouter, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
-from database import SessionLocal, User
+from database import SessionLocal, User, mark_write, user_key
 from models.schemas import RegisterRequest, LoginRequest, TokenResponse
-from services.auth import get_password_hash, verify_password, create_access_token
+from services.auth import get_password_hash, verify_and_update_password, create_access_token
 
 router = APIRouter()
 
@@ -24,8 +25,8 @@ async def register(request: RegisterRequest):
                 detail="Email already registered",
             )
 
-        # Create new user with hashed password
-        hashed_password = get_password_hash(request.password)
+        # Create new user with hashed password (off the event loop, hashing is CPU-bound)
+        hashed_password = await run_in_threadpool(get_password_hash, request.password)
         new_user = User(
             name=request.name,
             email=request.email,
@@ -34,6 +35,7 @@ async def register(request: RegisterRequest):
         db.add(new_user)
         db.commit()
         db.refresh(new_user)
+        mark_write(f"email:{new_user.email}", user_key(new_user.id))
 
         # Create access token
         access_token = create_access_token(data={"sub": new_user.email})
@@ -70,13 +72,21 @@ async def login(request: LoginRequest):
                 detail="Invalid email or password",
             )
 
-        # Verify password
-        if not verify_password(request.password, user.password_hash):
+        # Verify password (off the event loop, hashing is CPU-bound)
+        valid, new_hash = await run_in_threadpool(
+            verify_and_update_password, request.password, user.password_hash
+        )
+        if not valid:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid email or password",
             )
 
+        # Transparently migrate hashes from an older scheme or cost
+        if new_hash:
+            user.password_hash = new_hash
+            db.commit()
+
         # Create access token
         access_token = create_access_token(data={"sub": user.email})
 
@@ -2,15 +2,19 @@
 Chat and approval endpoints
 """
 
-import asyncio
-from fastapi import APIRouter, Depends
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
 from sqlalchemy.orm import Session
 
 from database import SessionLocal, User
 from models.schemas import ChatRequest, ApprovalRequest
 from services.session_manager import session_manager
-from services.agent import process_agent_message, handle_approval
+from services.agent import run_chat_turn, handle_approval
+from services.agent_pool import agent_pool
 from services.auth import get_current_user
+from services.idempotency import idempotency_store
+from services.scheduler import agent_scheduler, SchedulerClosed
 
 router = APIRouter()
 
@@ -24,33 +28,66 @@ def get_user_dict(user: User) -> dict:
     }
 
 
+def submit_agent_job(session_id: str, user_dict: dict, kind: str, factory):
+    """Submit a background agent job, rejecting it while the server drains"""
+    try:
+        agent_scheduler.submit(session_id, user_dict["id"], kind, factory)
+    except SchedulerClosed as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+
 @router.post("/api/chat")
-async def chat(request: ChatRequest, current_user: User = Depends(get_current_user)):
+async def chat(
+    request: ChatRequest,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None),
+):
     """Handle chat messages"""
     # Convert user to dict and override current_user
     user_dict = get_user_dict(current_user)
 
-    # Get or create session with current_user info
-    session_id = request.session_id or session_manager.create_session(user_dict)
-
-    # Create database session for background task
-    async def process_with_db():
-        db = SessionLocal()
-        try:
-            await process_agent_message(request.message, session_id, db, user_dict)
-        finally:
-            db.close()
-
-    # Start processing in the background
-    asyncio.create_task(process_with_db())
-
-    # Return session ID
-    return {"session_id": session_id}
+    async def start_turn():
+        # Get (or load back from the database) the session, or create one with current_user info
+        if request.session_id:
+            if not await session_manager.ensure_session(request.session_id, current_user.id):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
+            session_id = request.session_id
+        else:
+            session_id = session_manager.create_session(user_dict)
+
+        # Buffer the message; turns for a session run one at a time
+        session_manager.queue_user_message(session_id, request.message)
+
+        # Create database session for background task
+        async def process_with_db():
+            db = SessionLocal()
+            try:
+                await run_chat_turn(session_id, db, user_dict)
+            finally:
+                db.close()
+
+        # Queue processing on the bounded agent scheduler
+        submit_agent_job(session_id, user_dict, "chat", process_with_db)
+
+        # Return session ID
+        return {"session_id": session_id}
+
+    # A retried request (same Idempotency-Key) gets the original session back
+    result, replayed = await idempotency_store.run(
+        idempotency_key, "chat", current_user.id, request.model_dump(exclude={"current_user"}), start_turn
+    )
+    if replayed:
+        response.headers["Idempotency-Replayed"] = "true"
+    return result
 
 
 @router.post("/api/approval")
 async def approval(
-    request: ApprovalRequest, current_user: User = Depends(get_current_user)
+    request: ApprovalRequest,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None),
 ):
     """Handle approval responses"""
     # Convert user to dict
@@ -60,9 +97,16 @@ async def approval(
     async def process_with_db():
         db = SessionLocal()
         try:
-            await handle_approval(
-                request.id, request.approved, request.userInput, db, user_dict
-            )
+            # Serialize with any chat turn running on the same session
+            async with session_manager.get_turn_lock(request.id):
+                if agent_pool.connected:
+                    await agent_pool.run(
+                        "approval", request.id, user_dict, approved=request.approved, user_input=request.userInput
+                    )
+                else:
+                    await handle_approval(
+                        request.id, request.approved, request.userInput, db, user_dict
+                    )
         except Exception as e:
             print(f"ERROR in approval processing: {e}")
             import traceback
@@ -72,7 +116,17 @@ async def approval(
         finally:
             db.close()
 
-    # Start processing in background (like chat endpoint)
-    asyncio.create_task(process_with_db())
+    async def start_approval():
+        if not await session_manager.ensure_session(request.id, current_user.id):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
+
+        # Queue processing on the bounded agent scheduler (like chat endpoint)
+        submit_agent_job(request.id, user_dict, "approval", process_with_db)
+        return {"status": "ok"}
 
-    return {"status": "ok"}
+    result, replayed = await idempotency_store.run(
+        idempotency_key, "approval", current_user.id, request.model_dump(exclude={"current_user"}), start_approval
+    )
+    if replayed:
+        response.headers["Idempotency-Replayed"] = "true"
+    return result
@@ -0,0 +1,50 @@
+"""
+Production debugging endpoints (disabled unless DEBUG_TOKEN is set)
+"""
+import asyncio
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from config import DEBUG_TOKEN, DEBUG_PROFILE_MAX_SECONDS, DEBUG_PROFILE_INTERVAL_SECONDS
+from services.loop_monitor import loop_monitor
+from services.profiler import ProfilerBusy, collapsed, sample
+
+router = APIRouter()
+
+
+def check_debug_token(token: Optional[str]):
+    """404 when debugging is disabled, 403 on a wrong token"""
+    if not DEBUG_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not token or not hmac.compare_digest(token, DEBUG_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid debug token")
+
+
+@router.get("/debug/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10, gt=0, le=DEBUG_PROFILE_MAX_SECONDS),
+    x_debug_token: Optional[str] = Header(None),
+):
+    """Sample all threads for N seconds; returns collapsed stacks for flamegraph tools"""
+    check_debug_token(x_debug_token)
+    try:
+        # Sampled from a worker thread so the event loop keeps serving (and shows up in the samples)
+        stacks = await asyncio.to_thread(sample, seconds, DEBUG_PROFILE_INTERVAL_SECONDS)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return PlainTextResponse(collapsed(stacks))
+
+
+@router.get("/debug/loop")
+async def loop_status(x_debug_token: Optional[str] = Header(None)):
+    """Current event-loop lag and the stacks of recent stalls"""
+    check_debug_token(x_debug_token)
+    return {
+        "lag_seconds": round(loop_monitor.lag, 4),
+        "max_lag_seconds": round(loop_monitor.max_lag, 4),
+        "block_threshold_seconds": loop_monitor.block_threshold,
+        "recent_blocks": loop_monitor.recent_blocks(),
+    }
@@ -2,25 +2,34 @@
 SSE event streaming endpoints
 """
 import asyncio
-import json
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
 from fastapi import APIRouter
 from fastapi.responses import StreamingResponse
 
+from services.auth import user_from_token
 from services.session_manager import session_manager
+from services.metrics import sse_connections
+from services.serialization import sse_event
+from services.scheduler import agent_scheduler
 
 router = APIRouter()
 
 
-async def event_stream(session_id: str) -> AsyncGenerator[str, None]:
+async def event_stream(session_id: str, user_id: Optional[int]) -> AsyncGenerator[bytes, None]:
     """Generate SSE events for a session"""
     print(f"DEBUG: New SSE stream for session {session_id}")
 
-    # Check if session exists
-    session = session_manager.get_session(session_id)
+    if user_id is not None:
+        # The owner's session, loaded back from the database after a restart if needed
+        session = await session_manager.ensure_session(session_id, user_id)
+    else:
+        # Without a token only an ownerless session already in memory can be streamed
+        session = session_manager.get_session(session_id)
+        if session is not None and session.get("user_id") is not None:
+            session = None
     if not session:
         print(f"DEBUG: Session {session_id} not found")
-        yield f"data: {json.dumps({'type': 'error', 'data': {'message': 'Session not found'}})}\n\n"
+        yield sse_event({"type": "error", "data": {"message": "Session not found"}})
         return
 
     # Get or create event queue for this session (don't create new queue on reconnect)
@@ -29,6 +38,9 @@ async def event_stream(session_id: str) -> AsyncGenerator[str, None]:
         print(f"DEBUG: No queue for session {session_id}, creating new one")
         queue = session_manager.get_or_create_event_queue(session_id)
 
+    sse_connections.inc()
+    session_manager.stream_opened(session_id)
+    agent_scheduler.client_connected(session_id)
     try:
         # First, drain any pending events that might be in the queue
         print(f"DEBUG: Starting event stream for session {session_id}, queue size: {queue.qsize()}")
@@ -40,21 +52,27 @@ async def event_stream(session_id: str) -> AsyncGenerator[str, None]:
                 # Use a timeout to avoid hanging forever
                 event = await asyncio.wait_for(queue.get(), timeout=30.0)
                 print(f"DEBUG: Got event for session {session_id}: {event.get('type')}, data: {str(event.get('data', {}))[:100]}")
-                yield f"data: {json.dumps(event)}\n\n"
+                yield sse_event(event)
             except asyncio.TimeoutError:
                 # Send a keepalive comment to keep the connection alive
-                yield ":keepalive\n\n"
+                yield b":keepalive\n\n"
     except asyncio.CancelledError:
         # Client disconnected - don't cleanup session or queue, it may reconnect
         print(f"DEBUG: SSE stream cancelled for session {session_id}")
         pass
+    finally:
+        sse_connections.dec()
+        session_manager.stream_closed(session_id)
+        # Cancel this session's agent jobs if the client does not reconnect
+        agent_scheduler.client_disconnected(session_id)
 
 
 @router.get("/api/events")
-async def events(session_id: str):
-    """SSE endpoint for real-time events"""
+async def events(session_id: str, token: Optional[str] = None):
+    """SSE endpoint for real-time events (EventSource cannot set headers, so the JWT comes as ?token=)"""
+    user_id = user_from_token(token).id if token else None
     return StreamingResponse(
-        event_stream(session_id),
+        event_stream(session_id, user_id),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -79,6 +97,8 @@ async def root():
             "POST /api/chat": "Send chat message",
             "GET /api/events": "SSE event stream",
             "POST /api/approval": "Handle approval",
+            "POST /api/orders/status:batch": "Status of many orders (NDJSON)",
             "GET /health": "Health check",
+            "GET /metrics": "Prometheus metrics",
         },
     }
@@ -0,0 +1,15 @@
+"""
+Prometheus metrics endpoint
+"""
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from services.metrics import registry
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Export application metrics in Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
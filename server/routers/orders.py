@@ -0,0 +1,37 @@
+"""
+Order endpoints for non-conversational clients (no LLM involved)
+"""
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+
+from database import User, read_session, user_key
+from models.schemas import OrderStatusBatchRequest
+from routers.chat import get_user_dict
+from services.auth import get_current_user
+from services.metrics import registry
+from services.serialization import dumpb
+from services.tools import get_order_statuses
+
+router = APIRouter()
+
+order_status_batch_orders_total = registry.counter(
+    "order_status_batch_orders_total", "Orders looked up through the batch status API", ("outcome",)
+)
+
+
+@router.post("/api/orders/status:batch")
+async def order_status_batch(request: OrderStatusBatchRequest, current_user: User = Depends(get_current_user)):
+    """Stream the status of many orders as NDJSON (one JSON object per line)"""
+    user_dict = get_user_dict(current_user)
+
+    def stream():
+        # Sync generator: Starlette iterates it in a worker thread
+        db = read_session(user_key(user_dict["id"]))
+        try:
+            for result in get_order_statuses(db, request.order_ids, user_dict):
+                order_status_batch_orders_total.inc(1, "found" if result["success"] else "not_found")
+                yield dumpb(result) + b"\n"
+        finally:
+            db.close()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -1,14 +1,18 @@
 """
 Database seeding script for Kunjal Agents.
+
+Seeds the demo users and orders. For production-sized load-test data use
+datagen.py, which generates millions of rows with bulk loads.
 """
 
 import sys
 from datetime import datetime
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
 sys.path.insert(0, ".")
-from database import engine, SessionLocal, User, Order, init_db
-from services.auth import get_password_hash
+from database import engine, SessionLocal, User, Order, OrderEvent, Conversation, ChatMessage, init_db
+from services.auth import get_shared_password_hash
 
 
 def seed_database():
@@ -20,6 +24,9 @@ def seed_database():
 
     try:
         print("Clearing existing data...")
+        session.query(ChatMessage).delete()
+        session.query(Conversation).delete()
+        session.query(OrderEvent).delete()
         session.query(Order).delete()
         session.query(User).delete()
         session.commit()
@@ -38,19 +45,15 @@ def seed_database():
             },
         ]
 
-        users = []
+        # Hash each distinct password once and insert all users in one batch
         for user_data in users_data:
-            password_hash = get_password_hash(user_data.pop("password"))
-            user = User(**user_data, password_hash=password_hash)
-            session.add(user)
-            session.flush()
-            users.append(user)
+            user_data["password_hash"] = get_shared_password_hash(user_data.pop("password"))
 
+        session.execute(insert(User), users_data)
         session.commit()
-        print(f"Created {len(users)} users")
 
-        for user in users:
-            session.refresh(user)
+        users = session.query(User).filter(User.email.in_([u["email"] for u in users_data])).all()
+        print(f"Created {len(users)} users")
 
         print("Creating orders...")
         base_time = 1708000000
@@ -134,14 +137,23 @@ def seed_database():
             },
         ]
 
-        orders = []
         for order_data in order_templates:
-            order = Order(**order_data)
-            session.add(order)
-            orders.append(order)
+            order_data["verification_codes"] = []
+            order_data["status_changed_at"] = order_data["date"]
 
+        session.execute(insert(Order), order_templates)
+        session.execute(insert(OrderEvent), [
+            {
+                "order_id": order["order_id"],
+                "user_id": order["user_id"],
+                "to_status": order["status"],
+                "source": "seed",
+                "occurred_at": order["date"],
+            }
+            for order in order_templates
+        ])
         session.commit()
-        print(f"Created {len(orders)} orders")
+        print(f"Created {len(order_templates)} orders")
 
         for user in users:
             order_count = session.query(Order).filter_by(user_id=user.id).count()
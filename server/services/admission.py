@@ -0,0 +1,300 @@
+"""
+Admission control: token-bucket rate limits and load shedding
+
+Chat, approval and login requests are checked before any handler runs:
+- 503 when the process is overloaded (event-loop lag or agent backlog above
+  its threshold), so new agent work is refused before it queues
+- 429 when the caller's per-user or per-IP token bucket is empty
+
+Both carry Retry-After. Buckets live in process memory by default; set
+RATE_LIMIT_BACKEND=redis to share them between API processes.
+"""
+import importlib.util
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from config import (
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_BACKEND,
+    REDIS_URL,
+    RATE_LIMIT_CHAT_PER_MINUTE,
+    RATE_LIMIT_CHAT_BURST,
+    RATE_LIMIT_APPROVAL_PER_MINUTE,
+    RATE_LIMIT_APPROVAL_BURST,
+    RATE_LIMIT_LOGIN_PER_MINUTE,
+    RATE_LIMIT_LOGIN_BURST,
+    RATE_LIMIT_IP_MULTIPLIER,
+    RATE_LIMIT_TRUST_FORWARDED_FOR,
+    ADMISSION_MAX_LOOP_LAG_SECONDS,
+    ADMISSION_MAX_AGENT_JOBS,
+)
+from services.auth import decode_token
+from services.loop_monitor import loop_monitor
+from services.metrics import registry
+from services.scheduler import agent_scheduler
+from services.serialization import dumpb, loads
+
+admission_rejections_total = registry.counter(
+    "admission_rejections_total", "Requests rejected before reaching a handler", ("route", "reason")
+)
+
+# Login bodies are tiny; anything larger is passed through unparsed
+MAX_INSPECTED_BODY = 4096
+
+
+# ============================================================================
+# Token Buckets
+# ============================================================================
+
+class MemoryBuckets:
+    """Per-process token buckets, least recently used keys evicted first"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    def _refill(self, key: str, rate: float, burst: int, now: float) -> List[float]:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(burst), now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        return bucket
+
+    async def take(self, buckets: List[Tuple[str, float, int]]) -> Tuple[float, Optional[int]]:
+        """
+        Take one token from every (key, rate, burst) bucket, or from none.
+        Returns (0, None) if allowed, else the longest wait in seconds and the
+        index of that bucket.
+        """
+        now = time.monotonic()
+        states = [self._refill(key, rate, burst, now) for key, rate, burst in buckets]
+        waits = [(1 - state[0]) / rate if state[0] < 1 else 0.0 for state, (_, rate, _) in zip(states, buckets)]
+        wait = max(waits)
+        if wait > 0:
+            return wait, waits.index(wait)
+        for state in states:
+            state[0] -= 1
+        return 0.0, None
+
+
+# Refill every bucket, then take from all of them or none, atomically on the Redis server
+TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local tokens, wait, blocked = {}, 0, 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i])
+    local burst = tonumber(ARGV[2 * i + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local ts = tonumber(state[2]) or now
+    tokens[i] = math.min(burst, (tonumber(state[1]) or burst) + math.max(0, now - ts) * rate)
+    if tokens[i] < 1 and (1 - tokens[i]) / rate > wait then
+        wait = (1 - tokens[i]) / rate
+        blocked = i
+    end
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i])
+    local burst = tonumber(ARGV[2 * i + 1])
+    if wait == 0 then
+        tokens[i] = tokens[i] - 1
+    end
+    redis.call('HSET', key, 'tokens', tokens[i], 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+end
+return {tostring(wait), blocked}
+"""
+
+
+class RedisBuckets:
+    """Token buckets shared by every API process through Redis (one node: a request's keys span slots)"""
+
+    def __init__(self, url: str, fallback: MemoryBuckets):
+        import redis.asyncio as redis
+
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(TAKE_SCRIPT)
+        self._fallback = fallback
+
+    async def take(self, buckets: List[Tuple[str, float, int]]) -> Tuple[float, Optional[int]]:
+        args = [time.time()]
+        for _, rate, burst in buckets:
+            args += [rate, burst]
+        try:
+            wait, blocked = await self._script(keys=[f"ratelimit:{key}" for key, _, _ in buckets], args=args)
+        except Exception as e:
+            # Keep limiting per process rather than failing every request
+            print(f"DEBUG: Rate limit backend unavailable, using local buckets: {e}")
+            return await self._fallback.take(buckets)
+        wait = float(wait)
+        return (wait, int(blocked) - 1) if wait else (0.0, None)
+
+
+def build_buckets(backend: str = RATE_LIMIT_BACKEND):
+    memory = MemoryBuckets()
+    if backend == "redis":
+        if importlib.util.find_spec("redis") is None:
+            print("Warning: redis is not installed, falling back to in-memory rate limits")
+            return memory
+        return RedisBuckets(REDIS_URL, memory)
+    return memory
+
+
+# ============================================================================
+# Policies
+# ============================================================================
+
+class Limit:
+    __slots__ = ("rate", "burst")
+
+    def __init__(self, per_minute: float, burst: int):
+        self.rate = per_minute / 60.0
+        self.burst = max(1, burst)
+
+
+def _policy(per_minute: float, burst: int) -> Dict[str, Limit]:
+    """Per-user limit plus a looser per-IP limit"""
+    return {
+        "user": Limit(per_minute, burst),
+        "ip": Limit(per_minute * RATE_LIMIT_IP_MULTIPLIER, round(burst * RATE_LIMIT_IP_MULTIPLIER)),
+    }
+
+
+# (method, path) -> limits; login is keyed by the submitted email instead of a token
+POLICIES: Dict[Tuple[str, str], Dict[str, Limit]] = {
+    ("POST", "/api/chat"): _policy(RATE_LIMIT_CHAT_PER_MINUTE, RATE_LIMIT_CHAT_BURST),
+    ("POST", "/api/approval"): _policy(RATE_LIMIT_APPROVAL_PER_MINUTE, RATE_LIMIT_APPROVAL_BURST),
+    ("POST", "/api/auth/login"): _policy(RATE_LIMIT_LOGIN_PER_MINUTE, RATE_LIMIT_LOGIN_BURST),
+}
+
+# Routes that start agent work and are shed under load
+AGENT_ROUTES = {"/api/chat", "/api/approval"}
+
+
+def overload_reason() -> Optional[str]:
+    """Why new agent work should be refused right now, if at all"""
+    if loop_monitor.lag > ADMISSION_MAX_LOOP_LAG_SECONDS:
+        return "loop_lag"
+    if agent_scheduler.running + agent_scheduler.queued >= ADMISSION_MAX_AGENT_JOBS:
+        return "agent_backlog"
+    return None
+
+
+# ============================================================================
+# ASGI Middleware
+# ============================================================================
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def client_ip(scope) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED_FOR:
+        forwarded = _header(scope, b"x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def token_subject(scope) -> Optional[str]:
+    """User of a valid bearer token; invalid tokens are left for the handler to reject"""
+    authorization = _header(scope, b"authorization")
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+    try:
+        return decode_token(authorization[7:]).get("sub")
+    except HTTPException:
+        return None
+
+
+async def _read_body(receive) -> Tuple[bytes, list]:
+    """Read up to MAX_INSPECTED_BODY bytes, returning the body and the messages to replay"""
+    messages, body = [], b""
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            return body, messages
+        body += message.get("body", b"")
+        if not message.get("more_body") or len(body) > MAX_INSPECTED_BODY:
+            return body, messages
+
+
+async def _reject(send, status: int, detail: str, retry_after: float):
+    body = dumpb({"detail": detail})
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying POLICIES and load shedding before routing"""
+
+    def __init__(self, app, enabled: bool = RATE_LIMIT_ENABLED):
+        self.app = app
+        self.enabled = enabled
+        self.buckets = build_buckets()
+
+    async def __call__(self, scope, receive, send):
+        policy = POLICIES.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" and self.enabled else None
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        if path in AGENT_ROUTES:
+            reason = overload_reason()
+            if reason:
+                admission_rejections_total.inc(1, path, reason)
+                await _reject(send, 503, "Server is busy, please retry shortly", ADMISSION_MAX_LOOP_LAG_SECONDS * 2)
+                return
+
+        if path == "/api/auth/login":
+            body, messages = await _read_body(receive)
+            try:
+                user = str(loads(body).get("email", "")).lower() or None
+            except (ValueError, AttributeError):
+                user = None
+            replay = iter(messages)
+
+            async def receive_replay():
+                message = next(replay, None)
+                return message if message is not None else await receive()
+
+            downstream_receive = receive_replay
+        else:
+            user = token_subject(scope)
+            downstream_receive = receive
+
+        keys = [("ip", f"ip:{client_ip(scope)}")]
+        if user:
+            keys.append(("user", f"user:{user}"))
+        # Debit every bucket only if all of them allow the request
+        wait, blocked = await self.buckets.take(
+            [(f"{path}:{key}", policy[scope_name].rate, policy[scope_name].burst) for scope_name, key in keys]
+        )
+        if wait:
+            admission_rejections_total.inc(1, path, f"rate_limit_{keys[blocked][0]}")
+            await _reject(send, 429, "Too many requests, please slow down", wait)
+            return
+
+        await self.app(scope, downstream_receive, send)
@@ -2,15 +2,147 @@
 Agent processing logic for chat and approval handling
 """
 import asyncio
-import json
 import uuid
 from typing import Optional, Dict, AsyncGenerator
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
 
-from config import client, MODEL, SYSTEM_PROMPT, tools
+from config import (
+    SYSTEM_PROMPT,
+    tools,
+    CHAT_COALESCE_MESSAGES,
+    CHAT_COALESCE_WINDOW_SECONDS,
+    ORDER_PREFETCH_ENABLED,
+    APPROVAL_TEMPLATE_RESPONSES,
+    FAQ_ANSWERS_ENABLED,
+)
 from services.session_manager import session_manager
-from services.tools import get_order_status, generate_cancellation_code, cancel_order_with_verification
+from database import read_session
+from services.tools import (
+    get_order_status,
+    get_order_timeline,
+    generate_cancellation_code,
+    generate_bulk_cancellation_code,
+    cancel_order_with_verification,
+    cancel_orders_with_verification,
+    sticky_keys,
+)
+from services.metrics import registry, record_tool_result
+from services.llm import create_completion, LLMDeadlineExceeded
+from services.budget import TurnBudget, BudgetExceeded, DEADLINE
+from services.model_router import model_router, turn_context_for
+from services.history import History, Message, ToolCall
+from services.prefetch import OrderPrefetch
+from services.responses import render_cancellation_result, render_cancellation_declined
+from services.faq import answer_faq
+from services.serialization import ToolArgumentDecoder, ToolArgumentsError, dumps
+from services.agent_pool import agent_pool
+
+# Validates tool-call arguments against the tool schemas in config.tools
+tool_arguments = ToolArgumentDecoder(tools)
+
+# Tools that stop the turn and wait for the user's verification code
+APPROVAL_TOOLS = {
+    "generate_cancellation_code": generate_cancellation_code,
+    "generate_bulk_cancellation_code": generate_bulk_cancellation_code,
+}
+
+approval_responses_total = registry.counter(
+    "approval_responses_total", "Replies after an approval by how they were produced", ("mode",)
+)
+chat_messages_coalesced_total = registry.counter(
+    "chat_messages_coalesced_total", "User messages merged into an earlier turn instead of a separate model call"
+)
+
+
+async def run_chat_turn(session_id: str, db: Session = None, current_user: Optional[Dict[str, str]] = None):
+    """Run one serialized agent turn for the user messages queued on a session"""
+    async with session_manager.get_turn_lock(session_id):
+        if CHAT_COALESCE_MESSAGES and CHAT_COALESCE_WINDOW_SECONDS > 0:
+            # Give rapid follow-up messages a chance to join this turn
+            await asyncio.sleep(CHAT_COALESCE_WINDOW_SECONDS)
+
+        messages = session_manager.take_user_messages(session_id, coalesce=CHAT_COALESCE_MESSAGES)
+        if not messages:
+            # An earlier turn already answered this message together with its own
+            print(f"DEBUG: No queued messages for session {session_id}, turn was coalesced")
+            return
+
+        if len(messages) > 1:
+            print(f"DEBUG: Coalescing {len(messages)} messages into one turn for session {session_id}")
+            chat_messages_coalesced_total.inc(len(messages) - 1)
+
+        message = "\n\n".join(messages)
+        if agent_pool.connected:
+            # Model calls and tools run in an agent worker process (services/agent_pool.py)
+            await agent_pool.run("chat", session_id, current_user, message=message)
+        else:
+            await process_agent_message(message, session_id, db, current_user)
+
+
+async def emit_assistant_message(session_id: str, history: History, response_text: str):
+    """Send the assistant's final reply for a turn and record it in history"""
+    print(f"DEBUG: Sending message event to session {session_id}: {response_text[:50]}...")
+    await session_manager.emit_event(
+        session_id,
+        "message",
+        {
+            "id": str(uuid.uuid4()),
+            "role": "assistant",
+            "content": response_text,
+            "timestamp": None,
+        },
+    )
+
+    # Add to history
+    history.append(Message.assistant(response_text))
+
+    # Emit done event
+    print(f"DEBUG: Sending done event to session {session_id}")
+    await session_manager.emit_event(session_id, "done", {})
+
+
+async def continue_after_approval(session_id: str, history: History, reply: Optional[str], db: Session, current_user: Optional[Dict[str, str]]):
+    """Answer a resolved approval from a template when possible, otherwise with another model call"""
+    if reply is not None and APPROVAL_TEMPLATE_RESPONSES:
+        approval_responses_total.inc(1, "template")
+        await emit_assistant_message(session_id, history, reply)
+        return
+
+    approval_responses_total.inc(1, "model")
+    print(f"DEBUG: Continuing agent processing for session {session_id}")
+    await process_agent_message("", session_id, db, current_user)
+
+
+async def request_cancellation_approval(session_id: str, tool_call_id: str, result: dict):
+    """Store the pending cancellation and ask the client for the verification code"""
+    order_ids = result.get("order_ids")
+
+    # Store pending approval (order_ids for a bulk cancellation, order_id for one order)
+    session_manager.set_pending_approval(session_id, {
+        "order_id": result.get("order_id"),
+        "order_ids": order_ids,
+        "code": result["code"],
+        "tool_call_id": tool_call_id,
+        "user_email": result.get("user_email"),
+        "user_name": result.get("user_name"),
+    })
+
+    if order_ids:
+        subject = f"orders {', '.join(order_ids)}"
+    else:
+        subject = f"order {result['order_id']}"
+
+    await session_manager.emit_event(
+        session_id,
+        "approval",
+        {
+            "id": session_id,
+            "message": f"A verification code has been sent to your email address for {subject}. Please check your email (including spam/junk folder) and enter the 6-digit code below to confirm the cancellation.",
+            "type": "input",
+            "placeholder": "Enter verification code from email",
+        },
+    )
 
 
 async def process_agent_message(message: str, session_id: str, db: Session = None, current_user: Optional[Dict[str, str]] = None):
@@ -26,7 +158,14 @@ async def process_agent_message(message: str, session_id: str, db: Session = Non
 
     # Add user message to history
     if message:
-        history.append({"role": "user", "content": message})
+        history.append(Message.user(message))
+
+    # Clear shipping/refund/support-hours questions are answered without a model call
+    if FAQ_ANSWERS_ENABLED and message:
+        answer = answer_faq(message)
+        if answer:
+            await emit_assistant_message(session_id, history, answer)
+            return
 
     # Get current user info from session if not provided
     if not current_user and session.get("user_id"):
@@ -44,127 +183,125 @@ async def process_agent_message(message: str, session_id: str, db: Session = Non
         system_prompt += f"- Name: {current_user.get('name')}\n"
         system_prompt += f"- Email: {current_user.get('email')}\n"
 
+    # Model calls, tokens and wall-clock time for this turn (all model calls share one deadline)
+    budget = TurnBudget("web")
+
+    # Load orders named in the message while the first model call is in flight
+    prefetch = OrderPrefetch.start(message, current_user) if ORDER_PREFETCH_ENABLED and message else None
+
     try:
         while True:
-            # Call the model
-            response = client.chat.completions.create(
-                model=MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    *history,
-                ],
-                tools=tools,
-                tool_choice="auto",
-                stream=False,
-            )
+            # Pick a model for this call, then call it (retries, hedging and
+            # circuit breaking live in services/llm.py)
+            route = model_router.choose(turn_context_for(history, failures=session.get("llm_failures", 0)))
+            print(f"DEBUG: Routing model call to {route.model} ({route.tier}: {route.reason})")
+            budget.start_call()
+            try:
+                response = await create_completion(
+                    messages=history.payload(system_prompt),
+                    model=route.model,
+                    deadline=budget.deadline,
+                    max_tokens=budget.remaining_completion_tokens(),
+                    tools=tools,
+                    tool_choice="auto",
+                    stream=False,
+                )
+            except LLMDeadlineExceeded:
+                session["llm_failures"] = session.get("llm_failures", 0) + 1
+                raise budget.exceeded(DEADLINE)
+            except Exception:
+                # Escalate to a larger model on the next turn
+                session["llm_failures"] = session.get("llm_failures", 0) + 1
+                raise
+            session["llm_failures"] = 0
+            budget.record_openai_usage(getattr(response, "usage", None))
 
             msg = response.choices[0].message
 
             if msg.tool_calls:
                 # Add assistant message with tool calls to history
                 history.append(
-                    {
-                        "role": "assistant",
-                        "content": msg.content,
-                        "tool_calls": [
-                            {
-                                "id": tc.id,
-                                "type": tc.type,
-                                "function": {
-                                    "name": tc.function.name,
-                                    "arguments": tc.function.arguments,
-                                },
-                            }
-                            for tc in msg.tool_calls
-                        ],
-                    }
+                    Message.assistant(
+                        msg.content,
+                        [ToolCall(tc.id, tc.function.name, tc.function.arguments) for tc in msg.tool_calls],
+                    )
                 )
 
                 # Process each tool call
                 for tool_call in msg.tool_calls:
                     func_name = tool_call.function.name
-                    func_args = json.loads(tool_call.function.arguments)
+                    try:
+                        func_args = tool_arguments.decode(func_name, tool_call.function.arguments)
+                    except ToolArgumentsError as e:
+                        # Let the model correct the call instead of failing the turn
+                        result = {"success": False, "error": f"Invalid arguments for {func_name}: {e}"}
+                        record_tool_result(func_name, result)
+                        history.append(Message.tool(tool_call.id, dumps(result)))
+                        continue
 
                     print(f"DEBUG: Calling tool {func_name} with args {func_args}")
 
                     if func_name == "get_order_status":
-                        result = get_order_status(db, **func_args, current_user=current_user)
+                        result = await prefetch.take(func_args.get("order_id")) if prefetch else None
+                        if result is None:
+                            # Read-only: served by the replica unless this user/order was just written
+                            with read_session(*sticky_keys(func_args.get("order_id"), current_user)) as read_db:
+                                result = get_order_status(read_db, **func_args, current_user=current_user)
                         print(f"DEBUG: get_order_status result: {result}")
 
-                    elif func_name == "generate_cancellation_code":
-                        result = generate_cancellation_code(db, **func_args, current_user=current_user)
-                        print(f"DEBUG: generate_cancellation_code result: {result}")
+                    elif func_name == "get_order_timeline":
+                        with read_session(*sticky_keys(func_args.get("order_id"), current_user)) as read_db:
+                            result = get_order_timeline(read_db, **func_args, current_user=current_user)
+                        print(f"DEBUG: get_order_timeline result: {result}")
+
+                    elif func_name in APPROVAL_TOOLS:
+                        if prefetch:
+                            for order_id in func_args.get("order_ids") or [func_args.get("order_id")]:
+                                prefetch.invalidate(order_id)
+                        result = APPROVAL_TOOLS[func_name](db, **func_args, current_user=current_user)
+                        print(f"DEBUG: {func_name} result: {result}")
+                        record_tool_result(func_name, result)
 
                         # If approval required, emit approval event
                         if result.get("requires_approval"):
-                            order_id = result["order_id"]
-
-                            # Store pending approval
-                            session["pending_approval"] = {
-                                "order_id": order_id,
-                                "code": result["code"],
-                                "tool_call_id": tool_call.id,
-                                "user_email": result.get("user_email"),
-                                "user_name": result.get("user_name"),
-                            }
-
-                            # Emit approval event
-                            await session_manager.emit_event(
-                                session_id,
-                                "approval",
-                                {
-                                    "id": session_id,
-                                    "message": f"A verification code has been sent to your email address for order {order_id}. Please check your email (including spam/junk folder) and enter the 6-digit code below to confirm the cancellation.",
-                                    "type": "input",
-                                    "placeholder": "Enter verification code from email",
-                                },
-                            )
+                            await request_cancellation_approval(session_id, tool_call.id, result)
                             return  # Wait for approval
 
                     elif func_name == "cancel_order_with_verification":
+                        if prefetch:
+                            prefetch.invalidate(func_args.get("order_id"))
                         result = cancel_order_with_verification(db, **func_args, current_user=current_user)
 
                     else:
                         result = {"error": "Unknown tool"}
 
+                    if func_name not in APPROVAL_TOOLS:
+                        record_tool_result(func_name, result)
+
                     # Add tool result to history
-                    history.append(
-                        {
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "content": json.dumps(result),
-                        }
-                    )
+                    history.append(Message.tool(tool_call.id, dumps(result)))
 
             else:
                 # No tool calls, emit message
-                response_text = msg.content or ""
-
-                print(f"DEBUG: Sending message event to session {session_id}: {response_text[:50]}...")
-                await session_manager.emit_event(
-                    session_id,
-                    "message",
-                    {
-                        "id": str(uuid.uuid4()),
-                        "role": "assistant",
-                        "content": response_text,
-                        "timestamp": None,
-                    },
-                )
-
-                # Add to history
-                history.append({"role": "assistant", "content": response_text})
-
-                # Emit done event
-                print(f"DEBUG: Sending done event to session {session_id}")
-                await session_manager.emit_event(session_id, "done", {})
+                await emit_assistant_message(session_id, history, msg.content or "")
                 break
 
+    except asyncio.CancelledError:
+        # Cancelled between a tool-call message and its results (e.g. in prefetch.take)
+        session_manager.answer_cancelled_tool_calls(session_id)
+        raise
+    except BudgetExceeded as e:
+        # The history is consistent here: every tool call already has its result
+        await session_manager.emit_event(session_id, "budget_exceeded", e.event())
+        await session_manager.emit_event(session_id, "done", {})
     except Exception as e:
         print(f"DEBUG: Exception in process_agent_message: {e}")
         import traceback
         traceback.print_exc()
         await session_manager.emit_event(session_id, "error", {"message": str(e)})
+    finally:
+        if prefetch:
+            prefetch.finish()
 
 
 async def handle_approval(
@@ -204,31 +341,35 @@ async def handle_approval(
             "verification_code": user_input,
         }
 
-        print(f"DEBUG: Executing cancellation for order {pending['order_id']} with code {user_input}")
-        # Execute the cancellation
-        cancellation_result = cancel_order_with_verification(
-            db, pending["order_id"], user_input, current_user=current_user
-        )
+        if pending.get("order_ids"):
+            # Bulk cancellation: one code, one transaction for the whole set
+            print(f"DEBUG: Executing cancellation for orders {pending['order_ids']} with code {user_input}")
+            cancellation_result = cancel_orders_with_verification(
+                db, pending["order_ids"], user_input, current_user=current_user
+            )
+            record_tool_result("cancel_orders_with_verification", cancellation_result)
+        else:
+            print(f"DEBUG: Executing cancellation for order {pending['order_id']} with code {user_input}")
+            # Execute the cancellation
+            cancellation_result = cancel_order_with_verification(
+                db, pending["order_id"], user_input, current_user=current_user
+            )
+            record_tool_result("cancel_order_with_verification", cancellation_result)
         print(f"DEBUG: Cancellation result: {cancellation_result}")
 
         if not cancellation_result.get("success"):
             print(f"DEBUG: Cancellation failed: {cancellation_result.get('error')}")
 
         # Add tool result
-        history.append(
-            {
-                "role": "tool",
-                "tool_call_id": pending["tool_call_id"],
-                "content": json.dumps(cancellation_result),
-            }
-        )
+        history.append(Message.tool(pending["tool_call_id"], dumps(cancellation_result)))
 
         # Clear pending approval
-        session["pending_approval"] = None
+        session_manager.set_pending_approval(session_id, None)
 
-        print(f"DEBUG: Continuing agent processing for session {session_id}")
-        # Continue processing
-        await process_agent_message("", session_id, db, current_user)
+        # Well-known outcomes are answered locally; anything else goes back to the model
+        await continue_after_approval(
+            session_id, history, render_cancellation_result(cancellation_result, pending), db, current_user
+        )
 
     else:
         # User rejected
@@ -239,16 +380,9 @@ async def handle_approval(
 
         print(f"DEBUG: User rejected cancellation")
         # Add tool result
-        history.append(
-            {
-                "role": "tool",
-                "tool_call_id": pending["tool_call_id"],
-                "content": json.dumps(result),
-            }
-        )
+        history.append(Message.tool(pending["tool_call_id"], dumps(result)))
 
         # Clear pending approval
-        session["pending_approval"] = None
+        session_manager.set_pending_approval(session_id, None)
 
-        # Continue processing
-        await process_agent_message("", session_id, db, current_user)
+        await continue_after_approval(session_id, history, render_cancellation_declined(pending), db, current_user)
@@ -0,0 +1,322 @@
+"""
+Agent worker pool: run agent turns outside the web process
+
+With AGENT_WORKERS_ENABLED the web tier keeps sessions, SSE streams, the
+scheduler, turn locks and transcripts, and hands each turn's model calls and
+tools to a pool of agent worker processes (python agent_worker.py). A job
+carries a snapshot of the session; the worker runs process_agent_message or
+handle_approval on it and sends back events, appended history messages and
+pending-approval changes, which the web tier applies as if the turn had run
+locally.
+
+Jobs and replies go through a small broker (a multiprocessing manager hosted
+by agent_worker.py): one job queue that idle workers pull from and a reply
+queue for the web process. Only the worker tier scales out: sessions live in
+the web process's memory, so the API runs as a single process. While
+the broker is unreachable, turns run in the web process.
+"""
+import asyncio
+import ipaddress
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from multiprocessing.managers import BaseManager, DictProxy
+from typing import Dict, Optional, Tuple
+
+from config import (
+    AGENT_WORKERS_ENABLED,
+    AGENT_BROKER_ADDRESS,
+    AGENT_BROKER_AUTHKEY,
+    AGENT_BROKER_DEFAULT_AUTHKEY,
+    AGENT_WORKER_REPLY_TIMEOUT_SECONDS,
+)
+from database import apply_write_ages, write_ages
+from services.history import Message
+from services.metrics import registry
+from services.session_manager import session_manager
+
+agent_pool_jobs_total = registry.counter(
+    "agent_pool_jobs_total", "Agent turns sent to worker processes by kind and outcome", ("kind", "outcome")
+)
+agent_pool_job_seconds = registry.histogram(
+    "agent_pool_job_seconds", "Time from sending a turn to a worker to its last reply", ("kind",)
+)
+
+# Replies per broker round trip, in both directions
+REPLY_BATCH = 256
+# Seconds between broker reconnection attempts
+RECONNECT_INTERVAL_SECONDS = 5.0
+
+
+class AgentWorkerError(Exception):
+    """A turn failed inside the agent worker"""
+
+
+class AgentPoolUnavailable(Exception):
+    """The broker cannot be reached"""
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def check_authkey(address: str, authkey: str):
+    """
+    Refuse an empty or default AGENT_BROKER_AUTHKEY off loopback: anyone who
+    can reach the broker with the key can run code on the worker host
+    """
+    host, _ = parse_address(address)
+    if (not authkey or authkey == AGENT_BROKER_DEFAULT_AUTHKEY) and not _is_loopback(host):
+        raise RuntimeError(
+            f"Set AGENT_BROKER_AUTHKEY to a long random secret before using the agent broker on {address}"
+        )
+
+
+# ============================================================================
+# Broker
+# ============================================================================
+
+
+class Broker(BaseManager):
+    """Job queue, per-web-process reply queues and cancelled job ids"""
+
+
+Broker.register("jobs")
+Broker.register("replies")
+Broker.register("cancellations", proxytype=DictProxy)
+
+
+def serve_broker(address: str, authkey: str) -> threading.Thread:
+    """Serve the broker from a daemon thread of this process (agent_worker.py)"""
+    check_authkey(address, authkey)
+    jobs = queue.Queue()
+    replies: Dict[str, queue.Queue] = {}
+    replies_lock = threading.Lock()
+    cancellations: Dict[str, float] = {}
+
+    def reply_queue(name: str) -> queue.Queue:
+        with replies_lock:
+            return replies.setdefault(name, queue.Queue())
+
+    class BrokerServer(Broker):
+        pass
+
+    BrokerServer.register("jobs", callable=lambda: jobs)
+    BrokerServer.register("replies", callable=reply_queue)
+    BrokerServer.register("cancellations", callable=lambda: cancellations, proxytype=DictProxy)
+
+    server = BrokerServer(address=parse_address(address), authkey=authkey.encode()).get_server()
+    thread = threading.Thread(target=server.serve_forever, name="agent-broker", daemon=True)
+    thread.start()
+    return thread
+
+
+def connect_broker(address: str = AGENT_BROKER_ADDRESS, authkey: str = AGENT_BROKER_AUTHKEY) -> Broker:
+    broker = Broker(address=parse_address(address), authkey=authkey.encode())
+    broker.connect()
+    return broker
+
+
+def session_snapshot(session: dict) -> dict:
+    """What a worker needs to run a turn for a session"""
+    return {
+        "messages": [message.to_api() for message in session["history"]],
+        "pending_approval": session.get("pending_approval"),
+        "user_id": session.get("user_id"),
+        "user_name": session.get("user_name"),
+        "user_email": session.get("user_email"),
+        "llm_failures": session.get("llm_failures", 0),
+        # Keys the session's earlier turns wrote, so this turn's reads stay on the primary
+        "writes": write_ages(session.get("recent_writes", {})),
+    }
+
+
+# ============================================================================
+# Web tier client
+# ============================================================================
+
+
+class _RemoteJob:
+    __slots__ = ("session_id", "future", "last_reply")
+
+    def __init__(self, session_id: str, future: asyncio.Future):
+        self.session_id = session_id
+        self.future = future
+        self.last_reply = time.monotonic()
+
+
+class AgentPool:
+    """Sends agent turns to worker processes and applies their replies to local sessions"""
+
+    def __init__(self, address: str, authkey: str, reply_timeout: float):
+        self.address = address
+        self.authkey = authkey
+        self.reply_timeout = reply_timeout
+        self.connected = False
+        self._pending: Dict[str, _RemoteJob] = {}
+        self._reply_name = f"web-{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._jobs = None
+        self._cancellations = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if AGENT_WORKERS_ENABLED and self._task is None:
+            check_authkey(self.address, self.authkey)
+            self._loop = asyncio.get_running_loop()
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._stay_connected())
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.connected = False
+
+    async def _stay_connected(self):
+        warned = False
+        while True:
+            if not self.connected:
+                try:
+                    await asyncio.to_thread(self._connect)
+                    print(f"DEBUG: Connected to agent worker broker at {self.address}")
+                    warned = False
+                except Exception as e:
+                    if not warned:
+                        print(f"Warning: agent worker broker at {self.address} unreachable ({e}), falling back to running agent turns in the web process")
+                        warned = True
+            await asyncio.sleep(RECONNECT_INTERVAL_SECONDS)
+
+    def _connect(self):
+        broker = connect_broker(self.address, self.authkey)
+        self._jobs = broker.jobs()
+        self._cancellations = broker.cancellations()
+        replies = broker.replies(self._reply_name)
+        threading.Thread(target=self._read_replies, args=(replies,), name="agent-pool-replies", daemon=True).start()
+        self.connected = True
+
+    def _read_replies(self, replies):
+        """Reader thread: hand reply batches to the event loop"""
+        while not self._stopping.is_set():
+            try:
+                batch = replies.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except Exception as e:
+                print(f"ERROR: Lost connection to agent worker broker: {e}")
+                self._loop.call_soon_threadsafe(self._broker_lost)
+                return
+            self._loop.call_soon_threadsafe(self._apply, batch)
+
+    def _broker_lost(self):
+        self.connected = False
+        for job in self._pending.values():
+            if not job.future.done():
+                job.future.set_exception(AgentPoolUnavailable("Lost connection to the agent workers"))
+
+    def _apply(self, batch):
+        for job_id, kind, payload in batch:
+            job = self._pending.get(job_id)
+            if job is None:
+                continue  # cancelled or timed out
+            job.last_reply = time.monotonic()
+            if kind == "event":
+                session_manager.emit_event_nowait(job.session_id, payload["type"], payload["data"])
+            elif kind == "message":
+                session = session_manager.sessions.get(job.session_id)
+                if session is not None:
+                    session["history"].append(Message.from_api(payload))
+            elif kind == "state":
+                session_manager.set_pending_approval(job.session_id, payload["pending_approval"])
+            elif kind == "finished" and not job.future.done():
+                job.future.set_result(payload)
+
+    def _cancel(self, job_id: str):
+        """Ask the worker to stop the job (fire and forget)"""
+        def send():
+            try:
+                self._cancellations[job_id] = time.time()
+            except Exception as e:
+                print(f"DEBUG: Could not cancel agent job {job_id}: {e}")
+
+        self._loop.run_in_executor(None, send)
+
+    async def run(self, kind: str, session_id: str, current_user: Optional[dict], **params):
+        """
+        Run a chat ("message") or approval ("approved", "user_input") turn on a
+        worker and wait for it. Raises AgentWorkerError if it failed there.
+        """
+        session = session_manager.get_session(session_id)
+        if not session:
+            await session_manager.emit_event(session_id, "error", {"message": "Session not found"})
+            return
+
+        job_id = uuid.uuid4().hex
+        job = self._pending[job_id] = _RemoteJob(session_id, self._loop.create_future())
+        started = time.monotonic()
+        outcome = "ok"
+        try:
+            await asyncio.to_thread(self._jobs.put, {
+                "id": job_id,
+                "reply_to": self._reply_name,
+                "kind": kind,
+                "session_id": session_id,
+                "user": current_user,
+                "session": session_snapshot(session),
+                "params": params,
+            })
+            while not job.future.done():
+                await asyncio.wait({job.future}, timeout=self.reply_timeout)
+                if not job.future.done() and time.monotonic() - job.last_reply >= self.reply_timeout:
+                    self._cancel(job_id)
+                    raise AgentPoolUnavailable(f"No reply from the agent worker for {self.reply_timeout:.0f}s")
+            result = job.future.result()
+            if result.get("error"):
+                outcome = "error"
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            self._cancel(job_id)
+            # The worker's own cancelled tool results arrive after this job stops listening
+            session_manager.answer_cancelled_tool_calls(session_id)
+            raise
+        except (AgentPoolUnavailable, ConnectionError, EOFError) as e:
+            outcome = "unavailable"
+            print(f"ERROR: Agent job {job_id} ({kind}) for session {session_id} failed: {e}")
+            await session_manager.emit_event(session_id, "error", {"message": "The agent is unavailable, please try again"})
+            return
+        finally:
+            self._pending.pop(job_id, None)
+            agent_pool_jobs_total.inc(1, kind, outcome)
+            agent_pool_job_seconds.observe(time.monotonic() - started, kind)
+
+        session["llm_failures"] = result.get("llm_failures", 0)
+        # Read-your-writes for the worker's tool writes, here and in the session's next job
+        writes = apply_write_ages(result.get("writes"))
+        if writes:
+            session["recent_writes"] = {**session.get("recent_writes", {}), **writes}
+        if result.get("error"):
+            raise AgentWorkerError(result["error"])
+
+
+# Global agent pool client (started by api.py when AGENT_WORKERS_ENABLED)
+agent_pool = AgentPool(AGENT_BROKER_ADDRESS, AGENT_BROKER_AUTHKEY, AGENT_WORKER_REPLY_TIMEOUT_SECONDS)
+
+registry.gauge(
+    "agent_pool_pending_jobs", "Agent turns waiting for a worker reply", callback=lambda: {(): len(agent_pool._pending)}
+)
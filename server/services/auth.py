@@ -2,23 +2,57 @@
 Authentication service with JWT and password hashing
 """
 import hashlib
+import importlib.util
+import os
 from datetime import datetime, timedelta
-from typing import Optional, Dict
+from functools import lru_cache
+from typing import Optional, Dict, Tuple
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
-from database import SessionLocal, User
+from database import User, read_session
 
 # JWT Configuration
 SECRET_KEY = "your-secret-key-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 24 * 60  # 24 hours
 
+# Password hashing profiles
+# - production: PASSWORD_HASH_SCHEME (bcrypt, or argon2 via argon2-cffi from requirements.txt)
+#   with a tunable cost; weaker or older hashes are upgraded on the next login
+# - test: minimum bcrypt cost so load tests measure the agent path, not hashing
+PASSWORD_HASH_PROFILE = os.getenv("PASSWORD_HASH_PROFILE", "production")
+PASSWORD_HASH_SCHEME = os.getenv("PASSWORD_HASH_SCHEME", "bcrypt")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+TEST_BCRYPT_ROUNDS = 4
+
+
+def build_password_context(profile: str = PASSWORD_HASH_PROFILE, scheme: str = PASSWORD_HASH_SCHEME) -> CryptContext:
+    """Build the passlib context for a hashing profile"""
+    if profile == "test":
+        # Verifies any bcrypt hash; never forces an upgrade or downgrade
+        return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=TEST_BCRYPT_ROUNDS)
+
+    if scheme == "argon2" and importlib.util.find_spec("argon2") is None:
+        print("Warning: argon2-cffi is not installed, falling back to bcrypt password hashing")
+        scheme = "bcrypt"
+
+    # The first scheme is used for new hashes; the others are deprecated and
+    # flagged by needs_update, as are bcrypt hashes below the configured cost
+    schemes = [scheme] + [s for s in ("bcrypt",) if s != scheme]
+    return CryptContext(
+        schemes=schemes,
+        deprecated="auto",
+        bcrypt__rounds=BCRYPT_ROUNDS,
+        bcrypt__min_rounds=BCRYPT_ROUNDS,
+    )
+
+
 # Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = build_password_context()
 
 # HTTP Bearer scheme
 security = HTTPBearer()
@@ -29,11 +63,22 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password and return a replacement hash if the stored one is outdated"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password: str) -> str:
     """Hash a password"""
     return pwd_context.hash(password)
 
 
+@lru_cache(maxsize=32)
+def get_shared_password_hash(password: str) -> str:
+    """Hash a password once per process for seeded and test users sharing it"""
+    return pwd_context.hash(password)
+
+
 def create_access_token(data: Dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -66,11 +111,15 @@ def decode_token(token: str) -> Dict:
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
     """Get the current authenticated user from JWT token"""
-    token = credentials.credentials
+    return user_from_token(credentials.credentials)
+
+
+def user_from_token(token: str) -> User:
+    """The user a JWT token belongs to (401 if the token or user is invalid)"""
     payload = decode_token(token)
     email = payload.get("sub")
 
-    db: Session = SessionLocal()
+    db: Session = read_session(f"email:{email}")
     try:
         user = db.query(User).filter(User.email == email).first()
         if user is None:
@@ -0,0 +1,120 @@
+"""
+Per-turn budgets for the agent loops
+
+A TurnBudget caps one agent turn at a number of model calls, prompt and
+completion tokens, and a wall-clock deadline. Loops call start_call() before
+every model call (raising BudgetExceeded once a limit is reached), pass
+remaining time and completion tokens to the model call, and record usage
+afterwards. Used by the web agent and both CLI agents.
+"""
+import time
+from typing import Optional
+
+from config import (
+    AGENT_MAX_MODEL_CALLS,
+    AGENT_MAX_PROMPT_TOKENS,
+    AGENT_MAX_COMPLETION_TOKENS,
+    LLM_TURN_DEADLINE_SECONDS,
+)
+from services.metrics import registry
+
+budget_exceeded_total = registry.counter(
+    "agent_budget_exceeded_total", "Agent turns stopped by their budget", ("agent", "reason")
+)
+
+MODEL_CALLS = "model_calls"
+PROMPT_TOKENS = "prompt_tokens"
+COMPLETION_TOKENS = "completion_tokens"
+DEADLINE = "deadline"
+
+_MESSAGES = {
+    MODEL_CALLS: "This request needed more steps than allowed. Please try a simpler or more specific question.",
+    PROMPT_TOKENS: "This conversation has grown too long to continue. Please start a new chat.",
+    COMPLETION_TOKENS: "The response grew too long. Please try a more specific question.",
+    DEADLINE: "The assistant took too long to respond. Please try again.",
+}
+
+
+class BudgetExceeded(Exception):
+    """Raised when a turn runs out of model calls, tokens or time"""
+
+    def __init__(self, budget: "TurnBudget", reason: str):
+        super().__init__(_MESSAGES[reason])
+        self.budget = budget
+        self.reason = reason
+
+    def event(self) -> dict:
+        """Payload of the budget_exceeded SSE event"""
+        return {"reason": self.reason, "message": str(self), **self.budget.usage()}
+
+
+class TurnBudget:
+    __slots__ = (
+        "agent", "max_model_calls", "max_prompt_tokens", "max_completion_tokens",
+        "started", "deadline", "model_calls", "prompt_tokens", "completion_tokens",
+    )
+
+    def __init__(
+        self,
+        agent: str,
+        max_model_calls: int = AGENT_MAX_MODEL_CALLS,
+        max_prompt_tokens: int = AGENT_MAX_PROMPT_TOKENS,
+        max_completion_tokens: int = AGENT_MAX_COMPLETION_TOKENS,
+        wall_clock_seconds: float = LLM_TURN_DEADLINE_SECONDS,
+    ):
+        self.agent = agent
+        self.max_model_calls = max_model_calls
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_completion_tokens = max_completion_tokens
+        self.started = time.monotonic()
+        # Absolute time.monotonic() value, shared with services/llm.create_completion
+        self.deadline = self.started + wall_clock_seconds
+        self.model_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def remaining_seconds(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def remaining_completion_tokens(self) -> int:
+        return max(0, self.max_completion_tokens - self.completion_tokens)
+
+    def _exceeded(self) -> Optional[str]:
+        if self.model_calls >= self.max_model_calls:
+            return MODEL_CALLS
+        if self.prompt_tokens >= self.max_prompt_tokens:
+            return PROMPT_TOKENS
+        if self.completion_tokens >= self.max_completion_tokens:
+            return COMPLETION_TOKENS
+        if time.monotonic() >= self.deadline:
+            return DEADLINE
+        return None
+
+    def start_call(self):
+        """Reserve a model call, raising BudgetExceeded if any limit is already reached"""
+        reason = self._exceeded()
+        if reason:
+            raise self.exceeded(reason)
+        self.model_calls += 1
+
+    def exceeded(self, reason: str) -> BudgetExceeded:
+        """Build (and count) the exception for an exhausted budget"""
+        budget_exceeded_total.inc(1, self.agent, reason)
+        print(f"DEBUG: {self.agent} turn budget exceeded ({reason}): {self.usage()}")
+        return BudgetExceeded(self, reason)
+
+    def record_usage(self, prompt_tokens: int = 0, completion_tokens: int = 0):
+        self.prompt_tokens += prompt_tokens or 0
+        self.completion_tokens += completion_tokens or 0
+
+    def record_openai_usage(self, usage):
+        """Record an OpenAI-format usage object (may be None)"""
+        self.record_usage(getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0))
+
+    def usage(self) -> dict:
+        return {
+            "model_calls": self.model_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "elapsed_seconds": round(time.monotonic() - self.started, 3),
+        }
@@ -0,0 +1,207 @@
+"""
+Local policy/FAQ answers
+
+Questions like "how long does shipping take?" are answered from a fixed set
+of policy snippets, so they do not need a model call. Snippets come from
+services/policies.py (the policies the agent prompts quote) plus an optional
+FAQ_POLICY_FILE:
+
+    ## Returns
+    keywords: return, exchange, send back
+    Unused items can be returned within 30 days for a full refund.
+
+Messages are scored against the snippets with BM25. Only short, question-like
+messages without order IDs whose best match is clear-cut get a local answer;
+everything else (including "I want a refund for ORD-123") goes to the model.
+Lookups are cached per normalised message.
+"""
+import math
+import os
+import re
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    FAQ_POLICY_FILE,
+    FAQ_MIN_SCORE,
+    FAQ_MIN_COVERAGE,
+    FAQ_MIN_MARGIN,
+    FAQ_MAX_QUERY_TERMS,
+    FAQ_CACHE_SIZE,
+)
+from services.metrics import registry
+from services.policies import COMPANY_POLICIES
+from services.prefetch import extract_order_ids
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# answered: replied locally (one model call saved); the rest fall back to the model
+faq_lookups_total = registry.counter("faq_lookups_total", "FAQ lookups by outcome", ("outcome",))
+faq_lookup_seconds = registry.histogram(
+    "faq_lookup_seconds", "FAQ lookup latency", buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01)
+)
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can could do does for from get have how i if in is it its many me much my of on or "
+    "our please policies policy s should t tell than that the their there this to us was we what whats when where "
+    "which will with would you your".split()
+)
+QUESTION_WORDS = frozenset("how what whats when where which do does can could is are will policy".split())
+
+WORD_PATTERN = re.compile(r"[a-z0-9/]+")
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[: -len(suffix)]
+            # shipp -> ship
+            if len(word) > 3 and word[-1] == word[-2]:
+                word = word[:-1]
+            break
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(word) for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+
+
+class Snippet:
+    __slots__ = ("topic", "answer", "terms")
+
+    def __init__(self, topic: str, text: str, keywords: str = "", answer: Optional[str] = None):
+        self.topic = topic
+        self.answer = answer or text
+        self.terms = tokenize(f"{topic} {keywords} {text}")
+
+
+# ============================================================================
+# Snippet Sources
+# ============================================================================
+
+def policy_snippets() -> List[Snippet]:
+    """Snippets for services/policies.COMPANY_POLICIES (the policies the agent prompts quote)"""
+    return [
+        Snippet(
+            policy["topic"],
+            policy["text"],
+            policy["keywords"],
+            f"{policy['topic']}: {policy['text']}. Is there anything else I can help you with?",
+        )
+        for policy in COMPANY_POLICIES
+    ]
+
+
+def file_snippets(path: str) -> List[Snippet]:
+    """'## Topic' sections of a policy file, each with an optional 'keywords:' line"""
+    if not path:
+        return []
+    if not os.path.isabs(path):
+        path = os.path.join(SERVER_DIR, path)
+    try:
+        with open(path) as f:
+            text = f.read()
+    except OSError as e:
+        print(f"Warning: FAQ policy file not loaded: {e}")
+        return []
+
+    snippets = []
+    for section in re.split(r"^##\s+", text, flags=re.MULTILINE)[1:]:
+        topic, _, body = section.partition("\n")
+        keywords = ""
+        lines = []
+        for line in body.strip().splitlines():
+            if line.lower().startswith("keywords:"):
+                keywords = line.split(":", 1)[1].replace(",", " ")
+            else:
+                lines.append(line)
+        answer = " ".join(line.strip() for line in lines if line.strip())
+        if answer:
+            snippets.append(Snippet(topic.strip(), answer, keywords))
+    return snippets
+
+
+# ============================================================================
+# BM25 Index
+# ============================================================================
+
+class FaqIndex:
+    def __init__(self, snippets: List[Snippet], k1: float = 1.2, b: float = 0.75):
+        self.snippets = snippets
+        self.k1 = k1
+        self.b = b
+        self._counts = [Counter(snippet.terms) for snippet in snippets]
+        self._lengths = [len(snippet.terms) for snippet in snippets]
+        self._avg_length = sum(self._lengths) / len(snippets) if snippets else 0.0
+        document_frequency = Counter(term for counts in self._counts for term in counts)
+        total = len(snippets)
+        self._idf = {
+            term: math.log(1 + (total - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()
+        }
+
+    @classmethod
+    def load(cls, policy_file: str = FAQ_POLICY_FILE) -> "FaqIndex":
+        """Company policies, overridden topic by topic by the policy file"""
+        snippets = {snippet.topic.lower(): snippet for snippet in policy_snippets()}
+        snippets.update((snippet.topic.lower(), snippet) for snippet in file_snippets(policy_file))
+        return cls(list(snippets.values()))
+
+    def scores(self, terms: List[str]) -> List[float]:
+        scores = []
+        for counts, length in zip(self._counts, self._lengths):
+            score = 0.0
+            for term in terms:
+                frequency = counts.get(term)
+                if frequency:
+                    norm = self.k1 * (1 - self.b + self.b * length / self._avg_length)
+                    score += self._idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            scores.append(score)
+        return scores
+
+    def match(self, message: str) -> Tuple[str, Optional[Snippet]]:
+        """(outcome, snippet): the snippet is set only for a confident answer"""
+        words = WORD_PATTERN.findall(message.lower())
+        if extract_order_ids(message, limit=1):
+            return "order_specific", None
+        if "?" not in message and not QUESTION_WORDS.intersection(words):
+            return "not_question", None
+        terms = list(dict.fromkeys(tokenize(message)))
+        if not terms or len(terms) > FAQ_MAX_QUERY_TERMS or not self.snippets:
+            return "low_confidence", None
+
+        scores = self.scores(terms)
+        ranked = sorted(range(len(scores)), key=scores.__getitem__, reverse=True)
+        best = ranked[0]
+        runner_up = scores[ranked[1]] if len(ranked) > 1 else 0.0
+        coverage = sum(1 for term in terms if term in self._counts[best]) / len(terms)
+        if scores[best] < FAQ_MIN_SCORE or coverage < FAQ_MIN_COVERAGE or scores[best] < FAQ_MIN_MARGIN * runner_up:
+            return "low_confidence", None
+        return "answered", self.snippets[best]
+
+
+# Global FAQ index instance
+faq_index = FaqIndex.load()
+
+
+@lru_cache(maxsize=FAQ_CACHE_SIZE)
+def _cached_match(normalized: str) -> Tuple[str, Optional[Snippet]]:
+    return faq_index.match(normalized)
+
+
+def faq_cache_stats() -> Dict[Tuple[str, ...], float]:
+    info = _cached_match.cache_info()
+    return {("hits",): info.hits, ("misses",): info.misses, ("entries",): info.currsize}
+
+
+registry.gauge("faq_cache", "FAQ lookup cache statistics", ("stat",), callback=faq_cache_stats)
+
+
+def answer_faq(message: str) -> Optional[str]:
+    """Local answer for a clear policy question, or None to ask the model"""
+    start = time.perf_counter()
+    outcome, snippet = _cached_match(" ".join(message.split()))
+    faq_lookup_seconds.observe(time.perf_counter() - start)
+    faq_lookups_total.inc(1, outcome)
+    return snippet.answer if snippet else None
@@ -0,0 +1,121 @@
+"""
+Compact in-memory conversation history
+
+Session histories used to be lists of OpenAI-format dicts, with each tool call
+as two more nested dicts. Messages are now slotted objects with interned role
+strings, and tool calls keep the model's raw argument string. The API payload
+is built per model call from the same string objects, so no message text is
+copied and the transient dicts are freed as soon as the request is sent.
+"""
+import sys
+from typing import Callable, Iterator, List, Optional, Sequence
+
+SYSTEM = "system"
+USER = "user"
+ASSISTANT = "assistant"
+TOOL = "tool"
+
+
+class ToolCall:
+    __slots__ = ("id", "name", "arguments")
+
+    def __init__(self, id: str, name: str, arguments: str):
+        self.id = id
+        self.name = sys.intern(name)
+        self.arguments = arguments  # JSON string exactly as returned by the model
+
+    def to_api(self) -> dict:
+        return {"id": self.id, "type": "function", "function": {"name": self.name, "arguments": self.arguments}}
+
+
+class Message:
+    __slots__ = ("role", "content", "tool_calls", "tool_call_id")
+
+    def __init__(
+        self,
+        role: str,
+        content: Optional[str] = None,
+        tool_calls: Optional[Sequence[ToolCall]] = None,
+        tool_call_id: Optional[str] = None,
+    ):
+        self.role = sys.intern(role)
+        self.content = content
+        self.tool_calls = tuple(tool_calls) if tool_calls else None
+        self.tool_call_id = tool_call_id
+
+    @classmethod
+    def user(cls, content: str) -> "Message":
+        return cls(USER, content)
+
+    @classmethod
+    def assistant(cls, content: Optional[str], tool_calls: Optional[Sequence[ToolCall]] = None) -> "Message":
+        return cls(ASSISTANT, content, tool_calls)
+
+    @classmethod
+    def tool(cls, tool_call_id: str, content: str) -> "Message":
+        return cls(TOOL, content, tool_call_id=tool_call_id)
+
+    @classmethod
+    def from_api(cls, data: dict) -> "Message":
+        """Build a message from an OpenAI-format dict"""
+        tool_calls = [
+            ToolCall(call["id"], call["function"]["name"], call["function"]["arguments"])
+            for call in data.get("tool_calls") or ()
+        ]
+        return cls(data["role"], data.get("content"), tool_calls, data.get("tool_call_id"))
+
+    def to_api(self) -> dict:
+        """OpenAI-format dict sharing this message's strings"""
+        if self.tool_calls:
+            return {"role": self.role, "content": self.content, "tool_calls": [call.to_api() for call in self.tool_calls]}
+        if self.tool_call_id is not None:
+            return {"role": self.role, "tool_call_id": self.tool_call_id, "content": self.content}
+        return {"role": self.role, "content": self.content}
+
+    def __repr__(self) -> str:
+        return f"Message({self.role!r}, {self.content!r})"
+
+
+class History:
+    """Ordered conversation messages of one session"""
+
+    __slots__ = ("_messages", "_on_append")
+
+    def __init__(
+        self,
+        messages: Optional[List[Message]] = None,
+        on_append: Optional[Callable[[int, Message], None]] = None,
+    ):
+        self._messages: List[Message] = messages if messages is not None else []
+        # Called with (position, message) for every appended message, e.g. to persist it
+        self._on_append = on_append
+
+    def append(self, message: Message):
+        self._messages.append(message)
+        if self._on_append is not None:
+            self._on_append(len(self._messages) - 1, message)
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self._messages)
+
+    def __getitem__(self, index):
+        return self._messages[index]
+
+    def unanswered_tool_calls(self) -> List[str]:
+        """Ids of the latest assistant message's tool calls that have no tool result yet"""
+        index = len(self._messages) - 1
+        while index >= 0 and self._messages[index].role == TOOL:
+            index -= 1
+        if index < 0 or not self._messages[index].tool_calls:
+            return []
+        answered = {message.tool_call_id for message in self._messages[index + 1:]}
+        return [call.id for call in self._messages[index].tool_calls if call.id not in answered]
+
+    def payload(self, system_prompt: Optional[str] = None) -> List[dict]:
+        """Messages for a chat completion request, optionally preceded by the system prompt"""
+        messages = [{"role": SYSTEM, "content": system_prompt}] if system_prompt is not None else []
+        messages.extend(message.to_api() for message in self._messages)
+        return messages
@@ -0,0 +1,112 @@
+"""
+Idempotency-Key handling for agent-starting endpoints
+
+A client that retries a POST with the same Idempotency-Key gets the original
+response back instead of queueing another agent job (another paid model call,
+possibly another verification email). Retries that arrive while the first
+request is still running wait for its result. Because the original job keeps
+emitting into the session's event queue, replaying the session_id is enough
+for the client to receive the original events.
+
+Results are kept in process memory for IDEMPOTENCY_TTL_SECONDS, like the
+sessions they refer to.
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from config import IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_MAX_KEYS
+from services.metrics import registry
+from services.serialization import dumpb
+
+idempotency_requests_total = registry.counter(
+    "idempotency_requests_total", "Requests carrying an Idempotency-Key by outcome", ("route", "outcome")
+)
+
+MAX_KEY_LENGTH = 255
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "result", "expires_at")
+
+    def __init__(self, fingerprint: str, result: asyncio.Future, expires_at: float):
+        self.fingerprint = fingerprint
+        self.result = result
+        self.expires_at = expires_at
+
+
+def fingerprint(payload: Any) -> str:
+    return hashlib.sha256(dumpb(payload, sort_keys=True)).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, ttl_seconds: float, max_keys: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_keys = max_keys
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    def _evict(self, now: float):
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at > now and len(self._entries) <= self.max_keys:
+                break
+            del self._entries[key]
+
+    async def run(
+        self,
+        key: Optional[str],
+        route: str,
+        user_id,
+        payload: Any,
+        handler: Callable[[], Awaitable[Any]],
+    ) -> Tuple[Any, bool]:
+        """Run handler once per (user, route, key); returns (result, replayed)"""
+        if key is None:
+            return await handler(), False
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Idempotency-Key")
+
+        now = time.monotonic()
+        self._evict(now)
+        store_key = f"{user_id}:{route}:{key}"
+        request_fingerprint = fingerprint(payload)
+
+        entry = self._entries.get(store_key)
+        if entry is not None:
+            if entry.fingerprint != request_fingerprint:
+                idempotency_requests_total.inc(1, route, "conflict")
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="Idempotency-Key was already used with a different request",
+                )
+            outcome = "replayed" if entry.result.done() else "in_flight"
+            idempotency_requests_total.inc(1, route, outcome)
+            print(f"DEBUG: Idempotency-Key {key} {outcome} for {route}")
+            # shield: a retry disconnecting must not cancel the shared result
+            return await asyncio.shield(entry.result), True
+
+        entry = _Entry(request_fingerprint, asyncio.get_running_loop().create_future(), now + self.ttl_seconds)
+        self._entries[store_key] = entry
+        idempotency_requests_total.inc(1, route, "new")
+        try:
+            result = await handler()
+        except Exception as e:
+            # Failed requests are not remembered so the client can retry them
+            self._entries.pop(store_key, None)
+            entry.result.set_exception(e)
+            entry.result.exception()  # mark retrieved when no retry is waiting
+            raise
+        except BaseException:
+            self._entries.pop(store_key, None)
+            entry.result.cancel()
+            raise
+        entry.result.set_result(result)
+        return result, False
+
+
+# Global idempotency store instance
+idempotency_store = IdempotencyStore(IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_MAX_KEYS)
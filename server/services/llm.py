@@ -0,0 +1,255 @@
+"""
+Resilient LLM call layer around the OpenRouter client
+
+Wraps client.chat.completions.create with:
+- classified retries (timeouts, connection errors, 429 and 5xx) with jittered backoff
+- a per-turn deadline shared by every model call in the turn
+- optional hedged requests to FALLBACK_MODEL once the primary is slow
+- a circuit breaker that fails fast while the upstream is degraded
+"""
+import asyncio
+import contextvars
+import functools
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from config import (
+    get_client,
+    MODEL,
+    FALLBACK_MODEL,
+    LLM_MAX_RETRIES,
+    LLM_BACKOFF_BASE_SECONDS,
+    LLM_BACKOFF_MAX_SECONDS,
+    LLM_HEDGE_AFTER_SECONDS,
+    LLM_CIRCUIT_FAILURE_THRESHOLD,
+    LLM_CIRCUIT_RESET_SECONDS,
+    LLM_CALL_THREADS,
+    AGENT_MAX_CONCURRENT_TASKS,
+    AGENT_WORKER_CONCURRENCY,
+)
+from services.metrics import (
+    registry,
+    llm_requests_total,
+    llm_request_duration_seconds,
+    record_llm_usage,
+)
+from services.model_router import model_router
+
+llm_retries_total = registry.counter("llm_retries_total", "LLM calls retried after a transient error", ("model", "reason"))
+llm_hedges_total = registry.counter("llm_hedges_total", "Hedged LLM requests by winning model", ("winner",))
+llm_circuit_state = registry.gauge("llm_circuit_state", "LLM circuit breaker state (0=closed, 1=half-open, 2=open)")
+
+
+class LLMError(Exception):
+    """Base class for errors raised by the LLM call layer"""
+
+
+class LLMUnavailableError(LLMError):
+    """Raised when the circuit breaker is open"""
+
+
+class LLMDeadlineExceeded(LLMError):
+    """Raised when the turn deadline expires before the model answers"""
+
+
+class EmptyCompletionError(LLMError):
+    """Raised when the provider returns a completion without choices"""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Classify an exception as transient (worth retrying) or permanent"""
+    import openai
+
+    if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError, EmptyCompletionError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in (408, 409, 429) or exc.status_code >= 500
+    return False
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """Read a Retry-After header (seconds) from a provider error, if present"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    ceiling = min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release(self):
+        """Give up a half-open probe slot without recording an outcome (e.g. cancellation)"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self._probe_in_flight = False
+        self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+    def _set_state(self, state: int):
+        if state != self.state:
+            print(f"DEBUG: LLM circuit breaker {self.state} -> {state}")
+        self.state = state
+        llm_circuit_state.set(state)
+
+
+circuit_breaker = CircuitBreaker(LLM_CIRCUIT_FAILURE_THRESHOLD, LLM_CIRCUIT_RESET_SECONDS)
+
+
+def _call(model: str, messages: List[dict], timeout: Optional[float], **kwargs):
+    """Blocking completion call (runs in a worker thread)"""
+    started = time.perf_counter()
+    try:
+        response = get_client().chat.completions.create(model=model, messages=messages, timeout=timeout, **kwargs)
+        if not response.choices:
+            raise EmptyCompletionError(f"Empty completion from {model}")
+    except Exception:
+        llm_requests_total.inc(1, model, "error")
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        llm_request_duration_seconds.observe(elapsed, model)
+    llm_requests_total.inc(1, model, "ok")
+    record_llm_usage(model, response)
+    model_router.record_usage(model, elapsed, getattr(response, "usage", None))
+    return response
+
+
+# Model calls get their own threads: the default executor (min(32, CPUs + 4)
+# threads) is shared with DB reads and flushes and would cap concurrent turns
+_call_executor = ThreadPoolExecutor(
+    max_workers=LLM_CALL_THREADS or 2 * max(AGENT_MAX_CONCURRENT_TASKS, AGENT_WORKER_CONCURRENCY),
+    thread_name_prefix="llm-call",
+)
+
+
+def _call_in_thread(model: str, messages: List[dict], timeout: Optional[float], **kwargs) -> asyncio.Future:
+    """asyncio.to_thread(_call, ...) on the model-call executor"""
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, _call, model, messages, timeout, **kwargs)
+    return asyncio.get_running_loop().run_in_executor(_call_executor, call)
+
+
+async def _hedged_call(model: str, fallback: str, messages: List[dict], timeout: Optional[float], **kwargs):
+    """Call the primary model and race a fallback request if it is slower than the hedge threshold"""
+    primary = _call_in_thread(model, messages, timeout, **kwargs)
+    if not fallback or fallback == model or LLM_HEDGE_AFTER_SECONDS <= 0:
+        return await primary
+
+    done, _ = await asyncio.wait({primary}, timeout=LLM_HEDGE_AFTER_SECONDS)
+    if done:
+        return primary.result()
+
+    print(f"DEBUG: {model} slower than {LLM_HEDGE_AFTER_SECONDS}s, hedging with {fallback}")
+    hedge = _call_in_thread(fallback, messages, timeout, **kwargs)
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                llm_hedges_total.inc(1, "fallback" if task is hedge else "primary")
+                # The losing request finishes in its thread; its result is discarded
+                for other in pending:
+                    other.add_done_callback(lambda t: t.exception())
+                return task.result()
+            error = task.exception()
+    raise error
+
+
+async def create_completion(
+    messages: List[dict],
+    model: str = MODEL,
+    deadline: Optional[float] = None,
+    fallback_model: Optional[str] = None,
+    **kwargs,
+):
+    """
+    Create a chat completion with retries, hedging and circuit breaking.
+
+    deadline is an absolute time.monotonic() value shared by all calls of a turn.
+    """
+    fallback = FALLBACK_MODEL if fallback_model is None else fallback_model
+    attempt = 0
+
+    while True:
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                raise LLMDeadlineExceeded("The assistant took too long to respond")
+
+        if not circuit_breaker.allow():
+            llm_requests_total.inc(1, model, "rejected")
+            raise LLMUnavailableError("The assistant is temporarily unavailable, please try again shortly")
+
+        try:
+            if timeout is None:
+                response = await _hedged_call(model, fallback, messages, None, **kwargs)
+            else:
+                response = await asyncio.wait_for(_hedged_call(model, fallback, messages, timeout, **kwargs), timeout)
+            circuit_breaker.record_success()
+            return response
+        except asyncio.CancelledError:
+            circuit_breaker.release()
+            raise
+        except asyncio.TimeoutError:
+            circuit_breaker.record_failure()
+            raise LLMDeadlineExceeded("The assistant took too long to respond")
+        except Exception as e:
+            if not is_retryable(e):
+                # Client-side errors (bad request, auth) say nothing about upstream health:
+                # free a half-open probe slot without closing the circuit or resetting failures
+                circuit_breaker.release()
+                raise
+            circuit_breaker.record_failure()
+            if attempt >= LLM_MAX_RETRIES:
+                raise
+
+            delay = _retry_after(e) or backoff_delay(attempt)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
+            attempt += 1
+            llm_retries_total.inc(1, model, type(e).__name__)
+            print(f"DEBUG: LLM call failed ({type(e).__name__}: {e}), retry {attempt}/{LLM_MAX_RETRIES} in {delay:.2f}s")
+            await asyncio.sleep(delay)
@@ -0,0 +1,104 @@
+"""
+Event-loop lag monitor
+
+A background task sleeps for a fixed interval and measures how late it wakes
+up. The lag is what every request waiting on the loop currently pays; it is
+exported as a gauge and used by admission control to shed load.
+
+A lag figure says the loop was blocked but not by what, and by the time the
+task wakes up the blocking code has returned. A watchdog thread therefore
+checks the task's heartbeat and, once it is LOOP_BLOCK_THRESHOLD_SECONDS
+stale, captures the loop thread's stack while the blocking call is still on it.
+"""
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from config import LOOP_MONITOR_INTERVAL_SECONDS, LOOP_BLOCK_THRESHOLD_SECONDS
+from services.metrics import registry
+
+event_loop_lag_seconds = registry.gauge("event_loop_lag_seconds", "Recent event-loop scheduling lag")
+event_loop_lag_max_seconds = registry.gauge("event_loop_lag_max_seconds", "Largest event-loop lag since startup")
+event_loop_blocks_total = registry.counter("event_loop_blocks_total", "Event-loop stalls longer than the block threshold")
+
+
+class LoopMonitor:
+    def __init__(self, interval: float, block_threshold: float, keep_blocks: int = 20):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        # Jumps to a new spike immediately, then decays, so shedding reacts fast and recovers smoothly
+        self.lag = 0.0
+        self.max_lag = 0.0
+        # Most recent stalls, newest last
+        self.blocks: Deque[Dict] = deque(maxlen=keep_blocks)
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = 0.0
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+        if self.block_threshold > 0:
+            self._stopped.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._watchdog = None
+
+    def record(self, lag: float):
+        self.lag = max(lag, 0.7 * self.lag + 0.3 * lag)
+        self.max_lag = max(self.max_lag, lag)
+        event_loop_lag_seconds.set(self.lag)
+        event_loop_lag_max_seconds.set(self.max_lag)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self._heartbeat = time.monotonic()
+            self.record(max(0.0, loop.time() - started - self.interval))
+
+    # ------------------------------------------------------------------------
+    # Watchdog thread
+    # ------------------------------------------------------------------------
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.interval):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            # One report per stall: the heartbeat only moves once the loop is free again
+            if stalled < self.block_threshold or heartbeat == reported:
+                continue
+            reported = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.format_stack(frame)
+            del frame
+            self.blocks.append({"at": time.time(), "stalled_seconds": round(stalled, 3), "stack": stack})
+            event_loop_blocks_total.inc()
+            print(f"DEBUG: Event loop blocked for {stalled:.3f}s at:\n{''.join(stack[-8:])}")
+
+    def recent_blocks(self) -> List[Dict]:
+        return list(self.blocks)
+
+
+# Global loop monitor instance (started by api.py)
+loop_monitor = LoopMonitor(LOOP_MONITOR_INTERVAL_SECONDS, LOOP_BLOCK_THRESHOLD_SECONDS)
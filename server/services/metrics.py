@@ -0,0 +1,323 @@
+"""
+Lightweight Prometheus-style metrics registry.
+
+Request handlers run on the single asyncio event loop, so counters are plain
+integer/float updates with no locks and the hot path cost is one dict lookup
+plus an addition. Updates from worker threads rely on the GIL; a rare lost
+increment under contention is an accepted trade-off for monitoring data. Values that are
+cheap to read but expensive to track (queue depths, DB pool stats) are
+collected lazily through callbacks when /metrics is scraped.
+"""
+import math
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Default latency buckets in seconds (covers fast DB calls through slow LLM turns)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, *labels: str):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be computed on scrape via a callback"""
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        callback: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback = callback
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def inc(self, amount: float = 1, *labels: str):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, amount: float = 1, *labels: str):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def value(self, *labels: str) -> float:
+        if self._callback:
+            return self._callback().get(labels, 0)
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        values = self._values
+        if self._callback:
+            try:
+                values = self._callback()
+            except Exception as e:
+                print(f"DEBUG: Metrics callback for {self.name} failed: {e}")
+                values = {}
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets"""
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # labels -> [bucket counts..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [0] * (len(self.buckets) + 2)
+        state[bisect_left(self.buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def time(self, *labels: str) -> "_Timer":
+        return _Timer(self, labels)
+
+    def count(self, *labels: str) -> int:
+        state = self._values.get(labels)
+        return int(state[-1]) if state else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, state in sorted(self._values.items()):
+            cumulative = 0
+            for i, bound in enumerate(self.buckets):
+                cumulative += state[i]
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {int(state[-1])}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_labels", "_start")
+
+    def __init__(self, histogram: Histogram, labels: LabelValues):
+        self._histogram = histogram
+        self._labels = labels
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start, *self._labels)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            return self._metrics[metric.name]
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        callback: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+# Global metrics registry instance
+registry = MetricsRegistry()
+
+
+# ============================================================================
+# Application Metrics
+# ============================================================================
+
+http_requests_total = registry.counter(
+    "http_requests_total", "HTTP requests by route, method and status code", ("route", "method", "status")
+)
+http_request_duration_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("route", "method")
+)
+sse_connections = registry.gauge("sse_connections", "Live SSE event stream connections")
+agent_tasks_in_flight = registry.gauge("agent_tasks_in_flight", "Agent background tasks currently running", ("kind",))
+llm_requests_total = registry.counter("llm_requests_total", "LLM completion requests by model and outcome", ("model", "outcome"))
+llm_request_duration_seconds = registry.histogram("llm_request_duration_seconds", "LLM completion latency", ("model",))
+llm_tokens_total = registry.counter(
+    "llm_tokens_total", "LLM tokens consumed by model and kind (prompt/completion); use rate() for tokens per minute", ("model", "kind")
+)
+db_queries_total = registry.counter("db_queries_total", "SQL statements executed")
+db_read_routes_total = registry.counter(
+    "db_read_routes_total", "Read-only sessions by target database and reason", ("target", "reason")
+)
+tool_calls_total = registry.counter("tool_calls_total", "Agent tool invocations by tool and outcome", ("tool", "outcome"))
+
+
+def _event_queue_depths() -> Dict[LabelValues, float]:
+    from services.session_manager import session_manager
+
+    depths = [queue.qsize() for queue in session_manager.event_queues.values()]
+    return {
+        ("total",): sum(depths),
+        ("max",): max(depths, default=0),
+        ("sessions",): len(depths),
+    }
+
+
+def _db_pool_stats() -> Dict[LabelValues, float]:
+    from database import engine, replica_engine
+
+    stats = {}
+    pools = [("primary", engine.pool)]
+    if replica_engine is not engine:
+        pools.append(("replica", replica_engine.pool))
+    for role, pool in pools:
+        for stat in ("size", "checkedin", "checkedout", "overflow"):
+            getter = getattr(pool, stat, None)
+            if callable(getter):
+                stats[(role, stat)] = getter()
+    return stats
+
+
+registry.gauge("sse_event_queue_depth", "Pending SSE events across session queues", ("stat",), callback=_event_queue_depths)
+registry.gauge("db_pool_connections", "SQLAlchemy connection pool statistics", ("pool", "stat"), callback=_db_pool_stats)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request count and latency per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Use the matched route template to keep label cardinality bounded
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            http_requests_total.inc(1, path, method, str(status_code))
+            http_request_duration_seconds.observe(time.perf_counter() - start, path, method)
+
+
+def record_llm_usage(model: str, response) -> None:
+    """Record token usage from an OpenAI-compatible completion response"""
+    usage = getattr(response, "usage", None)
+    if not usage:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    llm_tokens_total.inc(prompt_tokens, model, "prompt")
+    llm_tokens_total.inc(completion_tokens, model, "completion")
+
+
+def record_tool_result(tool_name: str, result) -> None:
+    """Count a tool call as ok or error based on its result payload"""
+    outcome = "ok" if isinstance(result, dict) and result.get("success", "error" not in result) else "error"
+    tool_calls_total.inc(1, tool_name, outcome)
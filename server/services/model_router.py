@@ -0,0 +1,157 @@
+"""
+Per-call model routing between cheap and larger models
+
+Picks a model tier from MODEL_CANDIDATES for every model call based on the
+turn type, whether tools are likely needed, history length and recent
+failures, and records per-model latency and cost. Shared by the web agent
+and the CLI agents in main.py and langchain_agent.py.
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from config import MODEL, MODEL_CANDIDATES, MODEL_ROUTING_ENABLED, MODEL_ROUTING_LONG_HISTORY
+from services.metrics import registry
+
+model_routes_total = registry.counter("model_routes_total", "Model routing decisions by tier and reason", ("tier", "reason"))
+llm_cost_usd_total = registry.counter("llm_cost_usd_total", "Estimated LLM spend in USD by model", ("model",))
+model_latency_budget_exceeded_total = registry.counter(
+    "model_latency_budget_exceeded_total", "Model calls slower than their tier's latency budget", ("model",)
+)
+
+TIERS = ("small", "standard", "large")
+
+# Turn types
+USER_TURN = "user"
+TOOL_FOLLOWUP = "tool_followup"
+
+# Messages that mention orders or order actions need tool calls and a capable model
+_TOOL_HINTS = re.compile(r"\bORD-\w+|\b(order|cancel|refund|status|track|verification|code)\b", re.IGNORECASE)
+
+
+@dataclass
+class TurnContext:
+    turn_type: str = USER_TURN
+    message: str = ""
+    history_length: int = 0
+    failures: int = 0
+
+
+@dataclass
+class Route:
+    tier: str
+    model: str
+    reason: str
+
+
+class ModelStats:
+    __slots__ = ("calls", "latency_ewma", "prompt_tokens", "completion_tokens", "cost_usd")
+
+    def __init__(self):
+        self.calls = 0
+        self.latency_ewma = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost_usd = 0.0
+
+
+def needs_tools(message: str) -> bool:
+    """Heuristic: does the user message look like it needs order tools?"""
+    return bool(message and _TOOL_HINTS.search(message))
+
+
+class ModelRouter:
+    def __init__(self, candidates: Dict[str, dict], enabled: bool = True):
+        self.candidates = candidates
+        self.enabled = enabled
+        self.stats: Dict[str, ModelStats] = {}
+        self._by_model = {config["model"]: config for config in candidates.values()}
+
+    def _route(self, tier: str, reason: str) -> Route:
+        model_routes_total.inc(1, tier, reason)
+        return Route(tier, self.candidates[tier]["model"], reason)
+
+    def choose(self, context: TurnContext) -> Route:
+        """Choose the model tier for the next model call"""
+        if not self.enabled:
+            return Route("standard", MODEL, "routing_disabled")
+
+        if context.history_length >= MODEL_ROUTING_LONG_HISTORY:
+            return self._route("large", "long_history")
+
+        if context.turn_type == TOOL_FOLLOWUP:
+            tier, reason = "small", "tool_followup"
+        elif needs_tools(context.message):
+            tier, reason = "standard", "needs_tools"
+        else:
+            tier, reason = "small", "simple_turn"
+
+        if context.failures:
+            # Escalate one tier per recent failure
+            index = min(TIERS.index(tier) + context.failures, len(TIERS) - 1)
+            tier, reason = TIERS[index], "after_failure"
+
+        return self._route(tier, reason)
+
+    def record_usage(self, model: str, latency: float, usage=None):
+        """Record a call from an OpenAI-format usage object"""
+        self.record_call(
+            model,
+            latency,
+            getattr(usage, "prompt_tokens", 0) or 0,
+            getattr(usage, "completion_tokens", 0) or 0,
+        )
+
+    def record_call(self, model: str, latency: float, prompt_tokens: int = 0, completion_tokens: int = 0):
+        """Record latency and estimated cost of a completed model call"""
+        stats = self.stats.get(model)
+        if stats is None:
+            stats = self.stats[model] = ModelStats()
+        stats.calls += 1
+        stats.latency_ewma = latency if stats.calls == 1 else 0.8 * stats.latency_ewma + 0.2 * latency
+
+        config = self._by_model.get(model)
+        if config and latency > config["latency_budget_seconds"]:
+            model_latency_budget_exceeded_total.inc(1, model)
+
+        stats.prompt_tokens += prompt_tokens
+        stats.completion_tokens += completion_tokens
+        if config:
+            cost = (
+                prompt_tokens * config["input_cost_per_mtok"] + completion_tokens * config["output_cost_per_mtok"]
+            ) / 1_000_000
+            stats.cost_usd += cost
+            llm_cost_usd_total.inc(cost, model)
+
+    def summary(self) -> Dict[str, dict]:
+        return {
+            model: {
+                "calls": stats.calls,
+                "latency_ewma": round(stats.latency_ewma, 3),
+                "prompt_tokens": stats.prompt_tokens,
+                "completion_tokens": stats.completion_tokens,
+                "cost_usd": round(stats.cost_usd, 6),
+            }
+            for model, stats in self.stats.items()
+        }
+
+
+# Global model router instance
+model_router = ModelRouter(MODEL_CANDIDATES, MODEL_ROUTING_ENABLED)
+
+
+def turn_context_for(history, message: str = "", failures: int = 0) -> TurnContext:
+    """Build a routing context from a session History or an OpenAI-format/LangChain message list"""
+    last_role: Optional[str] = None
+    if history:
+        last = history[-1]
+        if isinstance(last, dict):
+            last_role = last.get("role")
+        else:
+            # history.Message has .role, LangChain messages have .type
+            last_role = getattr(last, "role", None) or getattr(last, "type", None)
+    turn_type = TOOL_FOLLOWUP if last_role == "tool" else USER_TURN
+    if turn_type == USER_TURN and not message and history:
+        last = history[-1]
+        message = (last.get("content") if isinstance(last, dict) else getattr(last, "content", "")) or ""
+    return TurnContext(turn_type=turn_type, message=message, history_length=len(history), failures=failures)
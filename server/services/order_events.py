@@ -0,0 +1,76 @@
+"""
+Order status history backed by the append-only order_events table
+
+Every status transition is an insert into order_events; Order.status and
+Order.status_changed_at are kept as a compact projection of the latest event
+so current-status lookups stay a single-row read.
+"""
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from config import ORDER_EVENTS_PARTITION_MONTHS_AHEAD
+from database import Order, OrderEvent
+from services.metrics import registry
+
+order_events_total = registry.counter("order_events_total", "Order status transitions recorded", ("to_status", "source"))
+
+
+def record_transition(db: Session, order: Order, to_status: str, source: str, details: Optional[dict] = None) -> OrderEvent:
+    """
+    Append a status transition and update the order's status projection.
+
+    Does not commit: the event and the projection are written in the caller's
+    transaction.
+    """
+    now = datetime.utcnow()
+    event = OrderEvent(
+        order_id=order.order_id,
+        user_id=order.user_id,
+        from_status=order.status,
+        to_status=to_status,
+        source=source,
+        details=details,
+        occurred_at=now,
+    )
+    db.add(event)
+    order.status = to_status
+    order.status_changed_at = now
+    order_events_total.inc(1, to_status, source)
+    return event
+
+
+def get_timeline(db: Session, order_id: str) -> List[OrderEvent]:
+    """All status transitions of an order, oldest first"""
+    return (
+        db.query(OrderEvent)
+        .filter(OrderEvent.order_id == order_id)
+        .order_by(OrderEvent.occurred_at, OrderEvent.id)
+        .all()
+    )
+
+
+def ensure_partitions(months_ahead: int = ORDER_EVENTS_PARTITION_MONTHS_AHEAD) -> List[str]:
+    """Create upcoming monthly order_events partitions (PostgreSQL only); run on every deploy"""
+    from database import engine
+    from migrations import MigrationContext
+
+    if engine.dialect.name != "postgresql":
+        return []
+    today = date.today()
+    try:
+        # One transaction: rows the default partition holds for a new month move with it
+        with engine.begin() as connection:
+            created = MigrationContext(connection).create_month_partitions(
+                "order_events", date(today.year, today.month, 1), months_ahead + 1, key="occurred_at"
+            )
+    except Exception as e:
+        print(
+            f"ERROR: Could not create order_events partitions ({e}); new events keep going to "
+            f"order_events_default until a later deploy creates them"
+        )
+        return []
+    for name in created:
+        print(f"Created partition {name}")
+    return created
@@ -0,0 +1,39 @@
+"""
+Company policies
+
+Single source for the policies in the web agent's system prompt
+(config.SYSTEM_PROMPT), the main.py CLI agent's instructions and the FAQ index
+(services/faq.py), so model answers and local FAQ answers agree. Kept free of other imports so the
+CLI agents can use it without loading the server.
+"""
+
+# topic: customer-facing text, a note for the model only, extra FAQ search terms
+COMPANY_POLICIES = [
+    {
+        "topic": "Refunds",
+        "text": "Available within 30 days of purchase",
+        "note": "",
+        "keywords": "refund money back return window days purchase",
+    },
+    {
+        "topic": "Shipping",
+        "text": "3-5 business days for standard shipping",
+        "note": "",
+        "keywords": "ship delivery deliver arrive take long fast days standard",
+    },
+    {
+        "topic": "Support hours",
+        "text": "24/7",
+        "note": "you're always available!",
+        "keywords": "support hours open available contact time",
+    },
+]
+
+
+def policy_prompt_lines() -> str:
+    """'- Topic: text (note)' lines for an agent's instructions"""
+    lines = []
+    for policy in COMPANY_POLICIES:
+        note = f" ({policy['note']})" if policy["note"] else ""
+        lines.append(f"- {policy['topic']}: {policy['text']}{note}")
+    return "\n".join(lines)
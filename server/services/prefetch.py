@@ -0,0 +1,94 @@
+"""
+Speculative order prefetch for agent turns
+
+Most user messages name the order they are about ("status of ORD-001?"), but
+the model only asks for get_order_status after its first completion. The
+prefetch starts loading every order ID found in the message in worker threads
+(each with its own read session) as the turn begins, so the later tool call
+is served from this per-turn cache instead of a serial DB round-trip.
+"""
+import asyncio
+import re
+from typing import Dict, List, Optional
+
+from config import ORDER_PREFETCH_MAX_ORDERS
+from database import read_session
+from services.metrics import registry
+from services.tools import get_order_status, sticky_keys
+
+# hit: tool call served from the prefetch; miss: tool call for an order that was
+# not prefetched; waste: prefetched order the model never asked for
+order_prefetch_total = registry.counter("order_prefetch_total", "Speculative order prefetch outcomes", ("outcome",))
+
+# Matched in any case, but prefetched and looked up exactly as written:
+# get_order_status compares IDs case-sensitively, so "ord-001" must not get ORD-001's row
+ORDER_ID_PATTERN = re.compile(r"\bORD-[A-Z0-9]+\b", re.IGNORECASE)
+
+
+def extract_order_ids(message: str, limit: int = ORDER_PREFETCH_MAX_ORDERS) -> List[str]:
+    """Distinct order IDs mentioned in a message, in order of appearance"""
+    ids = dict.fromkeys(ORDER_ID_PATTERN.findall(message or ""))
+    return list(ids)[:limit]
+
+
+def _load(order_id: str, current_user: Optional[Dict[str, str]]) -> dict:
+    with read_session(*sticky_keys(order_id, current_user)) as db:
+        return get_order_status(db, order_id, current_user=current_user)
+
+
+class OrderPrefetch:
+    """Per-turn cache of get_order_status results loaded ahead of the tool call"""
+
+    def __init__(self, order_ids: List[str], current_user: Optional[Dict[str, str]]):
+        self.current_user = current_user
+        self._tasks: Dict[str, asyncio.Task] = {
+            order_id: asyncio.ensure_future(asyncio.to_thread(_load, order_id, current_user))
+            for order_id in order_ids
+        }
+        self._used = set()
+
+    @classmethod
+    def start(cls, message: str, current_user: Optional[Dict[str, str]]) -> Optional["OrderPrefetch"]:
+        order_ids = extract_order_ids(message)
+        if not order_ids:
+            return None
+        print(f"DEBUG: Prefetching orders {order_ids}")
+        return cls(order_ids, current_user)
+
+    async def take(self, order_id: Optional[str]) -> Optional[dict]:
+        """Prefetched get_order_status result for order_id, or None if it was not prefetched"""
+        task = self._tasks.get(order_id)
+        if task is None:
+            order_prefetch_total.inc(1, "miss")
+            return None
+        try:
+            # Usually finished already; if not, waiting still beats starting a new query
+            result = await task
+        except Exception as e:
+            print(f"DEBUG: Prefetch of {order_id} failed: {e}")
+            order_prefetch_total.inc(1, "miss")
+            return None
+        self._used.add(order_id)
+        order_prefetch_total.inc(1, "hit")
+        return result
+
+    def invalidate(self, order_id: Optional[str]):
+        """Drop a prefetched order after a tool wrote to it (the cached result is stale)"""
+        task = self._tasks.pop(order_id, None)
+        if task is not None:
+            _discard(task)
+
+    def finish(self):
+        """Count prefetched orders the model never asked for"""
+        wasted = [order_id for order_id in self._tasks if order_id not in self._used]
+        if wasted:
+            order_prefetch_total.inc(len(wasted), "waste")
+            print(f"DEBUG: Prefetched orders not used this turn: {wasted}")
+        for task in self._tasks.values():
+            _discard(task)
+        self._tasks.clear()
+
+
+def _discard(task: asyncio.Task):
+    # Retrieve the exception of an unused task so it is not logged as never retrieved
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
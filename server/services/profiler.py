@@ -0,0 +1,66 @@
+"""
+Sampling profiler producing collapsed stacks
+
+A background thread snapshots every other thread's stack (sys._current_frames)
+at a fixed interval and counts identical stacks. Output is the collapsed
+format read by flamegraph.pl, speedscope and inferno:
+
+    MainThread;uvicorn/main.py:run;...;services/agent.py:process_agent_message 42
+
+Nothing is traced between samples, so the overhead is one stack walk per
+thread per interval and it is safe to run against production traffic.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running"""
+
+
+_profile_lock = threading.Lock()
+
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    if filename.startswith(SERVER_DIR):
+        filename = os.path.relpath(filename, SERVER_DIR)
+    else:
+        # Keep the package-relative tail of library paths (uvicorn/main.py)
+        filename = os.path.join(*filename.split(os.sep)[-2:])
+    return f"{filename}:{code.co_name}".replace(";", ":").replace(" ", "_")
+
+
+def sample(seconds: float, interval: float) -> Dict[str, int]:
+    """Sample all threads for the given duration; returns collapsed stack -> count"""
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        me = threading.get_ident()
+        stacks: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, f"thread-{thread_id}"))
+                stacks[";".join(reversed(labels))] += 1
+            time.sleep(interval)
+        return stacks
+    finally:
+        _profile_lock.release()
+
+
+def collapsed(stacks: Dict[str, int]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
@@ -0,0 +1,56 @@
+"""
+Deterministic responses for well-known tool outcomes
+
+After a verification code is submitted, the answer is fully determined by the
+cancellation result ("cancelled", "invalid code", ...). Rendering it locally
+skips a model round-trip; unrecognised outcomes return None and fall back to
+the model.
+"""
+from typing import List, Optional
+
+
+def _orders_label(order_ids: List[str]) -> str:
+    if len(order_ids) == 1:
+        return f"order {order_ids[0]}"
+    return "orders " + ", ".join(order_ids[:-1]) + f" and {order_ids[-1]}"
+
+
+def render_cancellation_result(result: dict, pending: dict) -> Optional[str]:
+    """Assistant reply for a cancellation attempt, or None if the outcome is not a known one"""
+    order_ids = pending.get("order_ids") or [pending.get("order_id")]
+    label = _orders_label(order_ids)
+
+    if result.get("success"):
+        refund = result.get("refund_amount")
+        refund_text = f" A refund of ${refund:.2f} will be issued to your original payment method." if refund is not None else ""
+        verb = "has" if len(order_ids) == 1 else "have"
+        return f"Your {label} {verb} been cancelled successfully.{refund_text} Is there anything else I can help you with?"
+
+    error = result.get("error") or ""
+    if "invalid verification code" in error.lower():
+        return (
+            f"That verification code doesn't match the one we sent for {label}, so nothing was cancelled. "
+            "Please check the code in your email and try again, or ask me to send a new one."
+        )
+
+    # Bulk cancellations are all-or-nothing and report the offending order as "ORD-...: problem"
+    nothing_done = "so nothing was cancelled"
+    if len(order_ids) > 1:
+        offending, _, error = error.partition(": ")
+        if not error:
+            return None
+        label = _orders_label([offending])
+        nothing_done = "so none of the orders were cancelled"
+
+    error = error.lower()
+    if "already been cancelled" in error:
+        return f"It looks like {label} has already been cancelled, {nothing_done}."
+    if "not found" in error:
+        return f"I couldn't find {label} on your account, {nothing_done}. Please double-check the order ID."
+    return None
+
+
+def render_cancellation_declined(pending: dict) -> str:
+    """Assistant reply when the user declines the cancellation"""
+    label = _orders_label(pending.get("order_ids") or [pending.get("order_id")])
+    return f"No problem, {label} will not be cancelled. Is there anything else I can help you with?"
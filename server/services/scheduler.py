@@ -0,0 +1,219 @@
+"""
+Bounded scheduler for background agent jobs
+
+Replaces fire-and-forget asyncio.create_task calls with a scheduler that:
+- caps concurrent jobs globally and per user
+- dispatches queued jobs round-robin across users (fair queuing)
+- emits "queued" events with the job's queue position to the client
+- cancels a session's jobs when its SSE client disconnects and does not return
+- drains running jobs on shutdown
+"""
+import asyncio
+import itertools
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from config import (
+    AGENT_MAX_CONCURRENT_TASKS,
+    AGENT_MAX_TASKS_PER_USER,
+    AGENT_DISCONNECT_GRACE_SECONDS,
+    AGENT_SHUTDOWN_DRAIN_SECONDS,
+)
+from services.session_manager import session_manager
+from services.metrics import registry, agent_tasks_in_flight
+
+agent_tasks_queued = registry.gauge("agent_tasks_queued", "Agent jobs waiting for a scheduler slot")
+agent_jobs_total = registry.counter("agent_jobs_total", "Agent jobs by kind and outcome", ("kind", "outcome"))
+
+
+class SchedulerClosed(Exception):
+    """Raised when submitting a job while the scheduler is draining"""
+
+
+class AgentJob:
+    __slots__ = ("id", "session_id", "user_key", "kind", "factory", "task", "position", "done")
+
+    def __init__(self, job_id: int, session_id: str, user_key: str, kind: str, factory: Callable[[], Awaitable[None]]):
+        self.id = job_id
+        self.session_id = session_id
+        self.user_key = user_key
+        self.kind = kind
+        self.factory = factory
+        self.task: Optional[asyncio.Task] = None
+        self.position: Optional[int] = None
+        self.done = asyncio.Event()
+
+
+class AgentScheduler:
+    def __init__(self, max_concurrent: int, max_per_user: int):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        # Per-user FIFO queues; key order is the round-robin rotation
+        self._queues: "OrderedDict[str, Deque[AgentJob]]" = OrderedDict()
+        self._running: Dict[str, int] = {}
+        # Strong references so running tasks are never garbage collected
+        self._active: Set[AgentJob] = set()
+        self._cancel_timers: Dict[str, asyncio.TimerHandle] = {}
+        self._ids = itertools.count(1)
+        self._draining = False
+
+    @property
+    def running(self) -> int:
+        return len(self._active)
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def submit(self, session_id: str, user_key, kind: str, factory: Callable[[], Awaitable[None]]) -> AgentJob:
+        """Queue an agent job; it starts as soon as global and per-user capacity allow"""
+        if self._draining:
+            raise SchedulerClosed("Server is shutting down")
+
+        user_key = str(user_key)
+        job = AgentJob(next(self._ids), session_id, user_key, kind, factory)
+        self._queues.setdefault(user_key, deque()).append(job)
+        self._dispatch()
+        return job
+
+    def _dispatch(self):
+        """Start queued jobs round-robin across users until capacity is exhausted"""
+        progressed = True
+        while progressed and len(self._active) < self.max_concurrent and self._queues:
+            progressed = False
+            for user_key in list(self._queues.keys()):
+                if len(self._active) >= self.max_concurrent:
+                    break
+                if self._running.get(user_key, 0) >= self.max_per_user:
+                    continue
+
+                queue = self._queues[user_key]
+                job = queue.popleft()
+                if queue:
+                    # Rotate this user to the back so others get the next slot
+                    self._queues.move_to_end(user_key)
+                else:
+                    del self._queues[user_key]
+
+                self._start(job)
+                progressed = True
+
+        agent_tasks_queued.set(self.queued)
+        self._publish_positions()
+
+    def _start(self, job: AgentJob):
+        self._running[job.user_key] = self._running.get(job.user_key, 0) + 1
+        self._active.add(job)
+        agent_tasks_in_flight.inc(1, job.kind)
+        job.task = asyncio.create_task(self._run(job))
+
+    async def _run(self, job: AgentJob):
+        outcome = "ok"
+        try:
+            await job.factory()
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            print(f"DEBUG: Agent job {job.id} ({job.kind}) cancelled for session {job.session_id}")
+        except Exception as e:
+            outcome = "error"
+            print(f"ERROR in agent job {job.id} ({job.kind}): {e}")
+        finally:
+            agent_jobs_total.inc(1, job.kind, outcome)
+            agent_tasks_in_flight.dec(1, job.kind)
+            self._active.discard(job)
+            remaining = self._running.get(job.user_key, 1) - 1
+            if remaining:
+                self._running[job.user_key] = remaining
+            else:
+                self._running.pop(job.user_key, None)
+            job.done.set()
+            self._dispatch()
+
+    def _queued_in_order(self) -> List[AgentJob]:
+        return sorted(itertools.chain.from_iterable(self._queues.values()), key=lambda job: job.id)
+
+    def _publish_positions(self):
+        """Tell waiting clients where their job sits in the queue"""
+        queued = self._queued_in_order()
+        for position, job in enumerate(queued, start=1):
+            if job.position != position:
+                job.position = position
+                session_manager.emit_event_nowait(
+                    job.session_id, "queued", {"position": position, "queued": len(queued)}
+                )
+
+    def _remove_queued(self, session_id: str) -> int:
+        removed = 0
+        for user_key in list(self._queues.keys()):
+            queue = self._queues[user_key]
+            kept = deque(job for job in queue if job.session_id != session_id)
+            for job in queue:
+                if job.session_id == session_id:
+                    agent_jobs_total.inc(1, job.kind, "cancelled")
+                    job.done.set()
+                    removed += 1
+            if kept:
+                self._queues[user_key] = kept
+            else:
+                del self._queues[user_key]
+        return removed
+
+    def cancel_session(self, session_id: str) -> int:
+        """Cancel queued and running jobs for a session"""
+        self._cancel_timers.pop(session_id, None)
+        cancelled = self._remove_queued(session_id)
+        for job in list(self._active):
+            if job.session_id == session_id and job.task and not job.task.done():
+                job.task.cancel()
+                cancelled += 1
+        if cancelled:
+            print(f"DEBUG: Cancelled {cancelled} agent job(s) for session {session_id}")
+        self._dispatch()
+        return cancelled
+
+    def has_jobs(self, session_id: str) -> bool:
+        if any(job.session_id == session_id for job in self._active):
+            return True
+        return any(job.session_id == session_id for queue in self._queues.values() for job in queue)
+
+    def client_disconnected(self, session_id: str):
+        """Cancel the session's jobs unless the SSE client reconnects within the grace period"""
+        if not self.has_jobs(session_id) or session_id in self._cancel_timers:
+            return
+        loop = asyncio.get_running_loop()
+        self._cancel_timers[session_id] = loop.call_later(
+            AGENT_DISCONNECT_GRACE_SECONDS, self.cancel_session, session_id
+        )
+
+    def client_connected(self, session_id: str):
+        """Keep jobs alive when the SSE client reconnects"""
+        timer = self._cancel_timers.pop(session_id, None)
+        if timer:
+            timer.cancel()
+
+    async def drain(self, timeout: float = AGENT_SHUTDOWN_DRAIN_SECONDS):
+        """Stop accepting jobs, let queued and running jobs finish, then cancel stragglers"""
+        self._draining = True
+        for timer in self._cancel_timers.values():
+            timer.cancel()
+        self._cancel_timers.clear()
+
+        pending = [job.done.wait() for job in self._active]
+        pending += [job.done.wait() for job in self._queued_in_order()]
+        if not pending:
+            return
+
+        print(f"DEBUG: Draining {self.running} running and {self.queued} queued agent job(s)")
+        try:
+            await asyncio.wait_for(asyncio.gather(*pending), timeout=timeout)
+        except asyncio.TimeoutError:
+            print("DEBUG: Agent drain timed out, cancelling remaining jobs")
+            for session_id in {job.session_id for job in self._active} | {job.session_id for job in self._queued_in_order()}:
+                self.cancel_session(session_id)
+            tasks = [job.task for job in list(self._active) if job.task]
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Global agent scheduler instance
+agent_scheduler = AgentScheduler(AGENT_MAX_CONCURRENT_TASKS, AGENT_MAX_TASKS_PER_USER)
@@ -0,0 +1,207 @@
+"""
+JSON encoding and decoding for events, tool results and tool arguments
+
+One place decides how JSON is produced: orjson or msgspec when installed
+(several times faster than the json module, and both encode straight to
+bytes), otherwise the standard library. JSON_BACKEND pins a backend.
+
+- dumps / dumpb: compact JSON as str (history content) or bytes (SSE, NDJSON)
+- sse_event: a complete "data: ...\\n\\n" SSE frame as bytes
+- ToolArgumentDecoder: parses and validates tool-call arguments against the
+  tools' JSON schemas, so malformed arguments become a tool error the model
+  can correct instead of a failed turn
+"""
+import importlib.util
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import JSON_BACKEND
+
+
+class ToolArgumentsError(ValueError):
+    """Tool-call arguments that are not valid JSON or do not match the tool's schema"""
+
+
+def _select_backend(requested: str) -> str:
+    candidates = ("orjson", "msgspec", "stdlib") if requested == "auto" else (requested,)
+    for name in candidates:
+        if name == "stdlib" or importlib.util.find_spec(name) is not None:
+            return name
+        print(f"Warning: {name} is not installed, falling back to the json module")
+    return "stdlib"
+
+
+BACKEND = _select_backend(JSON_BACKEND)
+# Tool arguments are decoded into msgspec structs when msgspec is the backend, or installed and the backend is auto
+TYPED_TOOL_ARGUMENTS = BACKEND == "msgspec" or (JSON_BACKEND == "auto" and importlib.util.find_spec("msgspec") is not None)
+
+
+def _stdlib_default(obj):
+    # datetimes and similar in tool results; orjson/msgspec encode them natively
+    return obj.isoformat() if hasattr(obj, "isoformat") else str(obj)
+
+
+_stdlib_encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=_stdlib_default)
+_stdlib_sorted_encoder = json.JSONEncoder(
+    separators=(",", ":"), ensure_ascii=False, sort_keys=True, default=_stdlib_default
+)
+
+
+def _build_codec(backend: str) -> Tuple[Callable[[Any], bytes], Callable[[Any], bytes], Callable[[Any], Any]]:
+    """(encode, encode_sorted, decode) for a backend"""
+    if backend == "orjson":
+        import orjson
+
+        options = orjson.OPT_NON_STR_KEYS
+
+        def encode(obj) -> bytes:
+            return orjson.dumps(obj, default=str, option=options)
+
+        def encode_sorted(obj) -> bytes:
+            return orjson.dumps(obj, default=str, option=options | orjson.OPT_SORT_KEYS)
+
+        return encode, encode_sorted, orjson.loads
+
+    if backend == "msgspec":
+        import msgspec
+
+        encoder = msgspec.json.Encoder(enc_hook=str)
+        sorted_encoder = msgspec.json.Encoder(enc_hook=str, order="sorted")
+        decoder = msgspec.json.Decoder()
+
+        def decode(data):
+            try:
+                return decoder.decode(data)
+            except msgspec.DecodeError as e:
+                raise ValueError(str(e)) from None
+
+        return encoder.encode, sorted_encoder.encode, decode
+
+    def encode(obj) -> bytes:
+        return _stdlib_encoder.encode(obj).encode()
+
+    def encode_sorted(obj) -> bytes:
+        return _stdlib_sorted_encoder.encode(obj).encode()
+
+    return encode, encode_sorted, json.loads
+
+
+_encode, _encode_sorted, _decode = _build_codec(BACKEND)
+
+
+def dumpb(obj: Any, sort_keys: bool = False) -> bytes:
+    """Compact UTF-8 JSON bytes"""
+    return _encode_sorted(obj) if sort_keys else _encode(obj)
+
+
+def dumps(obj: Any) -> str:
+    """Compact JSON text (for message content, which must be a str)"""
+    return _encode(obj).decode()
+
+
+def loads(data) -> Any:
+    """Parse JSON from str or bytes; raises ValueError on invalid input"""
+    return _decode(data)
+
+
+def sse_event(event: dict) -> bytes:
+    """One Server-Sent Events frame carrying the event as JSON"""
+    return b"data: " + _encode(event) + b"\n\n"
+
+
+# ============================================================================
+# Typed tool-argument decoding
+# ============================================================================
+
+_SCHEMA_TYPES = {"string": str, "integer": int, "number": float, "boolean": bool}
+
+
+def _python_type(schema: dict):
+    if schema.get("type") == "array":
+        return List[_python_type(schema.get("items", {}))]
+    return _SCHEMA_TYPES.get(schema.get("type"), Any)
+
+
+def _matches(value, schema: dict) -> bool:
+    kind = schema.get("type")
+    if kind == "array":
+        return isinstance(value, list) and all(_matches(item, schema.get("items", {})) for item in value)
+    if kind == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if kind == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    expected = _SCHEMA_TYPES.get(kind)
+    return expected is None or isinstance(value, expected)
+
+
+class _ToolSpec:
+    __slots__ = ("properties", "required", "struct")
+
+    def __init__(self, name: str, parameters: dict):
+        self.properties: Dict[str, dict] = parameters.get("properties", {})
+        self.required = set(parameters.get("required", ()))
+        self.struct = None
+        if TYPED_TOOL_ARGUMENTS:
+            import msgspec
+
+            # Required fields first: msgspec needs defaulted fields last
+            fields = [(field, _python_type(self.properties[field])) for field in self.properties if field in self.required]
+            fields += [
+                (field, Optional[_python_type(schema)], None)
+                for field, schema in self.properties.items()
+                if field not in self.required
+            ]
+            self.struct = msgspec.defstruct(f"{name}_arguments", fields)
+
+
+class ToolArgumentDecoder:
+    """Decode tool-call argument strings into validated keyword arguments"""
+
+    def __init__(self, tools: List[dict]):
+        self._specs = {
+            tool["function"]["name"]: _ToolSpec(tool["function"]["name"], tool["function"].get("parameters", {}))
+            for tool in tools
+            if tool.get("type") == "function"
+        }
+
+    def decode(self, name: str, raw: Optional[str]) -> dict:
+        """
+        Keyword arguments for the tool: unknown fields are dropped and omitted
+        optional fields are left out. Raises ToolArgumentsError.
+        """
+        spec = self._specs.get(name)
+        raw = raw or "{}"
+        if spec is not None and spec.struct is not None:
+            import msgspec
+
+            try:
+                decoded = msgspec.json.decode(raw, type=spec.struct)
+            except msgspec.DecodeError as e:  # covers ValidationError
+                raise ToolArgumentsError(str(e)) from None
+            return {
+                field: getattr(decoded, field)
+                for field in spec.properties
+                if field in spec.required or getattr(decoded, field) is not None
+            }
+
+        try:
+            arguments = _decode(raw)
+        except ValueError as e:
+            raise ToolArgumentsError(f"Invalid JSON: {e}") from None
+        if not isinstance(arguments, dict):
+            raise ToolArgumentsError("Expected a JSON object")
+        if spec is None:
+            return arguments
+
+        missing = sorted(spec.required - arguments.keys())
+        if missing:
+            raise ToolArgumentsError(f"Missing required argument(s): {', '.join(missing)}")
+        result = {}
+        for field, schema in spec.properties.items():
+            value = arguments.get(field)
+            if value is None and field not in spec.required:
+                continue
+            if not _matches(value, schema):
+                raise ToolArgumentsError(f"Expected `{schema.get('type')}` for `{field}`")
+            result[field] = value
+        return result
@@ -2,21 +2,45 @@
 Session management for SSE connections
 """
 import asyncio
+import time
 import uuid
-from typing import Optional, Dict
+from functools import partial
+from typing import Callable, Optional, Dict, List
 from sqlalchemy.orm import Session
 
-from database import SessionLocal, User
+from config import TRANSCRIPTS_ENABLED, SESSION_IDLE_EVICT_SECONDS
+from database import User, read_session, user_key
+from services.history import History, Message
+from services.metrics import registry
+from services.serialization import dumps
+from services.transcripts import transcript_writer, conversation_owner, load_conversation
+
+sessions_rehydrated_total = registry.counter(
+    "sessions_rehydrated_total", "Sessions loaded back from the database by outcome", ("outcome",)
+)
+sessions_evicted_total = registry.counter("sessions_evicted_total", "Idle sessions evicted from memory")
 
 
 class SessionManager:
     def __init__(self):
         # In-memory storage only for event queues (SSE streams)
-        # Session data is not persisted, only event queues are kept
         self.event_queues: Dict[str, asyncio.Queue] = {}
-        # Keep in-memory history and pending_approval for active sessions
-        # These are not persisted to database
+        # Keep in-memory history and pending_approval for active sessions;
+        # both are mirrored to the database by services/transcripts.py
         self.sessions: Dict[str, Dict] = {}
+        # Last use of each session (monotonic), for idle eviction
+        self.last_used: Dict[str, float] = {}
+        # Open SSE streams per session; sessions with a live stream are never evicted
+        self.streams: Dict[str, int] = {}
+        # In-progress loads from the database, shared by concurrent requests
+        self._rehydrating: Dict[str, asyncio.Task] = {}
+        # Per-session turn locks so only one agent turn mutates history at a time
+        self.turn_locks: Dict[str, asyncio.Lock] = {}
+        # User messages accepted by /api/chat but not yet picked up by a turn
+        self.pending_messages: Dict[str, List[str]] = {}
+        # In agent worker processes: called with (session_id, kind, payload) to send
+        # events and state changes back to the web tier instead of applying them here
+        self.relay: Optional[Callable[[str, str, dict], None]] = None
 
     def create_session(self, current_user: Optional[Dict[str, str]] = None) -> str:
         """Create a new session with optional user information"""
@@ -24,7 +48,7 @@ class SessionManager:
 
         # Build session data
         session_data = {
-            "history": [],
+            "history": self._history(session_id),
             "pending_approval": None,
             "current_response": "",
         }
@@ -34,7 +58,7 @@ class SessionManager:
             user_id = current_user.get("id")
             if user_id:
                 # Fetch user from database
-                db: Session = SessionLocal()
+                db: Session = read_session(user_key(user_id))
                 try:
                     user = db.query(User).filter(User.id == user_id).first()
                     if user:
@@ -49,11 +73,103 @@ class SessionManager:
 
         self.sessions[session_id] = session_data
         self.event_queues[session_id] = asyncio.Queue()
+        self.last_used[session_id] = time.monotonic()
+        if TRANSCRIPTS_ENABLED:
+            transcript_writer.conversation_started(session_id, session_data.get("user_id"))
         return session_id
 
+    def _history(self, session_id: str, messages=None) -> History:
+        on_append = partial(transcript_writer.message_appended, session_id) if TRANSCRIPTS_ENABLED else None
+        return History(messages, on_append=on_append)
+
     def get_session(self, session_id: str) -> Optional[Dict]:
         """Get session data from in-memory storage"""
-        return self.sessions.get(session_id)
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self.last_used[session_id] = time.monotonic()
+        return session
+
+    async def ensure_session(self, session_id: str, user_id=None) -> Optional[Dict]:
+        """
+        Get a session, loading it from the database if it is not in memory
+        (after a restart or eviction). With user_id, sessions belonging to
+        another user are treated as missing; they are never loaded into memory.
+        """
+        session = self.get_session(session_id)
+        if session is None and TRANSCRIPTS_ENABLED:
+            # Unknown ids and other users' conversations cost one lookup, no flush or history load
+            stored, owner = await asyncio.to_thread(conversation_owner, session_id)
+            if not stored:
+                sessions_rehydrated_total.inc(1, "not_found")
+                return None
+            if user_id is not None and owner not in (None, user_id):
+                sessions_rehydrated_total.inc(1, "forbidden")
+                return None
+            task = self._rehydrating.get(session_id)
+            if task is None:
+                task = self._rehydrating[session_id] = asyncio.create_task(self._rehydrate(session_id))
+                task.add_done_callback(lambda _: self._rehydrating.pop(session_id, None))
+            session = await asyncio.shield(task)
+        if session is not None and user_id is not None and session.get("user_id") not in (None, user_id):
+            sessions_rehydrated_total.inc(1, "forbidden")
+            return None
+        return session
+
+    async def _rehydrate(self, session_id: str) -> Optional[Dict]:
+        # Writes for this session may still be buffered in this process
+        await transcript_writer.flush()
+        started = time.perf_counter()
+        stored = await asyncio.to_thread(load_conversation, session_id)
+        if stored is None:
+            sessions_rehydrated_total.inc(1, "not_found")
+            return None
+        if session_id in self.sessions:
+            return self.sessions[session_id]
+
+        session_data = {
+            "history": self._history(session_id, stored["messages"]),
+            "pending_approval": stored["pending_approval"],
+            "current_response": "",
+        }
+        if stored["user_id"]:
+            session_data["user_id"] = stored["user_id"]
+            session_data["user_name"] = stored["user_name"]
+            session_data["user_email"] = stored["user_email"]
+        self.sessions[session_id] = session_data
+        self.get_or_create_event_queue(session_id)
+        self.last_used[session_id] = time.monotonic()
+        sessions_rehydrated_total.inc(1, "loaded")
+        print(
+            f"DEBUG: Rehydrated session {session_id} with {len(stored['messages'])} messages "
+            f"in {(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+        return session_data
+
+    def set_pending_approval(self, session_id: str, pending: Optional[Dict]):
+        """Set (or clear) the approval a session is waiting for"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return
+        session["pending_approval"] = pending
+        if self.relay is not None:
+            self.relay(session_id, "state", {"pending_approval": pending})
+        elif TRANSCRIPTS_ENABLED:
+            transcript_writer.state_changed(session_id, pending_approval=pending)
+
+    def answer_cancelled_tool_calls(self, session_id: str):
+        """
+        Give tool calls left unanswered by a cancelled turn a "cancelled" result,
+        so the next model call gets a valid history. A call waiting for approval
+        keeps its slot.
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            return
+        waiting = (session.get("pending_approval") or {}).get("tool_call_id")
+        for tool_call_id in session["history"].unanswered_tool_calls():
+            if tool_call_id != waiting:
+                result = {"success": False, "error": "Cancelled before the tool finished"}
+                session["history"].append(Message.tool(tool_call_id, dumps(result)))
 
     def get_event_queue(self, session_id: str) -> Optional[asyncio.Queue]:
         """Get event queue for SSE streaming"""
@@ -68,6 +184,9 @@ class SessionManager:
 
     async def emit_event(self, session_id: str, event_type: str, data: dict):
         """Emit an event to the SSE stream"""
+        if self.relay is not None:
+            self.relay(session_id, "event", {"type": event_type, "data": data})
+            return
         queue = self.get_event_queue(session_id)
         if queue:
             event = {"type": event_type, "data": data}
@@ -76,12 +195,88 @@ class SessionManager:
         else:
             print(f"DEBUG: No queue found for session {session_id}, cannot emit event {event_type}")
 
+    def emit_event_nowait(self, session_id: str, event_type: str, data: dict):
+        """Emit an event from synchronous code (event queues are unbounded)"""
+        if self.relay is not None:
+            self.relay(session_id, "event", {"type": event_type, "data": data})
+            return
+        queue = self.get_event_queue(session_id)
+        if queue:
+            queue.put_nowait({"type": event_type, "data": data})
+
+    def get_turn_lock(self, session_id: str) -> asyncio.Lock:
+        """Get the lock that serializes agent turns for a session"""
+        lock = self.turn_locks.get(session_id)
+        if lock is None:
+            lock = self.turn_locks[session_id] = asyncio.Lock()
+        return lock
+
+    def queue_user_message(self, session_id: str, message: str):
+        """Buffer a user message until the next turn for the session runs"""
+        self.pending_messages.setdefault(session_id, []).append(message)
+
+    def take_user_messages(self, session_id: str, coalesce: bool = True) -> List[str]:
+        """Take buffered user messages: all of them when coalescing, else the oldest one"""
+        pending = self.pending_messages.get(session_id)
+        if not pending:
+            return []
+        if coalesce:
+            taken = pending[:]
+            pending.clear()
+        else:
+            taken = [pending.pop(0)]
+        if not pending:
+            self.pending_messages.pop(session_id, None)
+        return taken
+
+    def stream_opened(self, session_id: str):
+        self.streams[session_id] = self.streams.get(session_id, 0) + 1
+
+    def stream_closed(self, session_id: str):
+        remaining = self.streams.get(session_id, 0) - 1
+        if remaining > 0:
+            self.streams[session_id] = remaining
+        else:
+            self.streams.pop(session_id, None)
+        self.last_used[session_id] = time.monotonic()
+
     def cleanup_session(self, session_id: str):
         """Clean up session data and event queue from memory"""
         if session_id in self.sessions:
             del self.sessions[session_id]
         if session_id in self.event_queues:
             del self.event_queues[session_id]
+        self.turn_locks.pop(session_id, None)
+        self.pending_messages.pop(session_id, None)
+        self.last_used.pop(session_id, None)
+
+    def evict_idle(self, max_idle: float = SESSION_IDLE_EVICT_SECONDS) -> int:
+        """Drop persisted sessions nobody has used for max_idle seconds; they rehydrate on next use"""
+        from services.scheduler import agent_scheduler
+
+        cutoff = time.monotonic() - max_idle
+        evicted = 0
+        for session_id, last_used in list(self.last_used.items()):
+            if last_used > cutoff or session_id in self.streams or session_id in self.pending_messages:
+                continue
+            lock = self.turn_locks.get(session_id)
+            queue = self.event_queues.get(session_id)
+            if (lock and lock.locked()) or (queue and not queue.empty()) or agent_scheduler.has_jobs(session_id):
+                continue
+            self.cleanup_session(session_id)
+            evicted += 1
+        if evicted:
+            sessions_evicted_total.inc(evicted)
+            print(f"DEBUG: Evicted {evicted} idle session(s)")
+        return evicted
+
+    async def run_eviction(self, interval: float = 60.0):
+        """Evict idle sessions periodically (only when they can be rehydrated)"""
+        if not TRANSCRIPTS_ENABLED:
+            return
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_idle()
 
 
 # Global session manager instance
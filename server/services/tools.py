@@ -1,13 +1,25 @@
 """
 Database tool functions for order operations
 """
-from typing import Optional, Dict
+from typing import Optional, Dict, Iterator, List
+from sqlalchemy import ARRAY, String, any_, bindparam
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.orm.attributes import flag_modified
 import random
 import string
 
-from database import Order
+from config import BULK_CANCEL_MAX_ORDERS
+from database import Order, mark_write, user_key
+from services.order_events import record_transition, get_timeline
+
+
+# Only processing or shipped orders can be cancelled
+CANCELLABLE_STATUSES = ("processing", "shipped")
+
+
+def sticky_keys(order_id: str, current_user: Optional[Dict[str, str]] = None) -> tuple:
+    """Read-your-writes keys for an order tool call (see database.read_session)"""
+    return user_key(current_user.get("id") if current_user else None), f"order:{order_id}"
 
 
 def get_order_status(db: Session, order_id: str, current_user: Optional[Dict[str, str]] = None) -> dict:
@@ -27,26 +39,102 @@ def get_order_status(db: Session, order_id: str, current_user: Optional[Dict[str
             if order.user_id != user_id:
                 return {"success": False, "error": "Order not found"}
 
-        # Build response data
-        order_data = {
-            "order_id": order.order_id,
-            "customer": order.customer_name,
-            "status": order.status,
-            "items": order.items,
-            "total": order.total,
-            "date": order.date.strftime("%Y-%m-%d") if order.date else None,
-            "user_email": order.user.email if order.user else None,
-            "user_name": order.user.name if order.user else None,
-        }
-
         print(f"DEBUG: Retrieved order {order_id} for user {order.user_id}")
-        return {"success": True, "order": order_data}
+        return {"success": True, "order": serialize_order(order)}
 
     except Exception as e:
         print(f"Error fetching order status: {e}")
         return {"success": False, "error": "Database error"}
 
 
+def serialize_order(order: Order, user: Optional[Dict[str, str]] = None) -> dict:
+    """Order fields returned by the status tool and the batch status API"""
+    if user is None and order.user:
+        user = {"email": order.user.email, "name": order.user.name}
+    return {
+        "order_id": order.order_id,
+        "customer": order.customer_name,
+        "status": order.status,
+        "items": order.items,
+        "total": order.total,
+        "date": order.date.strftime("%Y-%m-%d") if order.date else None,
+        "user_email": user.get("email") if user else None,
+        "user_name": user.get("name") if user else None,
+    }
+
+
+def get_order_statuses(db: Session, order_ids: List[str], current_user: Dict[str, str]) -> Iterator[dict]:
+    """
+    Yield status results for many orders with a single query.
+
+    Same authorization as get_order_status: orders that do not exist or belong
+    to another user are reported as "Order not found". Found orders are
+    yielded as rows arrive, missing ones at the end.
+    """
+    wanted = list(dict.fromkeys(order_ids))
+    if db.get_bind().dialect.name == "postgresql":
+        # One array parameter instead of one bind parameter per id
+        id_filter = Order.order_id == any_(bindparam("order_ids", wanted, type_=ARRAY(String)))
+    else:
+        id_filter = Order.order_id.in_(wanted)
+
+    # The ownership filter makes current_user the owner of every row, so no user join is needed
+    query = (
+        db.query(Order)
+        .filter(id_filter, Order.user_id == current_user["id"])
+        .yield_per(500)
+    )
+
+    found = set()
+    for order in query:
+        found.add(order.order_id)
+        yield {"order_id": order.order_id, "success": True, "order": serialize_order(order, current_user)}
+
+    for order_id in wanted:
+        if order_id not in found:
+            yield {"order_id": order_id, "success": False, "error": "Order not found"}
+
+
+def get_order_timeline(db: Session, order_id: str, current_user: Optional[Dict[str, str]] = None) -> dict:
+    """Get the status history of an order from the order_events table"""
+    try:
+        events = get_timeline(db, order_id)
+
+        if not events:
+            # Orders without recorded events fall back to the status projection
+            order = db.query(Order).filter(Order.order_id == order_id).first()
+            if not order or (current_user and current_user.get("id") and order.user_id != current_user.get("id")):
+                return {"success": False, "error": "Order not found"}
+            changed_at = order.status_changed_at or order.date
+            return {
+                "success": True,
+                "order_id": order_id,
+                "current_status": order.status,
+                "timeline": [{"status": order.status, "at": changed_at.strftime("%Y-%m-%d %H:%M") if changed_at else None}],
+            }
+
+        # Authorization check: users can only access their own orders
+        if current_user and current_user.get("id") and events[0].user_id != current_user.get("id"):
+            return {"success": False, "error": "Order not found"}
+
+        timeline = [
+            {
+                "status": event.to_status,
+                "from_status": event.from_status,
+                "at": event.occurred_at.strftime("%Y-%m-%d %H:%M"),
+                "source": event.source,
+            }
+            for event in events
+        ]
+
+        print(f"DEBUG: Retrieved {len(timeline)} status events for order {order_id}")
+        return {"success": True, "order_id": order_id, "current_status": events[-1].to_status, "timeline": timeline}
+
+    except Exception as e:
+        print(f"Error fetching order timeline: {e}")
+        return {"success": False, "error": "Database error"}
+
+
 def generate_cancellation_code(db: Session, order_id: str, current_user: Optional[Dict[str, str]] = None) -> dict:
     """Generate verification code for cancellation from database"""
     try:
@@ -69,8 +157,7 @@ def generate_cancellation_code(db: Session, order_id: str, current_user: Optiona
             return {"success": False, "error": "This order has already been cancelled and cannot be cancelled again"}
 
         # Check if order can be cancelled (only processing or shipped orders can be cancelled)
-        cancellable_statuses = ["processing", "shipped"]
-        if order.status not in cancellable_statuses:
+        if order.status not in CANCELLABLE_STATUSES:
             return {"success": False, "error": f"This order cannot be cancelled because its status is '{order.status}'. Only orders with status 'processing' or 'shipped' can be cancelled"}
 
         # Get user email for sending email
@@ -91,6 +178,7 @@ def generate_cancellation_code(db: Session, order_id: str, current_user: Optiona
         flag_modified(order, "verification_codes")
 
         db.commit()
+        mark_write(*sticky_keys(order_id, current_user))
         db.refresh(order)
 
         print(f"DEBUG: Stored verification code {code} in DB for order {order_id}, verification_codes now: {order.verification_codes}")
@@ -150,8 +238,8 @@ def cancel_order_with_verification(db: Session, order_id: str, verification_code
         if not order.verification_codes or verification_code not in order.verification_codes:
             return {"success": False, "error": "Invalid verification code"}
 
-        # Update order status
-        order.status = "cancelled"
+        # Append the status transition (also updates the order's status projection)
+        record_transition(db, order, "cancelled", source="verification")
 
         # Remove used verification code
         order.verification_codes.remove(verification_code)
@@ -160,6 +248,7 @@ def cancel_order_with_verification(db: Session, order_id: str, verification_code
         flag_modified(order, "verification_codes")
 
         db.commit()
+        mark_write(*sticky_keys(order_id, current_user))
 
         user_name = order.user.name if order.user else order.customer_name
         user_email = order.user.email if order.user else None
@@ -177,3 +266,124 @@ def cancel_order_with_verification(db: Session, order_id: str, verification_code
     except Exception as e:
         print(f"Error cancelling order: {e}")
         return {"success": False, "error": "Database error"}
+
+
+def _cancellation_problem(order: Optional[Order]) -> Optional[str]:
+    if not order:
+        return "Order not found"
+    if order.status == "cancelled":
+        return "Order has already been cancelled"
+    if order.status not in CANCELLABLE_STATUSES:
+        return f"Order cannot be cancelled because its status is '{order.status}'"
+    return None
+
+
+def _owned_orders(db: Session, order_ids: List[str], current_user: Optional[Dict[str, str]], for_update: bool = False) -> Dict[str, Order]:
+    """Load the given orders in one query, restricted to the current user's orders"""
+    query = db.query(Order).filter(Order.order_id.in_(order_ids))
+    if current_user and current_user.get("id"):
+        query = query.filter(Order.user_id == current_user.get("id"))
+    if for_update:
+        query = query.with_for_update()
+    return {order.order_id: order for order in query}
+
+
+def generate_bulk_cancellation_code(db: Session, order_ids: List[str], current_user: Optional[Dict[str, str]] = None) -> dict:
+    """Generate one verification code (and send one email) covering several orders"""
+    try:
+        order_ids = list(dict.fromkeys(order_ids))
+        if not order_ids:
+            return {"success": False, "error": "No order IDs given"}
+        if len(order_ids) > BULK_CANCEL_MAX_ORDERS:
+            return {"success": False, "error": f"At most {BULK_CANCEL_MAX_ORDERS} orders can be cancelled at once"}
+
+        orders = _owned_orders(db, order_ids, current_user)
+
+        cancellable, skipped = [], []
+        for order_id in order_ids:
+            problem = _cancellation_problem(orders.get(order_id))
+            if problem:
+                skipped.append({"order_id": order_id, "error": problem})
+            else:
+                cancellable.append(orders[order_id])
+
+        if not cancellable:
+            return {"success": False, "error": "None of these orders can be cancelled", "skipped": skipped}
+
+        # One code shared by every order in the set
+        code = "".join(random.choices(string.digits, k=6))
+        for order in cancellable:
+            order.verification_codes = (order.verification_codes or []) + [code]
+            flag_modified(order, "verification_codes")
+
+        db.commit()
+        cancellable_ids = [order.order_id for order in cancellable]
+        mark_write(*(key for order_id in cancellable_ids for key in sticky_keys(order_id, current_user)))
+
+        owner = cancellable[0].user
+        user_email = owner.email if owner else None
+        user_name = owner.name if owner else cancellable[0].customer_name
+
+        print(f"DEBUG: Stored bulk verification code {code} for orders {cancellable_ids}")
+
+        # Send a single verification email for the whole set
+        if user_email:
+            from database import send_verification_email
+            send_verification_email(", ".join(cancellable_ids), code, user_email, user_name, order_count=len(cancellable_ids))
+
+        return {
+            "success": True,
+            "requires_approval": True,
+            "order_ids": cancellable_ids,
+            "skipped": skipped,
+            "code": code,
+            "message": f"Verification code sent for {len(cancellable_ids)} orders",
+            "user_email": user_email,
+            "user_name": user_name,
+        }
+
+    except Exception as e:
+        db.rollback()
+        print(f"Error generating bulk cancellation code: {e}")
+        return {"success": False, "error": "Database error"}
+
+
+def cancel_orders_with_verification(db: Session, order_ids: List[str], verification_code: str, current_user: Optional[Dict[str, str]] = None) -> dict:
+    """Cancel several orders with one verification code in a single transaction (all or nothing)"""
+    try:
+        orders = _owned_orders(db, order_ids, current_user, for_update=True)
+
+        for order_id in order_ids:
+            order = orders.get(order_id)
+            problem = _cancellation_problem(order)
+            if problem:
+                db.rollback()
+                return {"success": False, "error": f"{order_id}: {problem}"}
+            if not order.verification_codes or verification_code not in order.verification_codes:
+                db.rollback()
+                return {"success": False, "error": "Invalid verification code"}
+
+        for order_id in order_ids:
+            order = orders[order_id]
+            # Append the status transition (also updates the order's status projection)
+            record_transition(db, order, "cancelled", source="verification", details={"bulk": True})
+            order.verification_codes = [code for code in order.verification_codes if code != verification_code]
+            flag_modified(order, "verification_codes")
+
+        # Same changed columns on every row, so the flush batches the UPDATEs and event INSERTs
+        db.commit()
+        mark_write(*(key for order_id in order_ids for key in sticky_keys(order_id, current_user)))
+
+        print(f"DEBUG: Cancelled orders {order_ids} with one verification code")
+
+        return {
+            "success": True,
+            "message": f"{len(order_ids)} orders cancelled successfully",
+            "cancelled": order_ids,
+            "refund_amount": round(sum(orders[order_id].total for order_id in order_ids), 2),
+        }
+
+    except Exception as e:
+        db.rollback()
+        print(f"Error cancelling orders: {e}")
+        return {"success": False, "error": "Database error"}
@@ -0,0 +1,277 @@
+"""
+Chat transcript persistence
+
+Sessions are mirrored to the conversations/messages tables so they survive a
+restart or eviction from memory. Writes never happen on the request path:
+history appends and session state changes are queued in a write-behind
+buffer, and a background task flushes it every TRANSCRIPT_FLUSH_INTERVAL_SECONDS
+(or once TRANSCRIPT_FLUSH_BATCH writes are waiting) as a few batched
+statements in one transaction, run in a worker thread.
+
+If the batch fails, each conversation's writes are retried under their own
+savepoint, so a bad row only holds back its conversation; those writes are
+retried with the next flush and dropped after MAX_FLUSH_ATTEMPTS. When the
+database itself is unreachable the whole batch waits for the next flush. A
+session_id that is not in memory is loaded back with load_conversation on its
+first use.
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import OperationalError
+
+from config import (
+    TRANSCRIPT_FLUSH_INTERVAL_SECONDS,
+    TRANSCRIPT_FLUSH_BATCH,
+    TRANSCRIPT_MAX_BUFFER,
+)
+from database import ChatMessage, Conversation, SessionLocal, User, mark_write, read_session
+from services.history import Message
+from services.metrics import registry
+
+# Give up on a conversation's writes after this many failed flushes (e.g. a constraint violation)
+MAX_FLUSH_ATTEMPTS = 5
+
+transcript_flush_batch_size = registry.histogram(
+    "transcript_flush_batch_size", "Writes per transcript flush", buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+transcript_flush_lag_seconds = registry.histogram(
+    "transcript_flush_lag_seconds", "Time from queueing the oldest write of a batch to its commit"
+)
+transcript_flush_failures_total = registry.counter("transcript_flush_failures_total", "Failed transcript flushes")
+transcript_writes_dropped_total = registry.counter(
+    "transcript_writes_dropped_total", "Transcript writes discarded by reason", ("reason",)
+)
+
+
+def conversation_key(session_id: str) -> str:
+    return f"conversation:{session_id}"
+
+
+class TranscriptWriter:
+    """Write-behind buffer for conversation rows, messages and session state"""
+
+    def __init__(self, interval: float, batch_size: int, max_buffer: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        # (kind, payload, queued_at) in arrival order
+        self._buffer: List[Tuple[str, dict, float]] = []
+        # Failed flushes per conversation
+        self._attempts: Dict[str, int] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        return len(self._buffer)
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush task and write out everything still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    # ------------------------------------------------------------------------
+    # Queueing (event loop thread, no I/O)
+    # ------------------------------------------------------------------------
+
+    def _queue(self, kind: str, payload: dict):
+        if len(self._buffer) >= self.max_buffer:
+            transcript_writes_dropped_total.inc(1, "buffer_full")
+            return
+        self._buffer.append((kind, payload, time.monotonic()))
+        if len(self._buffer) >= self.batch_size and self._wake is not None:
+            self._wake.set()
+
+    def conversation_started(self, session_id: str, user_id: Optional[int]):
+        now = datetime.utcnow()
+        self._queue("conversation", {"id": session_id, "user_id": user_id, "created_at": now, "updated_at": now})
+
+    def message_appended(self, session_id: str, seq: int, message: Message):
+        self._queue("message", {
+            "conversation_id": session_id,
+            "seq": seq,
+            "role": message.role,
+            "content": message.content,
+            "tool_calls": [call.to_api() for call in message.tool_calls] if message.tool_calls else None,
+            "tool_call_id": message.tool_call_id,
+            "created_at": datetime.utcnow(),
+        })
+
+    def state_changed(self, session_id: str, **values):
+        self._queue("state", {"id": session_id, **values})
+
+    # ------------------------------------------------------------------------
+    # Flushing
+    # ------------------------------------------------------------------------
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write everything queued so far; safe to call at any time"""
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+            try:
+                failed = await asyncio.to_thread(_write_batch, batch)
+            except Exception as e:
+                # Database unreachable or locked: keep everything, in arrival order, for the next flush
+                transcript_flush_failures_total.inc()
+                print(f"DEBUG: Transcript flush failed, will retry: {e}")
+                self._buffer[:0] = batch
+                return
+
+            if failed:
+                transcript_flush_failures_total.inc()
+            retry = set()
+            for session_id, error in failed.items():
+                attempts = self._attempts[session_id] = self._attempts.get(session_id, 0) + 1
+                if attempts < MAX_FLUSH_ATTEMPTS:
+                    retry.add(session_id)
+                    print(f"DEBUG: Transcript writes for conversation {session_id} failed ({attempts}/{MAX_FLUSH_ATTEMPTS}), will retry: {error}")
+                    continue
+                dropped = sum(1 for entry in batch if _conversation_id(entry) == session_id)
+                print(f"ERROR: Dropping {dropped} transcript writes for conversation {session_id} after {attempts} failed flushes: {error}")
+                transcript_writes_dropped_total.inc(dropped, "flush_failed")
+                del self._attempts[session_id]
+            for session_id in {_conversation_id(entry) for entry in batch} - failed.keys():
+                self._attempts.pop(session_id, None)
+            # Keep arrival order so conversations are still inserted before their messages
+            retained = [entry for entry in batch if _conversation_id(entry) in retry]
+            self._buffer[:0] = retained
+
+            written = len(batch) - len(retained)
+            if written:
+                transcript_flush_batch_size.observe(written)
+                transcript_flush_lag_seconds.observe(time.monotonic() - batch[0][2])
+
+def _conversation_id(entry: Tuple[str, dict, float]) -> str:
+    kind, payload, _ = entry
+    return payload["conversation_id"] if kind == "message" else payload["id"]
+
+
+def _write_rows(db, batch: List[Tuple[str, dict, float]]):
+    """Insert conversations, then messages, then apply the latest state per conversation"""
+    conversations = [payload for kind, payload, _ in batch if kind == "conversation"]
+    messages = [payload for kind, payload, _ in batch if kind == "message"]
+    states: Dict[str, dict] = {}
+    for kind, payload, _ in batch:
+        if kind == "state":
+            states.setdefault(payload["id"], {}).update(payload)
+    now = datetime.utcnow()
+    for payload in messages:
+        states.setdefault(payload["conversation_id"], {"id": payload["conversation_id"]})
+
+    if conversations:
+        db.execute(insert(Conversation), conversations)
+    if messages:
+        db.execute(insert(ChatMessage), messages)
+    for session_id, values in states.items():
+        values = {key: value for key, value in values.items() if key != "id"}
+        db.execute(update(Conversation).where(Conversation.id == session_id).values(updated_at=now, **values))
+
+
+def _write_batch(batch: List[Tuple[str, dict, float]]) -> Dict[str, Exception]:
+    """
+    Write the batch in one transaction. If a row fails, write each conversation
+    under its own savepoint instead and return the conversations that failed;
+    the rest is committed. Connection and lock errors are raised.
+    """
+    failed: Dict[str, Exception] = {}
+    db = SessionLocal()
+    try:
+        try:
+            _write_rows(db, batch)
+        except OperationalError:
+            raise
+        except Exception:
+            db.rollback()
+            by_conversation: Dict[str, list] = {}
+            for entry in batch:
+                by_conversation.setdefault(_conversation_id(entry), []).append(entry)
+            for session_id, entries in by_conversation.items():
+                try:
+                    with db.begin_nested():
+                        _write_rows(db, entries)
+                except OperationalError:
+                    raise
+                except Exception as e:
+                    failed[session_id] = e
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    # Rehydration right after a flush must not read a lagging replica
+    mark_write(*(conversation_key(session_id) for session_id in {_conversation_id(entry) for entry in batch} - failed.keys()))
+    return failed
+
+
+def conversation_owner(session_id: str) -> Tuple[bool, Optional[int]]:
+    """(stored, user_id) of a conversation: one indexed lookup, no messages"""
+    db = read_session(conversation_key(session_id))
+    try:
+        row = db.query(Conversation.user_id).filter(Conversation.id == session_id).first()
+        return (True, row.user_id) if row else (False, None)
+    finally:
+        db.close()
+
+
+def load_conversation(session_id: str) -> Optional[dict]:
+    """Stored session: user fields, pending approval and history messages (None if unknown)"""
+    db = read_session(conversation_key(session_id))
+    try:
+        conversation = db.get(Conversation, session_id)
+        if conversation is None:
+            return None
+        user = db.get(User, conversation.user_id) if conversation.user_id else None
+        rows = (
+            db.query(ChatMessage.role, ChatMessage.content, ChatMessage.tool_calls, ChatMessage.tool_call_id)
+            .filter(ChatMessage.conversation_id == session_id)
+            .order_by(ChatMessage.seq)
+            .all()
+        )
+        return {
+            "user_id": conversation.user_id,
+            "user_name": user.name if user else None,
+            "user_email": user.email if user else None,
+            "pending_approval": conversation.pending_approval,
+            "messages": [
+                Message.from_api({"role": role, "content": content, "tool_calls": tool_calls, "tool_call_id": tool_call_id})
+                for role, content, tool_calls, tool_call_id in rows
+            ],
+        }
+    finally:
+        db.close()
+
+
+# Global transcript writer instance (started by api.py)
+transcript_writer = TranscriptWriter(TRANSCRIPT_FLUSH_INTERVAL_SECONDS, TRANSCRIPT_FLUSH_BATCH, TRANSCRIPT_MAX_BUFFER)
+
+registry.gauge(
+    "transcript_buffer_depth", "Transcript writes waiting to be flushed", callback=lambda: {(): transcript_writer.depth}
+)
@@ -32,6 +32,7 @@ trap cleanup SIGINT SIGTERM
 # Start Backend
 echo "🚀 Starting backend server..."
 cd server
+python migrate.py
 python api.py &
 BACKEND_PID=$!
 cd ..